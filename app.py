@@ -1,78 +1,190 @@
 # app.py
 import os
+import asyncio
+import time
 import uvicorn
 import json
-import pandas as pd
-from fastapi import FastAPI, Request, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
-# Pastikan folder temp_uploads sudah ada sebelum dipasang sebagai static files
-os.makedirs("temp_uploads", exist_ok=True)
+# File upload: streaming ke disk dengan batas ukuran, nama = SHA-256 isi,
+# disapu berkala menurut umur / total ukuran (UPLOAD_* di upload_store)
+from upload_store import UPLOAD_DIR, UploadSweeper, UploadTooLargeError, max_upload_bytes, save_upload
 
-# Fungsi inference
-from single_inference import process_single_ticket
-from multi_inference import process_multi_ticket
+# Pastikan folder upload sudah ada sebelum dipasang sebagai static files
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Muat CSV stasiun untuk validasi
-STATIONS_CSV = "stations_database_modified.csv"
-df_stations = pd.read_csv(STATIONS_CSV)
+# Antrian job + worker model (single + multi inference dalam satu pass)
+from model_loader import current_backend
+from job_queue import FINISHED, QueueFullError
+from job_worker import (
+    INFERENCE_WORKERS, JOB_POLL_MS, JobWorker, build_job_queue, build_result_cache, build_scheduler,
+    build_ticket_store, warmup as warmup_worker,
+)
+from stations_data import get_station_index, reload as reload_stations
+import telemetry
+
+# Logging terstruktur: LOG_LEVEL (INFO; WARNING mematikan log per-upload, DEBUG
+# menambah teks mentah model + durasi per tahap), LOG_FORMAT json/text.
+# TRACE_IDS=1 memberi setiap request trace ID (header X-Request-ID) di log.
+telemetry.configure_logging()
+
+# Muat model sekali saat startup (set WARMUP_MODEL=0 untuk lazy load saat request pertama)
+WARMUP_MODEL = os.getenv("WARMUP_MODEL", "1") == "1"
+
+# /upload/ menyimpan file lalu enqueue job; worker model mengambil job dari antrian.
+# INPROCESS_WORKER=1: proses ini juga worker model (antrian di memori kecuali
+# JOB_QUEUE_PATH diset). INPROCESS_WORKER=0: proses web saja, model di
+# `python job_worker.py` yang berbagi antrian SQLite JOB_QUEUE_PATH.
+INPROCESS_WORKER = os.getenv("INPROCESS_WORKER", "1") == "1"
+job_queue = build_job_queue()
+if not INPROCESS_WORKER and not job_queue.shared:
+    raise RuntimeError("INPROCESS_WORKER=0 butuh JOB_QUEUE_PATH (antrian SQLite bersama worker model).")
+
+# Hasil tiket: JSONL append-only + index kunci di json_outputs/ (ditulis worker model).
+# tickets_data.json lama diimpor sekali dan bisa diekspor lewat GET /tickets/export.
+ticket_store = build_ticket_store()
+
+# Worker model di proses ini: dynamic batching (scheduler) + result cache
+scheduler = result_cache = worker = None
+if INPROCESS_WORKER:
+    scheduler = build_scheduler()
+    result_cache = build_result_cache()
+    worker = JobWorker(job_queue, scheduler, result_cache, ticket_store, concurrency=INFERENCE_WORKERS)
+
+# Hapus upload lama di latar (setiap proses web; penghapusan ganda aman)
+sweeper = UploadSweeper()
+
+# Angka antrian/batching/cache/upload ikut diekspor sebagai gauge di GET /metrics
+telemetry.register_collector("ticket_uploads", sweeper.metrics)
+telemetry.register_collector("ticket_jobs", job_queue.metrics)
+if worker is not None:
+    telemetry.register_collector("ticket_job_worker", worker.metrics)
+    telemetry.register_collector("ticket_batching", scheduler.metrics)
+    telemetry.register_collector("ticket_result_cache", result_cache.metrics)
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
-app.mount("/temp_uploads", StaticFiles(directory="temp_uploads"), name="temp_uploads")
+app.mount("/temp_uploads", StaticFiles(directory=UPLOAD_DIR), name="temp_uploads")
 
 
-def is_valid_ticket(ticket: dict) -> bool:
+async def enqueue_upload(saved, kind: str) -> str:
     """
-    Memeriksa apakah ticket memiliki informasi yang lengkap dan valid.
-    Validasi:
-      - departure_station harus cocok dengan salah satu nilai di startStaName atau startStaEName.
-      - arrival_station harus cocok dengan salah satu nilai di endStaName atau endStaEName.
-      - Juga harus memiliki nilai untuk date.
+    Enqueue job untuk file tersimpan (tulis SQLite di thread); return id job.
+    Backpressure dari kedalaman antrian: QueueFullError => 503 + Retry-After.
     """
-    if not ticket or not isinstance(ticket, dict):
-        return False
+    return await asyncio.to_thread(job_queue.enqueue, kind, saved.path, saved.url, trace_id=telemetry.get_trace_id(),
+                                   image_sha=saved.sha256, data=saved.data)
 
-    dep = ticket.get("departure_station", "").strip()
-    arr = ticket.get("arrival_station", "").strip()
-    date = ticket.get("date", "").strip()
 
-    if not dep or not arr or not date:
-        return False
+async def wait_for_job(job_id: str) -> dict:
+    """Tunggu sampai job selesai (done / error), polling antrian setiap JOB_POLL_MS."""
+    while True:
+        job = await asyncio.to_thread(job_queue.get, job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        await asyncio.sleep(JOB_POLL_MS / 1000.0)
 
-    dep_lower = dep.lower()
-    arr_lower = arr.lower()
 
-    # Validasi departure_station dari dua kolom: startStaName atau startStaEName
-    dep_valid = (
-        df_stations["startStaName"].str.strip().str.lower().eq(dep_lower).any() or
-        df_stations["startStaEName"].str.strip().str.lower().eq(dep_lower).any()
-    )
-    # Validasi arrival_station dari dua kolom: endStaName atau endStaEName
-    arr_valid = (
-        df_stations["endStaName"].str.strip().str.lower().eq(arr_lower).any() or
-        df_stations["endStaEName"].str.strip().str.lower().eq(arr_lower).any()
-    )
+async def job_events(job_id: str):
+    """Generator (event, data) untuk job sampai event "done" / "error"."""
+    seq = 0
+    while True:
+        events = await asyncio.to_thread(job_queue.events, job_id, seq)
+        for seq, event, data in events:
+            yield event, data
+            if event in FINISHED:
+                return
+        if not events and await asyncio.to_thread(job_queue.get, job_id) is None:
+            yield "error", {"detail": "Job tidak ditemukan."}
+            return
+        await asyncio.sleep(JOB_POLL_MS / 1000.0)
 
-    return dep_valid and arr_valid
 
+def job_links(job_id: str) -> dict:
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+
+def wants_json(request: Request) -> bool:
+    """True jika header Accept meminta JSON dan bukan HTML (mis. skrip / load test)."""
+    accept = request.headers.get("accept", "")
+    return "application/json" in accept and "text/html" not in accept
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-def cleanup_stations_inplace(ticket: dict):
-    """
-    (Opsional) Membersihkan stasiun palsu.
-    Misalnya, jika stasiun mengandung 'Exp', kosongkan nilainya.
-    """
-    if not ticket or not isinstance(ticket, dict):
-        return
 
-    dep = ticket.get("departure_station", "")
-    arr = ticket.get("arrival_station", "")
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Trace ID per request (X-Request-ID masuk/keluar) + histogram durasi per route."""
+    token = None
+    trace_id = None
+    if telemetry.TRACE_IDS:
+        trace_id = request.headers.get("x-request-id") or telemetry.new_trace_id()
+        token = telemetry.set_trace_id(trace_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        # Template route (mis. /upload/) agar label tidak meledak per path
+        route = request.scope.get("route")
+        telemetry.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), status
+        )
+        if token is not None:
+            telemetry.reset_trace_id(token)
+    if trace_id is not None:
+        response.headers["X-Request-ID"] = trace_id
+    return response
 
-    if "Exp" in dep:
-        ticket["departure_station"] = ""
-    if "Exp" in arr:
-        ticket["arrival_station"] = ""
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Tolak upload dengan Content-Length di atas batas sebelum body dibaca (413)."""
+    if request.method == "POST" and request.url.path.startswith("/upload"):
+        length = request.headers.get("content-length")
+        # Sedikit kelonggaran untuk header multipart di sekitar file
+        if length and length.isdigit() and int(length) > max_upload_bytes() + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": str(UploadTooLargeError(max_upload_bytes()))})
+    return await call_next(request)
+
+
+@app.on_event("startup")
+def load_model_on_startup():
+    if worker is not None:
+        # Data stasiun dimuat (atau dibaca dari cache) sebelum job pertama
+        get_station_index()
+        if WARMUP_MODEL:
+            # Model + token index grammar JSON + KV awalan prompt sebelum job pertama
+            warmup_worker()
+        worker.start()
+    sweeper.start()
+
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    sweeper.stop()
+    if worker is not None:
+        worker.stop()
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after_s)},
+    )
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large_handler(request: Request, exc: UploadTooLargeError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
 
 
 @app.get("/")
@@ -80,90 +192,83 @@ def home(request: Request):
     return templates.TemplateResponse("home.html", {"request": request})
 
 
+@app.get("/health")
+async def health():
+    # Tidak menyentuh model, jadi tetap cepat walau inference penuh
+    return {"status": "ok", "backend": current_backend(), "jobs": await asyncio.to_thread(job_queue.metrics)}
+
+
+@app.post("/stations/reload")
+def reload_station_data(force: bool = False):
+    # Muat ulang CSV stasiun tanpa restart (hanya jika berubah, kecuali force)
+    reloaded = reload_stations(force=force)
+    return {"reloaded": reloaded, "routes": get_station_index().route_count}
+
+
+@app.get("/tickets/export")
+def export_tickets():
+    # Semua tiket dalam format tickets_data.json lama (array JSON)
+    return ticket_store.all()
+
+
+@app.get("/stats/batching")
+def batching_stats():
+    # Hanya proses dengan worker model (INPROCESS_WORKER=1)
+    return scheduler.metrics() if scheduler is not None else {}
+
+
+@app.get("/stats/cache")
+def cache_stats():
+    return result_cache.metrics() if result_cache is not None else {}
+
+
+@app.get("/stats/jobs")
+def job_stats():
+    stats = job_queue.metrics()
+    if worker is not None:
+        stats["worker"] = worker.metrics()
+    return stats
+
+
+@app.get("/metrics")
+def metrics():
+    # Format teks Prometheus: histogram per tahap, HTTP, token generate + gauge antrian/batching/cache
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/upload/")
-async def upload_file(request: Request, file: UploadFile = File(...)):
+async def upload_file(request: Request, file: UploadFile = File(...), wait: bool = False):
     """
-    1) Terima file dan simpan.
-    2) Jalankan SINGLE inference dan MULTI inference secara independen.
-    3) Tentukan hasil final:
+    1) Terima file, simpan, dan masukkan job ke antrian.
+    2) Worker model menjalankan SINGLE dan MULTI inference dalam satu batch generate.
+    3) Worker menentukan hasil final:
          - Jika multi_inference menghasilkan > 1 tiket, gunakan multi_data.
          - Jika hanya 1 tiket dan ticket valid (berdasarkan CSV), gunakan single_data.
          - Jika ticket tidak valid (departure atau arrival tidak match CSV), paksa gunakan hasil single_inference.
     4) (Opsional) Bersihkan stasiun palsu.
     5) Simpan JSON tanpa duplikasi.
-    6) Tampilkan di output.html.
+    6) Klien API (Accept: application/json) langsung mendapat 202 {"job_id", "status_url", "events_url"};
+       dengan ?wait=true, atau dari form HTML, tunggu hasil lalu tampilkan di output.html
+       (atau JSON {"tickets", "image_url"}).
     """
-    # 1) Simpan file upload
-    upload_dir = "temp_uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, file.filename)
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-
-    # 2) SINGLE inference
-    parsed_single = process_single_ticket(file_path)
-    if isinstance(parsed_single, dict):
-        single_data = [parsed_single]
-    else:
-        single_data = parsed_single
-
-    # 3) MULTI inference
-    parsed_multi = process_multi_ticket(file_path)
-    if isinstance(parsed_multi, dict):
-        multi_data = [parsed_multi]
-    else:
-        multi_data = parsed_multi
-
-    # 4) Tentukan hasil final
-    if len(multi_data) > 1:
-        final_data = multi_data
-        print("Menggunakan hasil dari multi_inference (lebih dari satu tiket terdeteksi).")
-    else:
-        if len(single_data) == 1 and is_valid_ticket(single_data[0]):
-            final_data = single_data
-            print("Menggunakan hasil dari single_inference (ticket valid).")
-        else:
-            final_data = multi_data
-            print("Menggunakan hasil dari multi_inference sebagai fallback (single_inference tidak valid).")
-
-    # 5) Jika salah satu dari departure_station atau arrival_station tidak match CSV,
-    #    paksa gunakan hasil single_inference.
-    if final_data:
-        ticket0 = final_data[0]
-        if not is_valid_ticket(ticket0):
-            print("Ticket tidak valid menurut CSV, memaksa penggunaan hasil single_inference.")
-            forced_single = process_single_ticket(file_path)
-            if isinstance(forced_single, dict):
-                final_data = [forced_single]
-            else:
-                final_data = forced_single
-
-    # 6) (Opsional) Bersihkan stasiun palsu
-    for t in final_data:
-        cleanup_stations_inplace(t)
-
-    # 7) Simpan hasil ke JSON tanpa duplikasi
-    if isinstance(final_data, dict):
-        final_data = [final_data]
-    output_dir = "json_outputs"
-    os.makedirs(output_dir, exist_ok=True)
-    data_file = os.path.join(output_dir, "tickets_data.json")
-    if os.path.exists(data_file):
-        with open(data_file, "r", encoding="utf-8") as f:
-            try:
-                existing_data = json.load(f)
-            except json.JSONDecodeError:
-                existing_data = []
-    else:
-        existing_data = []
-    for ticket in final_data:
-        if ticket not in existing_data:
-            existing_data.append(ticket)
-    with open(data_file, "w", encoding="utf-8") as f:
-        json.dump(existing_data, f, ensure_ascii=False, indent=2)
-
-    # 8) Tampilkan di output.html
-    image_url = f"/temp_uploads/{file.filename}"
+    # 1) Terima file: disalin per potongan ke UPLOAD_DIR (413 jika melewati UPLOAD_MAX_MB),
+    #    lalu enqueue. Jika sudah JOB_MAX_QUEUED job menunggu => 503 + Retry-After.
+    saved = await save_upload(file)
+    image_url = saved.url
+    job_id = await enqueue_upload(saved, "upload")
+    api_client = wants_json(request)
+    if api_client and not wait:
+        return JSONResponse(status_code=202, content={**job_links(job_id), "image_url": image_url})
+
+    # 2) - 5) dijalankan worker model; tunggu hasilnya
+    job = await wait_for_job(job_id)
+    if job is None or job["status"] == "error":
+        raise HTTPException(status_code=500, detail=job["error"] if job else "Job tidak ditemukan.")
+    final_data = job["result"]
+
+    # 6) Tampilkan di output.html; klien API mendapat JSON
+    if api_client:
+        return {"tickets": final_data, "image_url": image_url, "job_id": job_id}
     return templates.TemplateResponse("output.html", {
         "request": request,
         "tickets": final_data,
@@ -171,5 +276,66 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
     })
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status job: queued / running / done (+ tickets) / error (+ detail)."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job tidak ditemukan.")
+    status = {"job_id": job_id, "status": job["status"], "image_url": job["image_url"]}
+    if job["status"] == "done":
+        status["tickets"] = job["result"]
+    elif job["status"] == "error":
+        status["detail"] = job["error"]
+    return status
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_event_stream(job_id: str):
+    """
+    Server-sent events untuk job:
+      event: ticket  -> satu tiket (hasil multi sementara, hanya job dari /upload/stream)
+      event: done    -> {"tickets": [...]} hasil final
+      event: error   -> {"detail": "..."}
+    """
+    async def event_stream():
+        async for event, data in job_events(job_id):
+            yield format_sse(event, data)
+
+    return sse_response(event_stream())
+
+
+@app.post("/upload/stream")
+async def upload_file_stream(file: UploadFile = File(...)):
+    """
+    Seperti /upload/, tetapi hasil dikirim sebagai server-sent events:
+      event: upload  -> {"job_id", "image_url", ...}
+      event: ticket  -> satu tiket (hasil multi sementara) begitu objek JSON-nya lengkap
+      event: done    -> {"tickets": [...]} hasil final setelah pemilihan single/multi
+      event: error   -> {"detail": "..."}
+    """
+    saved = await save_upload(file)
+    image_url = saved.url
+
+    # Enqueue sebelum stream dimulai agar upload terlalu besar => 413, antrian penuh => 503
+    job_id = await enqueue_upload(saved, "stream")
+
+    async def event_stream():
+        yield format_sse("upload", {**job_links(job_id), "image_url": image_url})
+        async for event, data in job_events(job_id):
+            yield format_sse(event, data)
+
+    return sse_response(event_stream())
+
+
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    # RELOAD=1 hanya untuk pengembangan; banyak proses: python job_worker.py --web
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=os.getenv("RELOAD", "0") == "1")
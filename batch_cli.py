@@ -0,0 +1,212 @@
+# batch_cli.py
+"""
+Proses offline satu folder (atau manifest) gambar tiket tanpa HTTP.
+
+    python batch_cli.py results/ -o batch_results.jsonl
+    python batch_cli.py manifest.txt --batch-size 8 --decode-workers 8
+    python batch_cli.py results/ --stub            # CPU, model tiruan (stub_model)
+
+Pipeline:
+  1) decode + preprocessing gambar di thread pool (prefetch terbatas) selagi model berjalan
+  2) setiap --batch-size gambar => satu generate (prompt single + multi per gambar)
+  3) pilih hasil final seperti /upload/, tulis satu baris JSONL per gambar
+
+File output sekaligus checkpoint: gambar yang sudah tercatat tanpa error
+dilewati saat perintah dijalankan ulang setelah crash.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from image_preprocess import load_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def iter_image_paths(source: str):
+    """Folder => semua gambar di dalamnya (urut nama, rekursif); file => manifest."""
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+        return
+
+    # Manifest: satu path per baris, atau JSONL dengan field "path"/"image"
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                line = entry.get("path") or entry.get("image")
+            yield line if os.path.isabs(line) else os.path.join(base_dir, line)
+
+
+def load_checkpoint(output_path: str) -> set:
+    """Path gambar yang sudah sukses diproses di output sebelumnya."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb") as f:
+        data = f.read()
+    # Crash di tengah penulisan: pastikan baris berikutnya mulai di baris baru
+    if data and not data.endswith(b"\n"):
+        with open(output_path, "ab") as f:
+            f.write(b"\n")
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "error" not in record:
+            done.add(record.get("image"))
+    return done
+
+
+def decode_image(path: str):
+    """Dijalankan di thread pool: decode + preprocessing (EXIF, crop, resize, RGB)."""
+    return load_image(path)
+
+
+class Throughput:
+    def __init__(self, report_every_s: float = 10.0):
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.report_every_s = report_every_s
+        self.images = 0
+        self.errors = 0
+
+    def add(self, images: int, errors: int = 0):
+        self.images += images
+        self.errors += errors
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_every_s:
+            self.last_report = now
+            self.report()
+
+    def report(self, final: bool = False):
+        elapsed = time.perf_counter() - self.start
+        rate = self.images / elapsed if elapsed > 0 else 0.0
+        label = "Selesai" if final else "Progres"
+        print(f"{label}: {self.images} gambar ({self.errors} error) dalam {elapsed:.1f}s, "
+              f"{rate:.2f} images/s", file=sys.stderr, flush=True)
+
+
+def run(paths, output_path: str, batch_size: int = 4, decode_workers: int = 4, prefetch: int = None,
+        store=None, report_every_s: float = 10.0) -> Throughput:
+    """
+    Proses `paths` dan append hasil ke `output_path` (JSONL).
+    `store` (TicketStore, opsional) ikut menerima tiket final.
+    """
+    # Import di sini agar --stub bisa mengganti loader sebelum model dipakai
+    from combined_inference import process_images
+    from ticket_selection import select_final_data, cleanup_stations_inplace
+
+    done = load_checkpoint(output_path)
+    prefetch = prefetch or batch_size * 4
+    stats = Throughput(report_every_s)
+    skipped = 0
+
+    with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode") as decoder, \
+            open(output_path, "a", encoding="utf-8") as out:
+        pending = deque()
+        path_iter = iter(paths)
+
+        def fill():
+            nonlocal skipped
+            while len(pending) < prefetch:
+                path = next(path_iter, None)
+                if path is None:
+                    return
+                if path in done:
+                    skipped += 1
+                    continue
+                pending.append((path, decoder.submit(decode_image, path)))
+
+        def write(record: dict):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        fill()
+        while pending:
+            batch, errors = [], 0
+            while pending and len(batch) < batch_size:
+                path, future = pending.popleft()
+                try:
+                    batch.append((path, future.result()))
+                except Exception as exc:
+                    write({"image": path, "error": f"decode: {exc}"})
+                    errors += 1
+            # Isi ulang antrian decode sebelum generate agar decoder tetap bekerja
+            fill()
+            if batch:
+                started = time.perf_counter()
+                try:
+                    results = process_images([image for _, image in batch])
+                except Exception as exc:
+                    for path, _ in batch:
+                        write({"image": path, "error": f"inference: {exc}"})
+                    errors += len(batch)
+                    results = []
+                elapsed_ms = 1000 * (time.perf_counter() - started) / max(len(batch), 1)
+                for (path, _), (single_data, multi_data) in zip(batch, results):
+                    final_data = select_final_data(single_data, multi_data)
+                    for ticket in final_data:
+                        cleanup_stations_inplace(ticket)
+                    if store is not None:
+                        store.add(final_data)
+                    write({"image": path, "tickets": final_data, "ms_per_image": round(elapsed_ms, 1)})
+            out.flush()
+            os.fsync(out.fileno())
+            stats.add(len(batch), errors)
+
+    if skipped:
+        print(f"{skipped} gambar dilewati (sudah ada di checkpoint).", file=sys.stderr)
+    stats.report(final=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="folder gambar atau file manifest")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl")
+    parser.add_argument("--batch-size", type=int, default=4, help="gambar per generate")
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--prefetch", type=int, default=None, help="gambar yang di-decode di depan (default 4x batch)")
+    parser.add_argument("--limit", type=int, default=None, help="proses paling banyak N gambar")
+    parser.add_argument("--store", action="store_true", help="simpan juga ke ticket store (json_outputs/)")
+    parser.add_argument("--stub", action="store_true", help="pakai stub_model (CPU, tanpa bobot model)")
+    args = parser.parse_args()
+
+    # stdout bebas untuk hasil; log (LOG_LEVEL / LOG_FORMAT) ke stderr
+    import telemetry
+    telemetry.configure_logging(stream=sys.stderr)
+
+    if args.stub:
+        import model_loader
+        import stub_model
+        model_loader.set_loader(stub_model.load_stub_model)
+
+    paths = iter_image_paths(args.source)
+    if args.limit is not None:
+        paths = itertools.islice(paths, args.limit)
+
+    store = None
+    if args.store:
+        from ticket_store import TicketStore
+        store = TicketStore()
+
+    run(paths, args.output, batch_size=args.batch_size, decode_workers=args.decode_workers,
+        prefetch=args.prefetch, store=store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# batch_scheduler.py
+"""
+Dynamic batching di depan generate_texts.
+
+Request (image, prompt) dari banyak upload dikumpulkan selama `max_wait_ms`
+(atau sampai `max_batch_size`), lalu dijalankan sebagai satu batch
+processor(...) / model.generate. Setiap pemanggil menerima potongan hasilnya
+sendiri lewat Future. Request streaming (on_text) ikut batch yang sama;
+teks barunya dikirim per langkah decode dari thread scheduler.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from inference_core import generate_texts
+from telemetry import get_trace_id, observe_stage, reset_trace_id, set_trace_id
+
+
+@dataclass
+class GenerationRequest:
+    image: object
+    prompt: str
+    max_new_tokens: int
+    on_text: object = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    trace_id: str = field(default_factory=get_trace_id)
+
+
+class BatchStats:
+    """Counter sederhana untuk queue depth, ukuran batch dan waktu tunggu."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.batch_size_counts = {}
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.max_queue_depth = 0
+
+    def record_enqueue(self, depth: int):
+        with self._lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_batch(self, size: int, waits: list):
+        with self._lock:
+            self.batches += 1
+            self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+            self.total_wait_s += sum(waits)
+            self.max_wait_s = max([self.max_wait_s] + waits)
+
+    def snapshot(self, queue_depth: int) -> dict:
+        with self._lock:
+            processed = sum(size * n for size, n in self.batch_size_counts.items())
+            return {
+                "queue_depth": queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_size": processed / self.batches if self.batches else 0.0,
+                "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+                "avg_wait_ms": 1000 * self.total_wait_s / processed if processed else 0.0,
+                "max_wait_ms": 1000 * self.max_wait_s,
+            }
+
+
+class BatchScheduler:
+    """
+    Antrian + satu thread worker yang memanggil `generate_fn` per batch.
+    `generate_fn` harus punya signature seperti inference_core.generate_texts
+    (on_text hanya diteruskan jika ada request streaming di batch).
+    """
+
+    def __init__(self, generate_fn=generate_texts, max_batch_size: int = 8, max_wait_ms: float = 20.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size minimal 1.")
+        self.generate_fn = generate_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.stats = BatchStats()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # -- submit ------------------------------------------------------------
+    def submit(self, image, prompt: str, max_new_tokens: int, on_text=None) -> Future:
+        if not self._running:
+            raise RuntimeError("BatchScheduler belum di-start.")
+        request = GenerationRequest(image=image, prompt=prompt, max_new_tokens=max_new_tokens, on_text=on_text)
+        self._queue.put(request)
+        self.stats.record_enqueue(self._queue.qsize())
+        return request.future
+
+    def generate(self, images: list, prompts: list, max_new_tokens, on_text: list = None) -> list:
+        """
+        Pengganti blocking untuk generate_texts: semua pasangan masuk antrian
+        (dan bisa tergabung dengan request lain), lalu tunggu hasilnya.
+        """
+        if isinstance(max_new_tokens, int):
+            max_new_tokens = [max_new_tokens] * len(prompts)
+        on_text = on_text or [None] * len(prompts)
+        futures = [
+            self.submit(image, prompt, limit, callback)
+            for image, prompt, limit, callback in zip(images, prompts, max_new_tokens, on_text)
+        ]
+        return [f.result() for f in futures]
+
+    def metrics(self) -> dict:
+        return self.stats.snapshot(self._queue.qsize())
+
+    # -- worker ------------------------------------------------------------
+    def _collect_batch(self, first: GenerationRequest) -> list:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Sinyal stop: kembalikan agar loop utama berhenti setelah batch ini
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect_batch(first)
+            started = time.perf_counter()
+            waits = [started - r.enqueued_at for r in batch]
+            self.stats.record_batch(len(batch), waits)
+            for wait in waits:
+                observe_stage("batch_wait", wait)
+            # Log tahap di dalam batch membawa trace ID semua request yang tergabung
+            token = set_trace_id(",".join(dict.fromkeys(r.trace_id for r in batch)))
+            streaming = {}
+            if any(r.on_text for r in batch):
+                streaming["on_text"] = [r.on_text for r in batch]
+            try:
+                outputs = self.generate_fn(
+                    [r.image for r in batch],
+                    [r.prompt for r in batch],
+                    [r.max_new_tokens for r in batch],
+                    **streaming,
+                )
+            except Exception as exc:
+                for r in batch:
+                    r.future.set_exception(exc)
+                continue
+            finally:
+                reset_trace_id(token)
+            for r, text in zip(batch, outputs):
+                r.future.set_result(text)
+
+        # Gagalkan request yang tersisa saat stop
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item.future.set_exception(RuntimeError("BatchScheduler dihentikan."))
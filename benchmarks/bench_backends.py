@@ -0,0 +1,156 @@
+# benchmarks/bench_backends.py
+"""
+Bandingkan backend model (model_loader.select_backend) atas foto berlabel di
+results/: waktu muat, prefill, tokens/detik decode, latensi per foto dan
+akurasi per field prompt multi. Dipakai untuk menakar kapasitas node CPU
+dibanding GPU.
+
+Backend ditulis "<device>-<dtype>[-int8][-compile]" (lihat Backend.name):
+    python benchmarks/bench_backends.py --backends cuda-float16,cpu-bfloat16,cpu-float32-int8
+    python benchmarks/bench_backends.py --backends cpu-float32,cpu-float32-compile --threads 8 --images 5
+    python benchmarks/bench_backends.py --model /path/qwen --backends cpu-auto --json cpu.json
+
+Setiap backend memuat model baru (unload_model di antaranya) dan menjalankan
+--warmup foto pertama tanpa diukur (torch.compile, alokasi). tokens/detik
+diambil dari histogram ticket_decode_tokens_per_second{backend}, jadi sama
+dengan yang terlihat di /metrics produksi. Akurasi butuh data stasiun
+(STATIONS_CSV / --csv); tanpa itu hanya throughput.
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from golden import (  # noqa: E402
+    IMAGES_DIR, AccuracyTally, git_commit, latency_summary, load_labels, write_summary,
+)
+
+
+def parse_backend(spec: str) -> dict:
+    """"cpu-float32-int8-compile" => kwargs load_model (device, dtype, quantize, compile)."""
+    parts = spec.strip().split("-")
+    options = parts[2:]
+    unknown = set(options) - {"int8", "compile"}
+    if unknown:
+        raise ValueError(f"opsi backend tidak dikenal di {spec!r}: {sorted(unknown)}")
+    return {
+        "device": parts[0],
+        "dtype": parts[1] if len(parts) > 1 else "auto",
+        "quantize": "int8" if "int8" in options else "none",
+        "compile": "compile" in options,
+    }
+
+
+def run_backend(spec: str, names: list, labels: dict, args, have_stations: bool) -> dict:
+    import torch
+
+    import model_loader
+    from image_preprocess import load_image
+    from inference_core import generate_texts
+    from multi_inference import MULTI_PROMPT, estimate_budget
+    from telemetry import DECODE_TOKENS_PER_SECOND, GENERATED_TOKENS, STAGE_SECONDS
+
+    model_loader.set_loader(model_loader.load_model, model_name=args.model, threads=args.threads,
+                            **parse_backend(spec))
+    start = time.perf_counter()
+    model, _, _ = model_loader.warmup()
+    load_s = time.perf_counter() - start
+    backend = model_loader.backend_name(model)
+
+    images = [(name, load_image(os.path.join(IMAGES_DIR, name))) for name in names]
+    for _, image in images[:args.warmup]:
+        generate_texts([image], [MULTI_PROMPT], estimate_budget(image))
+
+    tps_before = DECODE_TOKENS_PER_SECOND.totals(backend)
+    prefill_before = STAGE_SECONDS.totals("prefill")
+    tokens_before = GENERATED_TOKENS.value()
+    latencies, tally = [], AccuracyTally()
+    for name, image in images:
+        start = time.perf_counter()
+        raw = generate_texts([image], [MULTI_PROMPT], estimate_budget(image))[0]
+        latencies.append(time.perf_counter() - start)
+        if have_stations:
+            from parse_ticket import parse_multi_ticket_json
+            tally.add(parse_multi_ticket_json(raw), labels[name])
+    tps_sum, tps_count = (a - b for a, b in zip(DECODE_TOKENS_PER_SECOND.totals(backend), tps_before))
+    prefill_sum, prefill_count = (a - b for a, b in zip(STAGE_SECONDS.totals("prefill"), prefill_before))
+    tokens = GENERATED_TOKENS.value() - tokens_before
+
+    result = {
+        "backend": backend,
+        "threads": torch.get_num_threads() if backend.startswith("cpu") else None,
+        "load_s": round(load_s, 2),
+        "images": len(images),
+        "tokens": tokens,
+        "decode_tokens_per_s": round(tps_sum / tps_count, 2) if tps_count else None,
+        "prefill_ms": round(1000 * prefill_sum / prefill_count, 1) if prefill_count else None,
+        "images_per_s": round(len(images) / sum(latencies), 3) if latencies else None,
+        "latency": latency_summary(latencies),
+    }
+    if have_stations:
+        result["accuracy"] = tally.summary()
+    model_loader.unload_model()
+    del model
+    gc.collect()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="cpu-auto", help="daftar backend dipisah koma")
+    parser.add_argument("--model", help="nama / path model (default model_loader.DEFAULT_MODEL_NAME)")
+    parser.add_argument("--images", type=int, default=0, help="jumlah foto berlabel (0 = semua)")
+    parser.add_argument("--warmup", type=int, default=1, help="foto pemanasan per backend (tidak diukur)")
+    parser.add_argument("--threads", type=int, help="thread CPU (default TORCH_THREADS)")
+    parser.add_argument("--csv", help="CSV stasiun (default STATIONS_CSV)")
+    parser.add_argument("--json", help="tulis ringkasan ke file JSON")
+    args = parser.parse_args()
+
+    if args.csv:
+        os.environ["STATIONS_CSV"] = args.csv
+    # Import setelah STATIONS_CSV diset
+    import model_loader
+    from stations_data import get_station_index
+
+    args.model = args.model or model_loader.DEFAULT_MODEL_NAME
+    labels = load_labels()
+    names = sorted(labels)[:args.images or None]
+    try:
+        get_station_index()
+        have_stations = True
+    except (OSError, ValueError) as exc:
+        print(f"Data stasiun tidak tersedia ({exc}); akurasi dilewati.")
+        have_stations = False
+
+    # Log INFO per generate tidak perlu dicetak
+    logging.disable(logging.INFO)
+    results = []
+    for spec in args.backends.split(","):
+        print(f"backend {spec} ...", flush=True)
+        results.append(run_backend(spec, names, labels, args, have_stations))
+    logging.disable(logging.NOTSET)
+
+    print(f"\n{args.model}, {len(names)} foto")
+    print(f"{'backend':<26}{'muat s':>8}{'prefill ms':>12}{'token/s':>10}{'foto/s':>9}{'p50 ms':>10}"
+          f"{'akurasi':>10}")
+    for row in results:
+        accuracy = row.get("accuracy", {}).get("field_accuracy")
+        accuracy_text = f"{accuracy:.1%}" if accuracy is not None else "-"
+        tps = row["decode_tokens_per_s"]
+        prefill = row["prefill_ms"]
+        print(f"{row['backend']:<26}{row['load_s']:>8.1f}{prefill if prefill is not None else '-':>12}"
+              f"{tps if tps is not None else '-':>10}{row['images_per_s']:>9.3f}{row['latency']['p50_ms']:>10.0f}"
+              f"{accuracy_text:>10}")
+
+    if args.json:
+        write_summary(args.json, {"benchmark": "backends", "commit": git_commit(), "model": args.model,
+                                  "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/bench_image_preprocess.py
+"""
+Bandingkan ukuran input processor (token visual Qwen2.5-VL) sebelum dan sesudah
+image_preprocess, untuk sampel di results/*.jpeg.
+
+    python benchmarks/bench_image_preprocess.py
+    python benchmarks/bench_image_preprocess.py --max-pixels 602112 --no-crop
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_preprocess import IMAGE_MAX_PIXELS, IMAGE_MIN_PIXELS, preprocess_image  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pattern", default=os.path.join(ROOT, "results", "*.jpeg"))
+    parser.add_argument("--min-pixels", type=int, default=IMAGE_MIN_PIXELS)
+    parser.add_argument("--max-pixels", type=int, default=IMAGE_MAX_PIXELS)
+    parser.add_argument("--no-crop", action="store_true")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.pattern))
+    if not paths:
+        sys.exit(f"Tidak ada file untuk pola {args.pattern}")
+
+    print(f"{'file':<18}{'asli':>12}{'token':>8}{'sesudah':>12}{'token':>8}{'crop':>6}{'ms':>8}")
+    total_before = total_after = total_ms = 0.0
+    for path in paths:
+        with Image.open(path) as image:
+            start = time.perf_counter()
+            _, info = preprocess_image(
+                image, min_pixels=args.min_pixels, max_pixels=args.max_pixels, auto_crop=not args.no_crop
+            )
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+        total_before += info["tokens_before"]
+        total_after += info["tokens_after"]
+        total_ms += elapsed_ms
+        w0, h0 = info["original_size"]
+        w1, h1 = info["size"]
+        print(f"{os.path.basename(path):<18}{f'{w0}x{h0}':>12}{info['tokens_before']:>8}"
+              f"{f'{w1}x{h1}':>12}{info['tokens_after']:>8}{'ya' if info['cropped'] else '-':>6}{elapsed_ms:>8.1f}")
+
+    n = len(paths)
+    print(f"\nrata-rata token visual: {total_before / n:.0f} -> {total_after / n:.0f} "
+          f"({100 * (1 - total_after / total_before):.0f}% lebih sedikit), "
+          f"preprocessing {total_ms / n:.1f} ms/gambar")
+
+
+if __name__ == "__main__":
+    main()
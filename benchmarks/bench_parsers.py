@@ -0,0 +1,251 @@
+# benchmarks/bench_parsers.py
+"""
+Microbenchmark parser atas output model rekaman (atau sintetis dari label):
+parse_single_ticket_text, parse_multi_ticket_json dan add_mileage_to_ticket,
+plus akurasi per field hasil parse terhadap benchmarks/golden_labels.json.
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --recordings benchmarks/recordings/qwen.json
+    python benchmarks/bench_parsers.py --csv /path/stations.csv --json parsers.json
+    python benchmarks/bench_parsers.py --check 5000
+
+add_mileage_to_ticket butuh data stasiun (STATIONS_CSV / --csv); tanpa CSV
+bagian itu dilewati.
+
+--check N membandingkan parser sekarang dengan salinan beku parser lama
+(parse_reference.py) atas output di atas plus N variasi acak (token yang
+berdempetan, separator, JSON terpotong / bersarang / berpengantar):
+  - parse_single_ticket_text harus identik
+  - parse_multi_ticket_json boleh memulihkan lebih banyak tiket, tetapi tiket
+    hasil parser lama harus muncul berurutan di hasil baru
+dan mencetak throughput keduanya. Exit code 1 jika ada yang berbeda.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from golden import (  # noqa: E402
+    AccuracyTally, git_commit, load_labels, load_recordings, synthetic_outputs, write_summary,
+)
+
+
+def bench(fn, inputs: list, min_seconds: float) -> dict:
+    """Ulangi fn atas semua input sampai >= min_seconds; return panggilan/detik."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for item in inputs:
+            fn(item)
+        calls += len(inputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            break
+    return {"calls": calls, "calls_per_s": round(calls / elapsed, 1), "us_per_call": round(1e6 * elapsed / calls, 2)}
+
+
+SINGLE_FRAGMENTS = [
+    "12:30", "9:05", "１２:３４", "：", "元", " 元", "NT$", "NT$ 440", "NT", "NT440", "2016.05.23", "2016/05/2",
+    "20160523", "→", "->", " to ", "+", "至", "\n", " ", "  ", "台北", "花蓮", "Taipei", "Hualien", "Train", "Seat",
+    "Station", "Tokyo", "123", "12:3", "4567.89.01", "票價", "車次", "-", ":", "\t", "\r\n", "To",
+]
+
+
+def fuzz_single(texts: list, count: int, rng: random.Random) -> list:
+    """Variasi teks OCR: sisip fragmen berdempetan, hapus potongan, atau teks acak dari fragmen."""
+    variants = []
+    for _ in range(count):
+        kind = rng.randrange(3)
+        if kind == 2 or not texts:
+            variants.append("".join(rng.choice(SINGLE_FRAGMENTS) for _ in range(rng.randrange(1, 12))))
+            continue
+        text = rng.choice(texts)
+        for _ in range(rng.randrange(1, 5)):
+            i = rng.randrange(len(text) + 1)
+            if kind == 0:
+                text = text[:i] + rng.choice(SINGLE_FRAGMENTS) + text[i:]
+            else:
+                text = text[:i] + text[i + rng.randrange(1, 6):]
+        variants.append(text)
+    return variants
+
+
+def fuzz_multi(texts: list, count: int, rng: random.Random) -> list:
+    """Variasi output multi: terpotong, berpengantar, objek lepas, bersarang, "}" dalam string."""
+    variants = []
+    for _ in range(count):
+        text = rng.choice(texts)
+        kind = rng.randrange(6)
+        if kind == 0:
+            text = text[:rng.randrange(len(text) + 1)]
+        elif kind == 1:
+            text = rng.choice(["Here is the JSON:\n", "票據文本如下：\n", "```json\n", "- 票據文本如下：\n"]) + text
+        elif kind == 2:
+            start, end = text.find("["), text.rfind("]")
+            if start != -1 and end > start:
+                text = text[start + 1:end]
+        elif kind == 3:
+            text = text.replace('"price": ', '"extra": {"seat": "12D"}, "price": ', 1)
+        elif kind == 4:
+            text = text.replace('"departure_time": "', '"departure_time": "}', 1)
+        else:
+            text = text + rng.choice(["\n```", " done", "\n[]", "{", '{"date": '])
+        variants.append(text)
+    return variants
+
+
+def outcome(fn, text):
+    try:
+        return fn(text)
+    except Exception as exc:  # perilaku error juga harus sama
+        return ("error", type(exc).__name__)
+
+
+def is_subsequence(old, new) -> bool:
+    if not isinstance(old, list) or not isinstance(new, list):
+        return old == new
+    it = iter(new)
+    return all(any(item == candidate for candidate in it) for item in old)
+
+
+def check_equivalence(single_texts: list, multi_texts: list, count: int, have_stations: bool,
+                      seconds: float) -> dict:
+    """Bandingkan parser sekarang dengan parse_reference; return ringkasan + contoh beda."""
+    from parse_reference import legacy_parse_multi_ticket_json, legacy_parse_single_ticket_text
+    from parse_ticket import parse_multi_ticket_json, parse_single_ticket_text
+
+    rng = random.Random(0)
+    report = {}
+    corpus = single_texts + fuzz_single(single_texts, count, rng)
+    mismatches = [t for t in corpus
+                  if outcome(parse_single_ticket_text, t) != outcome(legacy_parse_single_ticket_text, t)]
+    report["single"] = {
+        "cases": len(corpus),
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5],
+        "legacy": bench(legacy_parse_single_ticket_text, single_texts, seconds),
+        "new": bench(parse_single_ticket_text, single_texts, seconds),
+    }
+    if have_stations:
+        corpus = multi_texts + fuzz_multi(multi_texts, count, rng)
+        mismatches, recovered = [], 0
+        for text in corpus:
+            old = outcome(legacy_parse_multi_ticket_json, text)
+            new = outcome(parse_multi_ticket_json, text)
+            if old != new:
+                if is_subsequence(old, new):
+                    recovered += 1
+                else:
+                    mismatches.append(text)
+        report["multi"] = {
+            "cases": len(corpus),
+            "mismatches": len(mismatches),
+            "recovered": recovered,
+            "examples": mismatches[:5],
+            "legacy": bench(legacy_parse_multi_ticket_json, multi_texts, seconds),
+            "new": bench(parse_multi_ticket_json, multi_texts, seconds),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", help="JSON rekaman output model (bench_upload.py --record)")
+    parser.add_argument("--csv", help="CSV stasiun (default STATIONS_CSV)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="durasi minimal per parser")
+    parser.add_argument("--check", type=int, metavar="N", help="cek kesetaraan dengan parser lama + N variasi acak")
+    parser.add_argument("--json", help="tulis ringkasan ke file JSON")
+    args = parser.parse_args()
+
+    if args.csv:
+        os.environ["STATIONS_CSV"] = args.csv
+    # Import setelah STATIONS_CSV diset
+    from parse_ticket import add_mileage_to_ticket, parse_multi_ticket_json, parse_single_ticket_text
+    from stations_data import get_station_index
+
+    labels = load_labels()
+    source = args.recordings or "synthetic"
+    outputs = load_recordings(args.recordings) if args.recordings else synthetic_outputs(labels)
+    names = [name for name in labels if name in outputs]
+    if not names:
+        sys.exit("Tidak ada output untuk foto berlabel.")
+
+    try:
+        get_station_index()
+        have_stations = True
+    except (OSError, ValueError) as exc:
+        print(f"Data stasiun tidak tersedia ({exc}); parse_multi_ticket_json & mileage dilewati.")
+        have_stations = False
+
+    # Single: image penuh untuk foto satu tiket, potongan untuk foto multi-tiket
+    single_texts, single_expected = [], []
+    for name in names:
+        entry, tickets = outputs[name], labels[name]
+        if len(tickets) == 1 and "single" in entry:
+            single_texts.append(entry["single"])
+            single_expected.append(tickets)
+        for i, ticket in enumerate(tickets):
+            if len(tickets) > 1 and f"crop{i}" in entry:
+                single_texts.append(entry[f"crop{i}"])
+                single_expected.append([ticket])
+    multi_texts = [outputs[name]["multi"] for name in names if "multi" in outputs[name]]
+    multi_expected = [labels[name] for name in names if "multi" in outputs[name]]
+
+    results = {"single": bench(parse_single_ticket_text, single_texts, args.seconds)}
+    single_tally = AccuracyTally()
+    for text, expected in zip(single_texts, single_expected):
+        single_tally.add([parse_single_ticket_text(text)], expected)
+    results["single"]["accuracy"] = single_tally.summary()
+
+    if have_stations:
+        results["multi"] = bench(parse_multi_ticket_json, multi_texts, args.seconds)
+        multi_tally = AccuracyTally()
+        for text, expected in zip(multi_texts, multi_expected):
+            multi_tally.add(parse_multi_ticket_json(text), expected)
+        results["multi"]["accuracy"] = multi_tally.summary()
+
+        tickets = [ticket for text in multi_texts for ticket in parse_multi_ticket_json(text)]
+        results["mileage"] = bench(lambda t: add_mileage_to_ticket(dict(t)), tickets, args.seconds)
+
+    print(f"sumber output: {source}, {len(single_texts)} teks single, {len(multi_texts)} JSON multi")
+    print(f"{'parser':<28}{'panggilan/s':>14}{'us/panggilan':>14}{'akurasi field':>15}")
+    for label, key in (("parse_single_ticket_text", "single"), ("parse_multi_ticket_json", "multi"),
+                       ("add_mileage_to_ticket", "mileage")):
+        if key not in results:
+            continue
+        row = results[key]
+        accuracy = row.get("accuracy", {}).get("field_accuracy")
+        accuracy_text = f"{accuracy:.1%}" if accuracy is not None else "-"
+        print(f"{label:<28}{row['calls_per_s']:>14.0f}{row['us_per_call']:>14.2f}{accuracy_text:>15}")
+
+    failed = False
+    if args.check is not None:
+        # Log peringatan JSON rusak dari ribuan variasi tidak perlu dicetak
+        logging.disable(logging.WARNING)
+        report = check_equivalence(single_texts, multi_texts, args.check, have_stations, args.seconds)
+        logging.disable(logging.NOTSET)
+        results["check"] = report
+        print(f"\n{'kesetaraan':<28}{'kasus':>8}{'beda':>7}{'lama /s':>12}{'baru /s':>12}")
+        for key, row in report.items():
+            extra = f"  (+{row['recovered']} dipulihkan)" if row.get("recovered") else ""
+            print(f"{key:<28}{row['cases']:>8}{row['mismatches']:>7}{row['legacy']['calls_per_s']:>12.0f}"
+                  f"{row['new']['calls_per_s']:>12.0f}{extra}")
+            for example in row["examples"]:
+                print(f"    beda: {json.dumps(example, ensure_ascii=False)[:160]}")
+            failed = failed or bool(row["mismatches"])
+
+    if args.json:
+        write_summary(args.json, {"benchmark": "parsers", "commit": git_commit(), "source": source,
+                                  "results": results})
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
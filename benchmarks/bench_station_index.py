@@ -0,0 +1,126 @@
+# benchmarks/bench_station_index.py
+"""
+Microbenchmark: lookup stasiun lewat StationIndex vs filter pandas lama.
+
+    python benchmarks/bench_station_index.py                      # pakai stations_database_modified.csv
+    python benchmarks/bench_station_index.py --synthetic 5000     # tabel rute buatan
+
+Kedua jalur juga dicek menghasilkan jawaban yang sama.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from station_index import StationIndex, is_chinese  # noqa: E402
+
+
+# -- jalur pandas lama (disalin dari app.py / parse_ticket.py sebelum index) --
+# Pemanggil (is_valid_ticket / add_mileage_to_ticket) sudah strip() input.
+def pandas_is_valid(df, dep, arr):
+    dep_lower, arr_lower = dep.strip().lower(), arr.strip().lower()
+    dep_valid = (
+        df["startStaName"].str.strip().str.lower().eq(dep_lower).any() or
+        df["startStaEName"].str.strip().str.lower().eq(dep_lower).any()
+    )
+    arr_valid = (
+        df["endStaName"].str.strip().str.lower().eq(arr_lower).any() or
+        df["endStaEName"].str.strip().str.lower().eq(arr_lower).any()
+    )
+    return bool(dep_valid and arr_valid)
+
+
+def pandas_mileage(df, dep, arr):
+    dep, arr = dep.strip(), arr.strip()
+    departure_col = "startStaName" if is_chinese(dep) else "startStaEName"
+    arrival_col = "endStaName" if is_chinese(arr) else "endStaEName"
+    rows = df[
+        (df[departure_col].str.strip().str.lower() == dep.lower()) &
+        (df[arrival_col].str.strip().str.lower() == arr.lower())
+    ]
+    return rows.iloc[0]["mileage"] if not rows.empty else None
+
+
+def pandas_english_departure(df, dep):
+    rows = df[df["startStaName"] == dep]
+    return rows.iloc[0]["startStaEName"] if not rows.empty else None
+
+
+# -- jalur index ------------------------------------------------------------
+def index_is_valid(index, dep, arr):
+    return index.is_valid_departure(dep) and index.is_valid_arrival(arr)
+
+
+def synthetic_stations(n_stations: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    names = [(chr(0x4e00 + i) + chr(0x4e00 + i + 1) + "站", f"Station{i}") for i in range(n_stations)]
+    rows = []
+    for _ in range(n_stations * 4):
+        (s_zh, s_en), (e_zh, e_en) = rng.sample(names, 2)
+        rows.append((s_zh, s_en, e_zh, e_en, round(rng.uniform(1, 400), 1)))
+    return pd.DataFrame(rows, columns=["startStaName", "startStaEName", "endStaName", "endStaEName", "mileage"])
+
+
+def make_queries(df: pd.DataFrame, n: int, seed: int = 1) -> list:
+    """Campuran rute yang ada (China/Inggris, beda kapitalisasi) dan nama yang salah."""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        row = df.iloc[rng.randrange(len(df))]
+        kind = i % 4
+        if kind == 0:
+            queries.append((row["startStaEName"], row["endStaEName"]))
+        elif kind == 1:
+            queries.append((row["startStaName"], row["endStaName"]))
+        elif kind == 2:
+            queries.append((f" {row['startStaEName'].upper()} ", row["endStaName"]))
+        else:
+            queries.append(("Nowhere", row["endStaEName"]))
+    return queries
+
+
+def timed(fn, queries) -> tuple:
+    start = time.perf_counter()
+    results = [fn(dep, arr) for dep, arr in queries]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="stations_database_modified.csv")
+    parser.add_argument("--synthetic", type=int, default=0, help="jumlah stasiun buatan (abaikan --csv)")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    df = synthetic_stations(args.synthetic) if args.synthetic else pd.read_csv(args.csv)
+    queries = make_queries(df, args.queries)
+
+    start = time.perf_counter()
+    index = StationIndex.from_dataframe(df)
+    build_s = time.perf_counter() - start
+    print(f"{len(df)} rute, build index {build_s * 1000:.1f} ms")
+
+    cases = [
+        ("is_valid_ticket", lambda d, a: pandas_is_valid(df, d, a), lambda d, a: index_is_valid(index, d, a)),
+        ("mileage", lambda d, a: pandas_mileage(df, d, a), index.mileage),
+        ("english_departure", lambda d, a: pandas_english_departure(df, d), lambda d, a: index.english_departure(d)),
+    ]
+    print(f"{'lookup':<20}{'pandas us/op':>14}{'index us/op':>14}{'speedup':>10}")
+    for name, pandas_fn, index_fn in cases:
+        pandas_s, expected = timed(pandas_fn, queries)
+        index_s, actual = timed(index_fn, queries)
+        mismatches = sum(1 for e, a in zip(expected, actual) if e != a)
+        if mismatches:
+            print(f"  PERINGATAN: {mismatches} hasil {name} berbeda dari jalur pandas")
+        per_pandas = 1e6 * pandas_s / len(queries)
+        per_index = 1e6 * index_s / len(queries)
+        print(f"{name:<20}{per_pandas:>14.1f}{per_index:>14.2f}{per_pandas / max(per_index, 1e-9):>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_station_matcher.py
+"""
+Benchmark lookup/detik untuk pencocokan fuzzy nama stasiun.
+
+    python benchmarks/bench_station_matcher.py                    # pakai stations_database_modified.csv
+    python benchmarks/bench_station_matcher.py --synthetic 300    # tabel rute buatan
+
+Membandingkan extractOne per nama dengan StationMatcher (satu cdist per batch)
+dan melaporkan berapa query ber-typo yang kembali ke nama aslinya.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+from rapidfuzz import process, utils
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_station_index import synthetic_stations  # noqa: E402
+from station_index import StationIndex  # noqa: E402
+from station_matcher import StationMatcher  # noqa: E402
+
+
+def add_ocr_noise(name: str, rng: random.Random) -> str:
+    """Satu kesalahan OCR: ganti/hapus satu huruf atau tambah akhiran."""
+    kind = rng.randrange(3)
+    if kind == 0 and len(name) > 3:
+        i = rng.randrange(1, len(name))
+        return name[:i] + rng.choice("lI1oOe") + name[i + 1:]
+    if kind == 1 and len(name) > 4:
+        i = rng.randrange(1, len(name))
+        return name[:i] + name[i + 1:]
+    return name + rng.choice([" Sta", " Station", "站"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="stations_database_modified.csv")
+    parser.add_argument("--synthetic", type=int, default=0, help="jumlah stasiun buatan (abaikan --csv)")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=16, help="jumlah nama per panggilan cdist")
+    args = parser.parse_args()
+
+    df = synthetic_stations(args.synthetic) if args.synthetic else pd.read_csv(args.csv)
+    index = StationIndex.from_dataframe(df)
+
+    start = time.perf_counter()
+    matcher = StationMatcher(index)
+    print(f"{len(index.departures)} nama keberangkatan, build matcher {1000 * (time.perf_counter() - start):.1f} ms")
+
+    rng = random.Random(0)
+    truth = [rng.choice(sorted(df["startStaEName"].dropna().unique())) for _ in range(args.queries)]
+    queries = [add_ocr_noise(name, rng) for name in truth]
+
+    side = matcher._departures
+    start = time.perf_counter()
+    single = []
+    for query in queries:
+        hit = process.extractOne(
+            utils.default_process(query), side.keys, scorer=matcher.scorer, score_cutoff=matcher.score_cutoff
+        )
+        single.append(side.names[hit[2]] if hit else None)
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(queries), args.batch):
+        batched.extend(matcher.match_departures(queries[i:i + args.batch]))
+    batched_s = time.perf_counter() - start
+
+    recovered = sum(1 for expected, got in zip(truth, batched) if expected == got)
+    unmatched = sum(1 for got in batched if got is None)
+    print(f"extractOne per nama : {len(queries) / single_s:>10.0f} lookup/s")
+    print(f"cdist batch={args.batch:<3}     : {len(queries) / batched_s:>10.0f} lookup/s")
+    print(f"kembali ke nama asli: {recovered}/{len(queries)} (tanpa kandidat: {unmatched}, "
+          f"cutoff {matcher.score_cutoff:.0f})")
+
+
+if __name__ == "__main__":
+    main()
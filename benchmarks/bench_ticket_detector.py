@@ -0,0 +1,59 @@
+# benchmarks/bench_ticket_detector.py
+"""
+Jalankan ticket_detector pada sampel di results/*.jpeg: jumlah tiket yang
+terdeteksi, waktu deteksi, dan token visual / langkah decode yang dibutuhkan
+jalur split (single per potongan) dibanding jalur multi (satu JSON panjang).
+
+    python benchmarks/bench_ticket_detector.py
+    python benchmarks/bench_ticket_detector.py --pattern "foto/*.jpg"
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_preprocess import preprocess_image, vision_token_count  # noqa: E402
+from multi_inference import MULTI_MAX_NEW_TOKENS  # noqa: E402
+from single_inference import SINGLE_MAX_NEW_TOKENS  # noqa: E402
+from ticket_detector import crop_ticket, detect_tickets  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pattern", default=os.path.join(ROOT, "results", "*.jpeg"))
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.pattern))
+    if not paths:
+        sys.exit(f"Tidak ada file untuk pola {args.pattern}")
+
+    print(f"{'file':<18}{'tiket':>6}{'ms':>8}{'token multi':>13}{'token split':>13}")
+    total_ms = 0.0
+    split_images = 0
+    for path in paths:
+        with Image.open(path) as image:
+            image, _ = preprocess_image(image)
+        start = time.perf_counter()
+        boxes = detect_tickets(image)
+        elapsed_ms = 1000 * (time.perf_counter() - start)
+        total_ms += elapsed_ms
+
+        full_tokens = vision_token_count(*image.size)
+        split_tokens = sum(vision_token_count(*crop_ticket(image, box).size) for box in boxes)
+        split_images += bool(boxes)
+        print(f"{os.path.basename(path):<18}{len(boxes):>6}{elapsed_ms:>8.1f}{full_tokens:>13}"
+              f"{split_tokens if boxes else '-':>13}")
+
+    print(f"\n{split_images}/{len(paths)} gambar dipotong per tiket, deteksi {total_ms / len(paths):.1f} ms/gambar")
+    print(f"decode berurutan per gambar multi-tiket: <= {MULTI_MAX_NEW_TOKENS} langkah (prompt multi) "
+          f"-> <= {SINGLE_MAX_NEW_TOKENS} langkah (potongan dalam satu batch)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+# benchmarks/bench_upload.py
+"""
+Load test end-to-end POST /upload/?wait=true dengan foto berlabel di results/:
+latensi p50/p95/p99, request/detik dan akurasi per field terhadap
+benchmarks/golden_labels.json. Server FastAPI dijalankan di proses ini
+(uvicorn di thread) dengan result cache mati, kecuali --url diberikan.
+
+Mode model:
+  fake  (default) generate_fn deterministik: teks dari --recordings atau
+        sintetis dari label, dengan latensi buatan
+        --prefill-ms + --token-ms x token (per batch, seperti decode batch)
+  stub  stub_model lewat inference_core (processor, template, batch_decode)
+  real  Qwen2.5-VL sungguhan; --record menyimpan output model untuk
+        diputar ulang oleh mode fake dan bench_parsers.py
+
+    python benchmarks/bench_upload.py --requests 200 --concurrency 8
+    python benchmarks/bench_upload.py --prefill-ms 800 --token-ms 30 --json fake.json
+    python benchmarks/bench_upload.py --mode real --record benchmarks/recordings/qwen.json
+    python benchmarks/bench_upload.py --url http://localhost:8000 --requests 50
+
+Perubahan yang mengubah prompt (mis. urutan teks/image untuk cache awalan)
+dibandingkan akurasinya di mode real dengan env yang berbeda:
+    PROMPT_TEXT_FIRST=0 python benchmarks/bench_upload.py --mode real --json image-first.json
+    PROMPT_TEXT_FIRST=1 python benchmarks/bench_upload.py --mode real --json text-first.json
+
+Ringkasan (--json) memuat commit git, jadi hasil antar commit bisa dibandingkan.
+"""
+import argparse
+import hashlib
+import http.client
+import itertools
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from golden import (  # noqa: E402
+    IMAGES_DIR, AccuracyTally, git_commit, latency_summary, load_labels, load_recordings, save_recordings,
+    synthetic_outputs, write_summary,
+)
+
+UPLOAD_PREFIX = "bench-"
+
+
+def image_fingerprint(image) -> str:
+    """Identitas image setelah preprocessing (sama di server dan di sini)."""
+    digest = hashlib.sha1(image.tobytes())
+    digest.update(f"{image.mode}{image.size}".encode())
+    return digest.hexdigest()
+
+
+def build_image_index(names: list) -> dict:
+    """
+    {fingerprint: (nama, bagian)} untuk image penuh ("full") dan setiap potongan
+    tiket ("cropN"), dengan preprocessing & deteksi yang sama seperti server.
+    """
+    from image_preprocess import load_image
+    from ticket_detector import TICKET_SPLIT, crop_ticket, detect_tickets
+
+    index = {}
+    for name in names:
+        image = load_image(os.path.join(IMAGES_DIR, name))
+        index[image_fingerprint(image)] = (name, "full")
+        for i, box in enumerate(detect_tickets(image) if TICKET_SPLIT else []):
+            index[image_fingerprint(crop_ticket(image, box))] = (name, f"crop{i}")
+    return index
+
+
+def output_kind(part: str, prompt: str) -> str:
+    """Kunci rekaman: "single"/"multi" untuk image penuh, "cropN" untuk potongan."""
+    from multi_inference import MULTI_PROMPT
+
+    if part != "full":
+        return part
+    return "multi" if prompt == MULTI_PROMPT else "single"
+
+
+class FakeModel:
+    """
+    Pengganti generate_texts (signature sama) untuk BatchScheduler.generate_fn.
+    Teks dipilih per (foto, prompt / potongan); satu batch tidur
+    prefill_ms + token_ms x token terpanjang di batch.
+    """
+
+    def __init__(self, outputs: dict, image_index: dict, prefill_ms: float, token_ms: float):
+        self.outputs = outputs
+        self.image_index = image_index
+        self.prefill_s = prefill_ms / 1000.0
+        self.token_s = token_ms / 1000.0
+        self.calls = 0
+        self.unknown = 0
+
+    @staticmethod
+    def approx_tokens(text: str) -> int:
+        # Kira-kira tokenizer Qwen: ~3 karakter Latin atau ~1 karakter CJK per token
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        return max(1, ascii_chars // 3 + (len(text) - ascii_chars))
+
+    def text_for(self, image, prompt: str, max_new_tokens: int) -> str:
+        name, part = self.image_index.get(image_fingerprint(image), (None, None))
+        if name is None:
+            self.unknown += 1
+            return ""
+        return self.outputs.get(name, {}).get(output_kind(part, prompt), "")
+
+    def __call__(self, images: list, prompts: list, max_new_tokens, on_text: list = None) -> list:
+        if isinstance(max_new_tokens, int):
+            max_new_tokens = [max_new_tokens] * len(prompts)
+        texts = [self.text_for(image, prompt, limit) for image, prompt, limit in zip(images, prompts, max_new_tokens)]
+        steps = max(min(self.approx_tokens(text), limit) for text, limit in zip(texts, max_new_tokens))
+        time.sleep(self.prefill_s + self.token_s * steps)
+        self.calls += 1
+        # Baris streaming menerima teksnya sekaligus di akhir batch
+        for text, callback in zip(texts, on_text or []):
+            if callback is not None and text:
+                callback(text)
+        return texts
+
+
+class Recorder:
+    """Bungkus generate_fn sungguhan; simpan setiap teks per (foto, bagian)."""
+
+    def __init__(self, generate_fn, image_index: dict):
+        self.generate_fn = generate_fn
+        self.image_index = image_index
+        self.outputs = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, images: list, prompts: list, max_new_tokens, on_text: list = None) -> list:
+        streaming = {"on_text": on_text} if on_text else {}
+        texts = self.generate_fn(images, prompts, max_new_tokens, **streaming)
+        with self._lock:
+            for image, prompt, text in zip(images, prompts, texts):
+                name, part = self.image_index.get(image_fingerprint(image), (None, None))
+                if name is not None:
+                    self.outputs.setdefault(name, {})[output_kind(part, prompt)] = text
+        return texts
+
+
+# -- server di proses ini -------------------------------------------------
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, names: list):
+    """Import app dengan konfigurasi benchmark, pasang model, jalankan uvicorn di thread."""
+    store_dir = tempfile.mkdtemp(prefix="bench-store-")
+    os.environ["RESULT_CACHE_SIZE"] = "0"
+    os.environ["RESULT_CACHE_DIR"] = ""
+    os.environ["TICKET_STORE_PATH"] = os.path.join(store_dir, "tickets.jsonl")
+    os.environ["UPLOAD_DIR"] = os.path.join(store_dir, "uploads")
+    os.environ["WARMUP_MODEL"] = "1" if args.mode == "real" else "0"
+    # Worker model di proses ini (antrian job di memori) agar generate_fn bisa diganti
+    os.environ["INPROCESS_WORKER"] = "1"
+    os.environ["JOB_QUEUE_PATH"] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.csv:
+        os.environ["STATIONS_CSV"] = args.csv
+    # app.py memakai path relatif (templates/)
+    os.chdir(ROOT)
+
+    import uvicorn
+    import model_loader
+
+    if args.mode == "stub":
+        import stub_model
+
+        model_loader.set_loader(stub_model.load_stub_model)
+    import app as app_module
+
+    model = None
+    if args.mode == "fake" or args.record:
+        image_index = build_image_index(names)
+        if args.mode == "fake":
+            labels = load_labels()
+            outputs = load_recordings(args.recordings) if args.recordings else synthetic_outputs(labels)
+            model = FakeModel(outputs, image_index, args.prefill_ms, args.token_ms)
+        else:
+            model = Recorder(app_module.scheduler.generate_fn, image_index)
+        app_module.scheduler.generate_fn = model
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + (600 if args.mode == "real" else 60)
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            sys.exit("Server gagal start.")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, thread, model
+
+
+def stop_server(server, thread):
+    server.should_exit = True
+    thread.join(30)
+    shutil.rmtree(os.environ["UPLOAD_DIR"], ignore_errors=True)
+
+
+# -- klien ----------------------------------------------------------------
+def multipart_body(filename: str, data: bytes) -> tuple:
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """Satu koneksi keep-alive per thread klien."""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def post(self, path: str, body: bytes, headers: dict) -> tuple:
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request("POST", path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # Koneksi keep-alive ditutup server: buka ulang sekali
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+
+def run_load(base_url: str, names: list, images: dict, args) -> list:
+    """Kirim args.requests upload (round-robin foto) dari args.concurrency thread."""
+    local = threading.local()
+    counter = itertools.count()
+
+    def one(i: int):
+        if not hasattr(local, "client"):
+            local.client = Client(base_url, args.timeout)
+        name = names[i % len(names)]
+        body, content_type = multipart_body(f"{UPLOAD_PREFIX}{i}-{name}", images[name])
+        headers = {"Content-Type": content_type, "Accept": "application/json", "X-Request-ID": f"bench-{i}"}
+        start = time.perf_counter()
+        try:
+            status, payload = local.client.post("/upload/?wait=true", body, headers)
+        except OSError as exc:
+            return {"i": next(counter), "name": name, "status": 0, "seconds": time.perf_counter() - start,
+                    "error": str(exc)}
+        elapsed = time.perf_counter() - start
+        result = {"i": next(counter), "name": name, "status": status, "seconds": elapsed}
+        if status == 200:
+            result["tickets"] = json.loads(payload)["tickets"]
+        return result
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        return list(executor.map(one, range(args.requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("fake", "stub", "real"), default="fake")
+    parser.add_argument("--url", help="server yang sudah berjalan (mode model diabaikan)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=0, help="request awal yang tidak dihitung")
+    parser.add_argument("--images", nargs="*", help="subset nama file dari golden_labels.json")
+    parser.add_argument("--prefill-ms", type=float, default=300.0, help="mode fake: latensi per batch")
+    parser.add_argument("--token-ms", type=float, default=25.0, help="mode fake: latensi per token decode")
+    parser.add_argument("--recordings", help="mode fake: output rekaman (default sintetis dari label)")
+    parser.add_argument("--record", help="mode real: simpan output model ke file JSON ini")
+    parser.add_argument("--csv", help="CSV stasiun untuk server di proses ini (STATIONS_CSV)")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--json", help="tulis ringkasan ke file JSON")
+    args = parser.parse_args()
+    if args.record and args.mode != "real":
+        parser.error("--record hanya untuk --mode real")
+    # Server di proses ini pindah ke ROOT; path dari command line dibuat absolut dulu
+    for key in ("recordings", "record", "csv", "json"):
+        if getattr(args, key):
+            setattr(args, key, os.path.abspath(getattr(args, key)))
+
+    labels = load_labels()
+    names = args.images or list(labels)
+    missing = [name for name in names if name not in labels]
+    if missing:
+        parser.error(f"tidak ada label untuk: {', '.join(missing)}")
+    images = {}
+    for name in names:
+        with open(os.path.join(IMAGES_DIR, name), "rb") as f:
+            images[name] = f.read()
+
+    server = thread = model = None
+    if args.url:
+        base_url, mode = args.url.rstrip("/"), "external"
+    else:
+        base_url, server, thread, model = start_server(args, names)
+        mode = args.mode
+
+    try:
+        if args.warmup:
+            warm = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+            run_load(base_url, names, images, warm)
+        started = time.perf_counter()
+        results = run_load(base_url, names, images, args)
+        wall_s = time.perf_counter() - started
+        batching = None
+        if server is not None:
+            import app as app_module
+
+            batching = app_module.scheduler.metrics()
+    finally:
+        if server is not None:
+            stop_server(server, thread)
+
+    ok = [r for r in results if r["status"] == 200]
+    statuses = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    tally = AccuracyTally()
+    for r in ok:
+        tally.add(r["tickets"], labels[r["name"]])
+
+    summary = {
+        "benchmark": "upload",
+        "commit": git_commit(),
+        "mode": mode,
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency, "images": len(names),
+            "prefill_ms": args.prefill_ms if mode == "fake" else None,
+            "token_ms": args.token_ms if mode == "fake" else None,
+            "outputs": (args.recordings or "synthetic") if mode == "fake" else None,
+        },
+        "wall_s": round(wall_s, 3),
+        "requests_per_s": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "status_counts": statuses,
+        "latency": latency_summary([r["seconds"] for r in ok]),
+        "accuracy": tally.summary(),
+    }
+    if server is not None:
+        from combined_inference import cache_version
+
+        # Model + preprocessing + urutan prompt + mode decoding server ini
+        summary["config"]["cache_version"] = cache_version()
+    if batching is not None:
+        summary["batching"] = {key: batching[key] for key in ("batches", "avg_batch_size", "avg_wait_ms")}
+    if isinstance(model, FakeModel) and model.unknown:
+        summary["unknown_images"] = model.unknown
+
+    latency, accuracy = summary["latency"], summary["accuracy"]
+    print(f"mode {mode}, {args.requests} request, concurrency {args.concurrency}, commit {summary['commit']}")
+    print(f"status      : {statuses}")
+    print(f"throughput  : {summary['requests_per_s']:.2f} req/s ({wall_s:.2f} s)")
+    print(f"latensi     : p50 {latency['p50_ms']:.0f} ms, p95 {latency['p95_ms']:.0f} ms, "
+          f"p99 {latency['p99_ms']:.0f} ms")
+    print(f"akurasi     : field {accuracy['field_accuracy']:.1%}, "
+          f"jumlah tiket {accuracy['ticket_count_accuracy']:.1%}")
+    print("per field   : " + ", ".join(f"{k} {v:.0%}" for k, v in accuracy["per_field"].items()))
+    if "batching" in summary:
+        b = summary["batching"]
+        print(f"batching    : {b['batches']} batch, rata-rata {b['avg_batch_size']:.2f} prompt/batch")
+    if summary.get("unknown_images"):
+        print(f"PERINGATAN  : {summary['unknown_images']} image tidak dikenali fake model")
+
+    if args.record and isinstance(model, Recorder):
+        import model_loader
+
+        save_recordings(args.record, model.outputs, model=model_loader.model_version())
+        print(f"rekaman     : {args.record} ({len(model.outputs)} foto)")
+    if args.json:
+        write_summary(args.json, summary)
+
+
+if __name__ == "__main__":
+    main()
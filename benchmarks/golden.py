@@ -0,0 +1,181 @@
+# benchmarks/golden.py
+"""
+Dataset emas untuk benchmark: label manual per foto di results/
+(benchmarks/golden_labels.json), output model rekaman atau sintetis, akurasi
+per field, dan persentil latensi. Dipakai bench_parsers.py dan bench_upload.py.
+
+Format rekaman (ditulis bench_upload.py --record, mode real):
+    {"model": "...", "outputs": {"single0.jpeg": {"single": "...", "multi": "...",
+                                                  "crop0": "...", ...}}}
+  single = prompt single atas image penuh, multi = prompt multi,
+  cropN  = prompt single atas potongan tiket ke-N (ticket_detector).
+Tanpa rekaman, output dibuat dari label (synthetic_outputs): teks OCR dan JSON
+yang rapi, jadi akurasinya batas atas parser, bukan akurasi model.
+"""
+import json
+import math
+import os
+import re
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+LABELS_PATH = os.path.join(BENCH_DIR, "golden_labels.json")
+IMAGES_DIR = os.path.join(ROOT, "results")
+
+FIELDS = ("date", "departure_station", "arrival_station", "departure_time", "arrival_time", "price")
+
+
+def load_labels(path: str = LABELS_PATH) -> dict:
+    """{nama file: [tiket, ...]} dalam urutan baca."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["images"]
+
+
+def load_recordings(path: str) -> dict:
+    """{nama file: {"single"/"multi"/"cropN": teks mentah}}."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["outputs"]
+
+
+def save_recordings(path: str, outputs: dict, model: str = ""):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "outputs": outputs}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+# -- output sintetis ------------------------------------------------------
+def synthetic_single_text(tickets: list) -> str:
+    """Teks seperti output prompt single (semua teks di tiket), satu blok per tiket."""
+    blocks = []
+    for t in tickets:
+        blocks.append(
+            f"{t['date']} 車次Train 單程票\n"
+            f"{t['departure_station']} {t['departure_time']} → {t['arrival_station']} {t['arrival_time']}\n"
+            f"標準廂 Std.Car 座位 Seat\n"
+            f"NT${t['price']} 成人"
+        )
+    return "\n".join(blocks)
+
+
+def synthetic_multi_json(tickets: list) -> str:
+    """JSON array seperti output prompt multi (dibungkus pagar markdown seperti Qwen)."""
+    return "```json\n" + json.dumps(tickets, ensure_ascii=False, indent=2) + "\n```"
+
+
+def synthetic_outputs(labels: dict) -> dict:
+    """Output per foto dengan format rekaman, dibuat dari label."""
+    outputs = {}
+    for name, tickets in labels.items():
+        entry = {"single": synthetic_single_text(tickets), "multi": synthetic_multi_json(tickets)}
+        for i, ticket in enumerate(tickets):
+            entry[f"crop{i}"] = synthetic_single_text([ticket])
+        outputs[name] = entry
+    return outputs
+
+
+# -- akurasi --------------------------------------------------------------
+def normalize(field: str, value) -> str:
+    """Bentuk pembanding: 2016/05/23 == 2016.05.23, "TAIPEI" == "Taipei", "8:00" == "08:00"."""
+    text = "" if value is None else str(value)
+    if field == "date" or field == "price":
+        return re.sub(r"\D", "", text)
+    if field.endswith("_time"):
+        match = re.search(r"(\d{1,2})[:：](\d{2})", text)
+        return f"{int(match.group(1))}:{match.group(2)}" if match else ""
+    return re.sub(r"[^a-z]", "", text.lower())
+
+
+def score_tickets(predicted: list, expected: list) -> dict:
+    """
+    Bandingkan tiket hasil dengan label secara berurutan. Tiket yang hilang
+    atau berlebih dihitung salah di semua field.
+    """
+    predicted = [t for t in predicted if isinstance(t, dict)]
+    total = max(len(predicted), len(expected)) * len(FIELDS)
+    per_field = dict.fromkeys(FIELDS, 0)
+    for got, want in zip(predicted, expected):
+        for field in FIELDS:
+            if normalize(field, got.get(field)) == normalize(field, want.get(field)):
+                per_field[field] += 1
+    correct = sum(per_field.values())
+    return {
+        "correct": correct,
+        "total": total,
+        "per_field": per_field,
+        "count_ok": len(predicted) == len(expected),
+    }
+
+
+class AccuracyTally:
+    """Akumulasi score_tickets untuk banyak foto / request."""
+
+    def __init__(self):
+        self.correct = 0
+        self.total = 0
+        self.samples = 0
+        self.count_ok = 0
+        self.field_correct = dict.fromkeys(FIELDS, 0)
+        self.field_total = 0
+
+    def add(self, predicted: list, expected: list) -> dict:
+        score = score_tickets(predicted, expected)
+        self.correct += score["correct"]
+        self.total += score["total"]
+        self.samples += 1
+        self.count_ok += score["count_ok"]
+        for field, value in score["per_field"].items():
+            self.field_correct[field] += value
+        self.field_total += max(len(predicted), len(expected))
+        return score
+
+    def summary(self) -> dict:
+        return {
+            "field_accuracy": self.correct / self.total if self.total else 0.0,
+            "ticket_count_accuracy": self.count_ok / self.samples if self.samples else 0.0,
+            "per_field": {
+                field: value / self.field_total if self.field_total else 0.0
+                for field, value in self.field_correct.items()
+            },
+        }
+
+
+# -- statistik ------------------------------------------------------------
+def percentile(values: list, q: float) -> float:
+    """Persentil q (0-100), interpolasi linear seperti numpy.percentile."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def latency_summary(seconds: list) -> dict:
+    return {
+        "p50_ms": round(1000 * percentile(seconds, 50), 2),
+        "p95_ms": round(1000 * percentile(seconds, 95), 2),
+        "p99_ms": round(1000 * percentile(seconds, 99), 2),
+        "mean_ms": round(1000 * sum(seconds) / len(seconds), 2) if seconds else math.nan,
+    }
+
+
+def git_commit() -> str:
+    """Commit HEAD (pendek) agar hasil benchmark bisa dibandingkan antar commit."""
+    import subprocess
+
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_summary(path: str, summary: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+        f.write("\n")
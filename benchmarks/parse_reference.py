@@ -0,0 +1,153 @@
+# benchmarks/parse_reference.py
+"""
+Salinan beku parser sebelum mesin parsing baru (regex terkompilasi, satu pass
+tokenisasi, pemindai JSON raw_decode). Hanya dipakai bench_parsers.py --check
+sebagai pembanding perilaku; jangan diperbaiki di sini.
+"""
+import json
+import logging
+import re
+
+from parse_ticket import map_station_names
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_parse_single_ticket_text(text: str) -> dict:
+    """
+    Parsing khusus single ticket (hasil OCR raw text).
+    Return dict: { date, departure_station, arrival_station, departure_time, arrival_time, price }
+    """
+    data = {
+        "date": "",
+        "departure_station": "",
+        "arrival_station": "",
+        "departure_time": "",
+        "arrival_time": "",
+        "price": ""
+    }
+
+    # 1) Tanggal
+    match_date = re.search(r"\d{4}[./]\d{2}[./]\d{2}", text)
+    if match_date:
+        data["date"] = match_date.group(0)
+
+    # 2) Stasiun (cari pattern "xxx -> yyy" dengan kemungkinan separator yang berbeda)
+    match_stations = re.search(r"(.+?)\s*(?:\+|->|to|→|至)\s*(.+)", text, re.IGNORECASE)
+    if match_stations:
+        departure_raw = match_stations.group(1).strip()
+        arrival_raw = match_stations.group(2).strip()
+
+        # Hapus digit
+        dep_clean = re.sub(r'\d+', '', departure_raw).strip()
+        arr_clean = re.sub(r'\d+', '', arrival_raw).strip()
+
+        # Ambil hanya huruf Latin + spasi
+        dep_alphabet = re.sub(r'[^A-Za-z ]+', '', dep_clean).strip()
+        arr_alphabet = re.sub(r'[^A-Za-z ]+', '', arr_clean).strip()
+
+        if dep_alphabet:
+            data["departure_station"] = dep_alphabet
+        if arr_alphabet:
+            data["arrival_station"] = arr_alphabet
+
+    # Fallback: jika masih kosong, gunakan ekstraksi dari kata yang diawali huruf kapital
+    if not data["departure_station"] or not data["arrival_station"]:
+        stations_capital = re.findall(r"\b[A-Z][a-z]{4,}\b", text)
+        excluded_words = {"Train", "Car", "Seat", "PSGR", "Ticket", "Time", "None"}
+        stations_capital = [w for w in stations_capital if w not in excluded_words]
+
+        if stations_capital:
+            if not data["departure_station"]:
+                data["departure_station"] = stations_capital[0]
+            if len(stations_capital) > 1 and not data["arrival_station"]:
+                data["arrival_station"] = stations_capital[1]
+
+    # Logika tambahan: ekstrak stasiun bertuliskan Taiwan (karakter Cina) jika salah satu masih kosong
+    if not data["departure_station"] or not data["arrival_station"]:
+        # Cari pola dengan karakter Cina dan separator yang sama
+        match_tw = re.search(r"([\u4e00-\u9fff]+)\s*(?:\+|->|to|→|至)\s*([\u4e00-\u9fff]+)", text)
+        if match_tw:
+            if not data["departure_station"]:
+                data["departure_station"] = match_tw.group(1).strip()
+            if not data["arrival_station"]:
+                data["arrival_station"] = match_tw.group(2).strip()
+
+    # 3) Waktu
+    times = re.findall(r"(\d{1,2}[:：]\d{2})", text)
+    times = [t.replace("：", ":") for t in times]
+    if len(times) > 0:
+        data["departure_time"] = times[0]
+    if len(times) > 1:
+        data["arrival_time"] = times[1]
+
+    # 4) Harga
+    match_price = re.search(r"(?:NT\$?\s?(\d+)|(\d+)\s*元)", text)
+    if match_price:
+        data["price"] = match_price.group(1) if match_price.group(1) else match_price.group(2)
+
+    return data
+
+def legacy_parse_multi_ticket_json(raw_json: str):
+    """
+    1) Bersihkan markdown
+    2) Parse JSON jadi list of dict
+    3) Jika departure_station adalah Chinese & cocok di startStaName, ganti dengan startStaEName
+       Jika arrival_station adalah Chinese & cocok di endStaName, ganti dengan endStaEName
+       Kalau tidak cocok, biarkan apa adanya.
+    """
+
+    import re
+    import json
+
+    # (a) Bersihkan format markdown
+    cleaned = raw_json.replace("```", "").replace("json\n", "").strip()
+
+    # Hapus teks yang tidak diinginkan (jika ada).
+    # Contoh, kalau Qwen memunculkan tambahan keterangan di luar JSON
+    # Anda bisa pakai regex atau .split() dsb.
+    cleaned = re.sub(r"(?m)^\s*[-—]*\s*票據文本如下：\s*\n", "", cleaned).strip()
+
+    # (b) Coba parse JSON dengan beberapa fallback
+    parsed = None
+    try:
+        # Jika langsung berupa array JSON
+        if cleaned.startswith("["):
+            parsed = json.loads(cleaned)
+
+        # Jika langsung berupa object JSON
+        elif cleaned.startswith("{"):
+            # Periksa apakah ada beberapa objek
+            json_objects = re.findall(r'\{.*?\}', cleaned, re.DOTALL)
+
+            if len(json_objects) == 1:
+                parsed = json.loads(json_objects[0])
+            else:
+                # Jika ada beberapa object JSON, parse semuanya lalu jadikan list
+                parsed_list = []
+                for obj in json_objects:
+                    try:
+                        parsed_list.append(json.loads(obj))
+                    except:
+                        pass
+                parsed = parsed_list if parsed_list else []
+        else:
+            # Terakhir, coba parse langsung
+            parsed = json.loads(cleaned)
+
+    except json.JSONDecodeError:
+        # Kalau tetap gagal parse, Anda bisa memutuskan mau return apa
+        # supaya aplikasi tidak langsung crash
+        logger.warning("Gagal decode JSON dari output model.")
+        return []  # fallback: kosong saja
+
+    # (c) Normalisasi => pastikan `parsed` berbentuk list
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    elif not isinstance(parsed, list):
+        # Kalau aneh, ya fallback jadi list kosong
+        parsed = []
+
+    # (d) Cocokkan departure_station & arrival_station ke data stasiun
+    map_station_names(parsed)
+    return parsed
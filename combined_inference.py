@@ -0,0 +1,300 @@
+# combined_inference.py
+import contextvars
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from image_preprocess import load_image, preprocess_signature
+
+# Import dari file lain
+from inference_core import generate_texts, stream_text
+from json_constraint import grammar_signature
+from model_loader import model_version
+from prefix_cache import prefix_signature
+from result_cache import make_key, sha256_bytes, sha256_file
+from single_inference import SINGLE_PROMPT, SINGLE_MAX_NEW_TOKENS, parse_single_output
+from multi_inference import MULTI_PROMPT, multi_token_budget, parse_multi_output, stream_multi_output
+from ticket_detector import TICKET_SPLIT, analyze_tickets, crop_ticket, detector_signature
+
+logger = logging.getLogger(__name__)
+
+
+def as_ticket_list(parsed) -> list:
+    """Hasil single/multi bisa dict atau list; samakan jadi list."""
+    if isinstance(parsed, dict):
+        return [parsed]
+    return parsed
+
+
+def cache_version() -> str:
+    """Versi model + preprocessing + urutan prompt + mode decoding; bagian dari setiap kunci ResultCache."""
+    return f"{model_version()}|{preprocess_signature()}|{prefix_signature()}|{grammar_signature()}"
+
+
+def cache_keys(image_path: str, prompts: list, limits: list, image_sha: str = None) -> list:
+    """Kunci ResultCache untuk setiap prompt atas isi file image_path."""
+    image_sha = image_sha or sha256_file(image_path)
+    version = cache_version()
+    return [make_key(image_sha, prompt, limit, version) for prompt, limit in zip(prompts, limits)]
+
+
+def find_tickets(image) -> tuple:
+    """
+    (kotak tiap tiket dalam urutan baca, perkiraan jumlah tiket) jika
+    TICKET_SPLIT aktif, else ([], None).
+    """
+    if not TICKET_SPLIT:
+        return [], None
+    boxes, tickets = analyze_tickets(image)
+    if boxes:
+        logger.info("Ticket split: prompt single per potongan tiket.", extra={"tickets": len(boxes)})
+    return boxes, tickets
+
+
+def load_layout(image_path: str, image_sha: str = None, cache=None, data: bytes = None):
+    """
+    (image atau None, boxes, perkiraan jumlah tiket). Layout tiket diambil dari
+    `cache` bila ada, sehingga cache hit penuh tidak perlu decode image sama sekali.
+    `data` = isi file yang sudah di memori (lihat load_image).
+    """
+    if not TICKET_SPLIT:
+        return None, [], None
+    key = None
+    if cache is not None:
+        key = make_key(image_sha, f"layout|{detector_signature()}", 0, cache_version())
+        cached = cache.get(key)
+        if cached is not None:
+            layout = json.loads(cached)
+            # Entri lama hanya berisi list kotak (tanpa perkiraan jumlah tiket)
+            if isinstance(layout, dict):
+                return None, [tuple(box) for box in layout["boxes"]], layout["tickets"]
+    image = load_image(image_path, data)
+    boxes, tickets = find_tickets(image)
+    if cache is not None:
+        cache.put(key, json.dumps({"boxes": boxes, "tickets": tickets}))
+    return image, boxes, tickets
+
+
+def plan_requests(boxes: list, tickets: int = None) -> list:
+    """
+    Daftar (prompt, max_new_tokens, box) untuk satu image:
+      - tanpa split: single + multi atas image penuh; anggaran token multi
+        mengikuti perkiraan jumlah tiket (multi_token_budget)
+      - dengan split: single atas image penuh + single per potongan tiket,
+        menggantikan satu decode multi yang panjang dengan beberapa decode pendek paralel
+    """
+    requests = [(SINGLE_PROMPT, SINGLE_MAX_NEW_TOKENS, None)]
+    if not boxes:
+        return requests + [(MULTI_PROMPT, multi_token_budget(tickets), None)]
+    return requests + [(SINGLE_PROMPT, SINGLE_MAX_NEW_TOKENS, tuple(box)) for box in boxes]
+
+
+def request_prompt_key(prompt: str, box) -> str:
+    """Prompt untuk kunci cache; potongan tiket dibedakan lewat koordinatnya."""
+    if box is None:
+        return prompt
+    return f"{prompt}\ncrop={','.join(str(v) for v in box)}"
+
+
+def request_image(image, box):
+    return image if box is None else crop_ticket(image, box)
+
+
+def parse_planned(requests: list, raw: list):
+    """Teks mentah sesuai plan_requests => (single_data, multi_data)."""
+    if requests[1][2] is None:
+        return parse_outputs(raw[0], raw[1])
+    return parse_split_outputs(raw[0], raw[1:])
+
+
+def image_digest(image_path: str, cache=None, image_sha: str = None, data: bytes = None):
+    """SHA-256 isi image untuk kunci cache (None tanpa cache); dihitung dari `data` bila ada."""
+    if cache is None or image_sha:
+        return image_sha
+    return sha256_bytes(data) if data is not None else sha256_file(image_path)
+
+
+def process_ticket(image_path: str, generate_fn=generate_texts, cache=None, image_sha: str = None,
+                   data: bytes = None):
+    """
+    Satu kali inference untuk SINGLE dan MULTI sekaligus.
+    1) Cek file
+    2) Deteksi tiket (ticket_detector): jika ada >= 2 tiket, prompt multi
+       diganti prompt single per potongan tiket (plan_requests)
+    3) Ambil teks mentah dari `cache` (ResultCache, opsional) jika ada
+    4) Sisanya: buka & encode image sekali, semua prompt dalam satu batch
+       model.generate, lalu simpan ke cache
+    5) Parse masing-masing seperti process_single_ticket / process_multi_ticket
+    `generate_fn` bisa diganti, mis. BatchScheduler.generate agar prompt ini
+    tergabung dengan upload lain dalam satu batch. `image_sha` (SHA-256 yang
+    sudah dihitung saat upload) dan `data` (isi file di memori) menghindari
+    membaca ulang file.
+    Return (single_data, multi_data), keduanya list of dict.
+    """
+    if data is None and not os.path.isfile(image_path):
+        raise FileNotFoundError(f"File {image_path} not found.")
+
+    image_sha = image_digest(image_path, cache, image_sha, data)
+    image, boxes, tickets = load_layout(image_path, image_sha, cache, data)
+    requests = plan_requests(boxes, tickets)
+    return parse_planned(
+        requests, generate_planned(image_path, image, requests, generate_fn, cache, image_sha, data)
+    )
+
+
+def generate_planned(image_path: str, image, requests: list, generate_fn=generate_texts, cache=None,
+                     image_sha: str = None, data: bytes = None) -> list:
+    """
+    Teks mentah untuk setiap entri plan_requests: dari `cache` bila ada,
+    sisanya dalam satu pemanggilan generate_fn (image dibuka hanya jika perlu).
+    """
+    raw = [None] * len(requests)
+    keys = None
+    if cache is not None:
+        keys = cache_keys(
+            image_path,
+            [request_prompt_key(prompt, box) for prompt, _, box in requests],
+            [limit for _, limit, _ in requests],
+            image_sha=image_sha,
+        )
+        raw = [cache.get(key) for key in keys]
+
+    missing = [i for i, text in enumerate(raw) if text is None]
+    if missing:
+        if image is None:
+            image = load_image(image_path, data)
+        outputs = generate_fn(
+            [request_image(image, requests[i][2]) for i in missing],
+            [requests[i][0] for i in missing],
+            [requests[i][1] for i in missing],
+        )
+        for i, text in zip(missing, outputs):
+            raw[i] = text
+            if cache is not None:
+                cache.put(keys[i], text)
+    return raw
+
+
+def process_images(images: list, generate_fn=generate_texts) -> list:
+    """
+    Seperti process_ticket untuk beberapa image yang sudah dibuka sekaligus:
+    semua prompt (single + multi, atau single per potongan tiket) untuk semua
+    image dalam satu pemanggilan generate_fn.
+    Return list (single_data, multi_data), urutannya sama dengan images.
+    """
+    if not images:
+        return []
+    plans = [plan_requests(*find_tickets(image)) for image in images]
+    batch_images, prompts, limits = [], [], []
+    for image, requests in zip(images, plans):
+        for prompt, limit, box in requests:
+            batch_images.append(request_image(image, box))
+            prompts.append(prompt)
+            limits.append(limit)
+    outputs = generate_fn(batch_images, prompts, limits)
+
+    results, offset = [], 0
+    for requests in plans:
+        results.append(parse_planned(requests, outputs[offset:offset + len(requests)]))
+        offset += len(requests)
+    return results
+
+
+def parse_outputs(raw_single: str, raw_multi: str):
+    """Teks mentah single & multi => (single_data, multi_data), keduanya list of dict."""
+    single_data = as_ticket_list(parse_single_output(raw_single))
+    multi_data = as_ticket_list(parse_multi_output(raw_multi))
+    return single_data, multi_data
+
+
+def parse_split_outputs(raw_single: str, raw_crops: list):
+    """
+    Teks mentah single (image penuh) & single per potongan tiket =>
+    (single_data, multi_data). multi_data mengikuti urutan baca potongan;
+    potongan tanpa tanggal maupun stasiun dibuang.
+    """
+    single_data = as_ticket_list(parse_single_output(raw_single))
+    multi_data = []
+    for raw_crop in raw_crops:
+        for ticket in as_ticket_list(parse_single_output(raw_crop)):
+            if ticket.get("date") or ticket.get("departure_station") or ticket.get("arrival_station"):
+                multi_data.append(ticket)
+    return single_data, multi_data
+
+
+def stream_ticket(image_path: str, generate_fn=generate_texts, cache=None, image_sha: str = None,
+                  data: bytes = None):
+    """
+    Versi streaming process_ticket.
+    Prompt multi di-stream token demi token (stream_text), sementara prompt
+    single berjalan paralel; keduanya lewat `generate_fn` (mis.
+    BatchScheduler.generate, sehingga tergabung dalam satu batch).
+    Jika kedua teks sudah ada di `cache`, tiket langsung dikirim tanpa generate.
+    Foto yang terdeteksi berisi beberapa tiket tidak di-stream: semua potongan
+    (decode pendek) berjalan dalam satu batch, lalu tiketnya dikirim berurutan.
+    Yield:
+      ("ticket", dict)                      tiap tiket multi begitu objeknya lengkap
+      ("result", (single_data, multi_data)) terakhir, sama dengan return process_ticket
+    """
+    if data is None and not os.path.isfile(image_path):
+        raise FileNotFoundError(f"File {image_path} not found.")
+
+    image_sha = image_digest(image_path, cache, image_sha, data)
+    image, boxes, tickets = load_layout(image_path, image_sha, cache, data)
+    requests = plan_requests(boxes, tickets)
+    if boxes:
+        single_data, multi_data = parse_planned(
+            requests, generate_planned(image_path, image, requests, generate_fn, cache, image_sha, data)
+        )
+        for ticket in multi_data:
+            yield "ticket", ticket
+        yield "result", (single_data, multi_data)
+        return
+
+    keys = None
+    if cache is not None:
+        keys = cache_keys(
+            image_path, [prompt for prompt, _, _ in requests], [limit for _, limit, _ in requests], image_sha=image_sha
+        )
+        cached = [cache.get(key) for key in keys]
+        if None not in cached:
+            single_data, multi_data = parse_outputs(*cached)
+            for ticket in multi_data:
+                yield "ticket", ticket
+            yield "result", (single_data, multi_data)
+            return
+
+    # Sudah ter-decode penuh oleh preprocessing; aman dipakai dua thread sekaligus
+    if image is None:
+        image = load_image(image_path, data)
+
+    single_future = Future()
+
+    def run_single():
+        try:
+            single_future.set_result(generate_fn([image], [SINGLE_PROMPT], [SINGLE_MAX_NEW_TOKENS])[0])
+        except Exception as exc:
+            single_future.set_exception(exc)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run_single,), name="single-generate", daemon=True).start()
+
+    chunks = []
+
+    def collect(stream):
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+
+    multi_limit = requests[1][1]
+    for ticket in stream_multi_output(collect(stream_text(image, MULTI_PROMPT, multi_limit, generate_fn))):
+        yield "ticket", ticket
+
+    # Hasil akhir di-parse dari teks lengkap, sama seperti jalur non-streaming
+    raw_multi = "".join(chunks).strip()
+    raw_single = single_future.result()
+    if cache is not None:
+        cache.put(keys[0], raw_single)
+        cache.put(keys[1], raw_multi)
+    yield "result", parse_outputs(raw_single, raw_multi)
@@ -0,0 +1,167 @@
+# early_stop.py
+"""
+Early stopping untuk model.generate: setiap baris batch berhenti begitu
+isinya lengkap, tanpa menunggu EOS atau max_new_tokens.
+
+  - prompt single: setelah baris teks yang melengkapi tanggal, stasiun, dua
+                   waktu dan harga (parse_ticket.single_ticket_complete)
+  - prompt multi:  begitu array JSON top-level ditutup (JsonArrayTracker),
+                   jadi pagar markdown / penjelasan sesudahnya tidak di-decode
+  - semua baris:   di max_new_tokens miliknya sendiri. generate_texts memakai
+                   batas terbesar di batch, jadi tanpa ini baris dengan batas
+                   kecil ikut decode sampai batas baris lain
+
+Pemeriksa didaftarkan per prompt lewat stop_when() (single_inference,
+multi_inference) dan hanya menerima teks baru per langkah. Baris yang
+sudah berhenti diisi token pad oleh generate; generate selesai begitu semua
+baris berhenti. Langkah decode yang dihemat masuk metrik
+ticket_decode_steps_saved_total / ticket_generate_rows_total{reason};
+ringkasan per pemanggilan generate di-log di level DEBUG.
+Diatur lewat EARLY_STOP (1/0).
+"""
+import logging
+import os
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from model_loader import special_token_ids
+from telemetry import DECODE_STEPS_SAVED, GENERATE_ROWS
+
+logger = logging.getLogger(__name__)
+
+EARLY_STOP = os.getenv("EARLY_STOP", "1") == "1"
+
+
+class TextCheck:
+    """
+    Pemeriksa per baris untuk fungsi `complete(text) -> bool` atas seluruh
+    teks yang sudah di-generate (mis. single_ticket_complete).
+    """
+
+    def __init__(self, complete):
+        self.complete = complete
+        self.text = ""
+
+    def update(self, chunk: str) -> bool:
+        self.text += chunk
+        return self.complete(self.text)
+
+
+class StreamCheck:
+    """
+    Pemeriksa per baris untuk parser inkremental dengan feed(chunk) -> bool
+    (mis. JsonArrayTracker).
+    """
+
+    def __init__(self, factory):
+        self.parser = factory()
+
+    def update(self, chunk: str) -> bool:
+        return self.parser.feed(chunk)
+
+
+_checks = {}
+
+
+def stop_when(prompt: str, make_check):
+    """
+    Daftarkan pemeriksa untuk `prompt`: make_check() membuat satu pemeriksa
+    baru (punya update(chunk) -> bool, chunk = teks baru) per baris generate.
+    """
+    _checks[prompt] = make_check
+
+
+class TicketStoppingCriteria(StoppingCriteria):
+    """
+    Hentikan baris yang pemeriksanya menyatakan lengkap atau yang sudah
+    mencapai batasnya sendiri. Alasan berhenti per baris disimpan untuk
+    report().
+
+    Setiap langkah hanya token baru baris yang diperiksa yang di-decode
+    (biasanya satu), jadi biayanya linear terhadap panjang output. Potongan
+    yang belum menjadi karakter utuh (kosong / berakhir U+FFFD, mis. byte
+    UTF-8 yang terbelah antar token) ditahan sampai token berikutnya
+    melengkapinya.
+    """
+
+    def __init__(self, tokenizer, checks: list, limits: list, prompt_len: int, end_ids: set):
+        self.tokenizer = tokenizer
+        self.checks = checks
+        self.limits = limits
+        self.prompt_len = prompt_len
+        self.end_ids = end_ids
+        # Per baris: (alasan, jumlah token) begitu berhenti
+        self.stopped = [None] * len(limits)
+        # Per baris: jumlah token yang sudah dibaca + token yang belum jadi teks
+        self._seen = [0] * len(limits)
+        self._pending = [[] for _ in limits]
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> torch.BoolTensor:
+        generated = input_ids.shape[1] - self.prompt_len
+        last = input_ids[:, -1].tolist()
+        active = []
+        for row, token_id in enumerate(last):
+            if self.stopped[row] is not None:
+                continue
+            if token_id in self.end_ids:
+                self.stopped[row] = ("eos", generated)
+            elif generated >= self.limits[row]:
+                self.stopped[row] = ("limit", generated)
+            elif self.checks[row] is not None:
+                active.append(row)
+        if active:
+            for row in active:
+                new_ids = input_ids[row, self.prompt_len + self._seen[row]:].tolist()
+                self._seen[row] += len(new_ids)
+                self._pending[row].extend(new_ids)
+            chunks = self.tokenizer.batch_decode(
+                [self._pending[row] for row in active], skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
+            for row, chunk in zip(active, chunks):
+                if not chunk or chunk.endswith("\ufffd"):
+                    continue
+                self._pending[row] = []
+                if self.checks[row].update(chunk):
+                    self.stopped[row] = ("complete", generated)
+        return torch.tensor([s is not None for s in self.stopped], dtype=torch.bool, device=input_ids.device)
+
+    def report(self, steps: int) -> dict:
+        """
+        Catat metrik (+ log DEBUG) untuk satu pemanggilan generate yang berjalan `steps`
+        langkah decode; return ringkasan dict.
+        """
+        budget = max(self.limits)
+        rows = []
+        for stopped, limit in zip(self.stopped, self.limits):
+            reason, used = stopped or ("limit", steps)
+            GENERATE_ROWS.inc(1, reason)
+            rows.append({"reason": reason, "tokens": used, "limit": limit})
+        saved = max(0, budget - steps)
+        DECODE_STEPS_SAVED.inc(saved)
+        summary = {
+            "steps": steps,
+            "budget": budget,
+            "saved_steps": saved,
+            "stopped_early": sum(r["reason"] == "complete" for r in rows),
+        }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("generate selesai", extra=dict(summary, rows=rows))
+        return summary
+
+
+def stopping_criteria_for(prompts: list, limits: list, model, processor, prompt_len: int):
+    """StoppingCriteriaList untuk batch ini, atau None jika EARLY_STOP nonaktif."""
+    if not EARLY_STOP:
+        return None
+    tokenizer = getattr(processor, "tokenizer", processor)
+    end_ids = special_token_ids(model, processor) | special_token_ids(model, processor, "pad_token_id")
+    checks = [_checks[prompt]() if prompt in _checks else None for prompt in prompts]
+    return StoppingCriteriaList([TicketStoppingCriteria(tokenizer, checks, list(limits), prompt_len, end_ids)])
+
+
+def report(stopping_criteria, steps: int):
+    """Ringkasan langkah yang dihemat (lihat TicketStoppingCriteria.report), jika aktif."""
+    if stopping_criteria:
+        return stopping_criteria[0].report(steps)
+    return None
@@ -0,0 +1,169 @@
+# image_preprocess.py
+"""
+Tahap preprocessing sebelum image masuk ke process_vision_info.
+
+Foto ponsel 12 MP menjadi belasan ribu token visual di Qwen2.5-VL (satu token
+per 28x28 piksel), padahal tiketnya hanya sebagian kecil foto. Di sini image:
+  1) diputar sesuai EXIF orientation
+  2) dikonversi ke RGB sekali
+  3) dipotong ke area bertepi (Canny OpenCV), membuang latar polos di sekitarnya
+  4) diperkecil (INTER_AREA) agar luasnya <= max_pixels (atau diperbesar ke min_pixels)
+
+Batas diatur lewat IMAGE_MIN_PIXELS / IMAGE_MAX_PIXELS / IMAGE_AUTO_CROP.
+Token vision sebelum / sesudah masuk metrik ticket_vision_tokens_total{when};
+rincian per image di-log di level DEBUG.
+"""
+import io
+import logging
+import math
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from telemetry import VISION_TOKENS, stage
+
+logger = logging.getLogger(__name__)
+
+# Konstanta resize Qwen2.5-VL (patch 14 x merge 2 => 28 piksel per token)
+PATCH_FACTOR = 28
+QWEN_MIN_PIXELS = 4 * PATCH_FACTOR * PATCH_FACTOR
+QWEN_MAX_PIXELS = 16384 * PATCH_FACTOR * PATCH_FACTOR
+
+IMAGE_MIN_PIXELS = int(os.getenv("IMAGE_MIN_PIXELS", str(256 * PATCH_FACTOR * PATCH_FACTOR)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(1024 * PATCH_FACTOR * PATCH_FACTOR)))
+IMAGE_AUTO_CROP = os.getenv("IMAGE_AUTO_CROP", "1") == "1"
+
+
+def smart_resize(height: int, width: int, min_pixels: int = QWEN_MIN_PIXELS, max_pixels: int = QWEN_MAX_PIXELS):
+    """Ukuran (h, w) yang dipakai processor Qwen: kelipatan 28, luas dalam [min, max]."""
+    h_bar = max(PATCH_FACTOR, round(height / PATCH_FACTOR) * PATCH_FACTOR)
+    w_bar = max(PATCH_FACTOR, round(width / PATCH_FACTOR) * PATCH_FACTOR)
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(PATCH_FACTOR, math.floor(height / beta / PATCH_FACTOR) * PATCH_FACTOR)
+        w_bar = max(PATCH_FACTOR, math.floor(width / beta / PATCH_FACTOR) * PATCH_FACTOR)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / PATCH_FACTOR) * PATCH_FACTOR
+        w_bar = math.ceil(width * beta / PATCH_FACTOR) * PATCH_FACTOR
+    return h_bar, w_bar
+
+
+def vision_token_count(width: int, height: int, min_pixels: int = QWEN_MIN_PIXELS,
+                       max_pixels: int = QWEN_MAX_PIXELS) -> int:
+    """Jumlah token visual yang dihasilkan processor Qwen untuk image berukuran ini."""
+    h_bar, w_bar = smart_resize(height, width, min_pixels, max_pixels)
+    return (h_bar // PATCH_FACTOR) * (w_bar // PATCH_FACTOR)
+
+
+def find_ticket_region(rgb: np.ndarray, outlier_ratio: float = 0.002, margin_ratio: float = 0.02):
+    """
+    Kotak (x0, y0, x1, y1) yang memuat semua konten bertepi (tiket, teks) di
+    image, atau None jika tidak ada tepi sama sekali. Yang dibuang hanya latar
+    polos di sekelilingnya, jadi foto multi-tiket tidak terpotong. Sebagian kecil
+    piksel tepi terluar (`outlier_ratio`, noise/debu) diabaikan.
+    """
+    height, width = rgb.shape[:2]
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    # Deteksi tepi di resolusi kecil: cukup untuk mencari batas tiket, jauh lebih cepat
+    scale = min(1.0, 800.0 / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    edges = cv2.Canny(blurred, 30, 90)
+    edges = cv2.dilate(edges, np.ones((5, 5), np.uint8), iterations=2)
+
+    ys, xs = np.nonzero(edges)
+    if xs.size == 0:
+        return None
+    low, high = 100 * outlier_ratio, 100 * (1 - outlier_ratio)
+    x0, x1 = np.percentile(xs, [low, high])
+    y0, y1 = np.percentile(ys, [low, high])
+
+    margin_x, margin_y = margin_ratio * small.shape[1], margin_ratio * small.shape[0]
+    x0 = max(0, int((x0 - margin_x) / scale))
+    y0 = max(0, int((y0 - margin_y) / scale))
+    x1 = min(width, int(math.ceil((x1 + 1 + margin_x) / scale)))
+    y1 = min(height, int(math.ceil((y1 + 1 + margin_y) / scale)))
+    return x0, y0, x1, y1
+
+
+def preprocess_image(image: Image.Image, min_pixels: int = None, max_pixels: int = None,
+                     auto_crop: bool = None):
+    """
+    Return (image RGB hasil preprocessing, info). `info` berisi ukuran dan
+    jumlah token visual sebelum (batas default Qwen) dan sesudah preprocessing.
+    """
+    min_pixels = IMAGE_MIN_PIXELS if min_pixels is None else min_pixels
+    max_pixels = IMAGE_MAX_PIXELS if max_pixels is None else max_pixels
+    auto_crop = IMAGE_AUTO_CROP if auto_crop is None else auto_crop
+
+    original_size = image.size
+    tokens_before = vision_token_count(*original_size)
+
+    image = ImageOps.exif_transpose(image)
+    rgb = np.asarray(image.convert("RGB"))
+
+    cropped = False
+    if auto_crop:
+        region = find_ticket_region(rgb)
+        if region is not None:
+            x0, y0, x1, y1 = region
+            # Hanya potong jika benar-benar membuang latar (>= 5% luas)
+            if (x1 - x0) * (y1 - y0) <= 0.95 * rgb.shape[0] * rgb.shape[1]:
+                rgb = rgb[y0:y1, x0:x1]
+                cropped = True
+
+    height, width = rgb.shape[:2]
+    if height * width > max_pixels:
+        scale = math.sqrt(max_pixels / (height * width))
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+    elif height * width < min_pixels:
+        # Crop kecil diperbesar di sini agar hitungan token sama dengan processor
+        scale = math.sqrt(min_pixels / (height * width))
+        size = (int(math.ceil(width * scale)), int(math.ceil(height * scale)))
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_CUBIC)
+
+    result = Image.fromarray(np.ascontiguousarray(rgb))
+    info = {
+        "original_size": original_size,
+        "size": result.size,
+        "cropped": cropped,
+        "tokens_before": tokens_before,
+        "tokens_after": vision_token_count(*result.size, min_pixels=min_pixels, max_pixels=max_pixels),
+    }
+    return result, info
+
+
+def preprocess_signature() -> str:
+    """Pengaturan preprocessing aktif; ikut kunci result cache karena mengubah input model."""
+    return f"min={IMAGE_MIN_PIXELS},max={IMAGE_MAX_PIXELS},crop={int(IMAGE_AUTO_CROP)}"
+
+
+def load_image(image_path: str, data: bytes = None, **kwargs) -> Image.Image:
+    """
+    Buka file image lalu preprocess; dipakai semua jalur inference. Jika
+    `data` (isi file yang sudah ada di memori) diberikan, file tidak dibaca.
+    """
+    with Image.open(io.BytesIO(data) if data is not None else image_path) as image:
+        with stage("image_open"):
+            image.load()
+        with stage("image_preprocess"):
+            result, info = preprocess_image(image, **kwargs)
+    VISION_TOKENS.inc(info["tokens_before"], "before")
+    VISION_TOKENS.inc(info["tokens_after"], "after")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "preprocess",
+            extra={
+                "image": os.path.basename(image_path),
+                "original_size": info["original_size"],
+                "size": info["size"],
+                "tokens_before": info["tokens_before"],
+                "tokens_after": info["tokens_after"],
+                "cropped": info["cropped"],
+            },
+        )
+    return result
@@ -0,0 +1,229 @@
+# inference_core.py
+"""
+Langkah generate Qwen yang dipakai bersama oleh single_inference,
+multi_inference dan combined_inference.
+
+Semua model.generate lewat generate_texts di bawah satu lock: model (mis.
+rope_deltas Qwen2.5-VL dan cache KV awalan) menyimpan state per pemanggilan,
+jadi dua generate yang tumpang tindih saling merusak. Streaming (stream_text)
+juga lewat generate_texts, sehingga ikut batch BatchScheduler.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+from PIL import Image
+
+from early_stop import report as report_early_stop, stopping_criteria_for
+from json_constraint import logits_processor_for
+from model_loader import backend_name, get_model, special_token_ids
+from prefix_cache import apply as apply_prefix_cache, enabled as prefix_cache_enabled, text_first
+from telemetry import TokenTimer, stage
+
+# Fungsi Qwen
+from qwen_vl_utils import process_vision_info
+
+
+def build_messages(image, prompt: str) -> list:
+    """
+    Format chat Qwen: satu pesan user berisi image dan prompt teks. Dengan
+    PROMPT_TEXT_FIRST teks ditaruh lebih dulu agar awalan prompt yang di-cache
+    (prefix_cache) panjang; tanpa itu image lalu teks seperti semula.
+    """
+    content = [{"type": "image", "image": image}, {"type": "text", "text": prompt}]
+    if text_first():
+        content.reverse()
+    return [{"role": "user", "content": content}]
+
+
+def encode_images(images: list) -> list:
+    """
+    Jalankan process_vision_info sekali per objek image unik.
+    Image yang sama (mis. satu foto dengan dua prompt) hanya di-resize sekali.
+    """
+    encoded = {}
+    result = []
+    for image in images:
+        key = id(image)
+        if key not in encoded:
+            image_inputs, _ = process_vision_info(build_messages(image, ""))
+            encoded[key] = image_inputs[0]
+        result.append(encoded[key])
+    return result
+
+
+def prepare_inputs(processor, device, images: list, prompts: list):
+    """Chat template + encode image + tensorisasi processor untuk satu batch."""
+    with stage("chat_template"):
+        texts = [
+            processor.apply_chat_template(build_messages(image, prompt), tokenize=False, add_generation_prompt=True)
+            for image, prompt in zip(images, prompts)
+        ]
+    with stage("vision_info"):
+        image_inputs = encode_images(images)
+
+    # Batch generate butuh left padding agar token baru menempel di ujung prompt
+    tokenizer = getattr(processor, "tokenizer", processor)
+    tokenizer.padding_side = "left"
+    with stage("tensorize"):
+        return processor(
+            text=texts,
+            images=image_inputs,
+            videos=None,
+            padding=True,
+            return_tensors="pt"
+        ).to(device)
+
+
+# Satu generate per model pada satu waktu (lihat docstring modul)
+_generate_lock = threading.Lock()
+
+
+def warmup_prefix_cache(prompts: list):
+    """Hitung KV awalan setiap prompt sebelum request pertama (dengan image kosong kecil)."""
+    if not prefix_cache_enabled():
+        return
+    model, processor, device = get_model()
+    image = Image.new("RGB", (56, 56), "white")
+    inputs = prepare_inputs(processor, device, [image] * len(prompts), prompts)
+    with _generate_lock:
+        apply_prefix_cache(model, processor, inputs)
+
+
+class RowStreamer:
+    """
+    Streamer model.generate untuk batch: teks baru baris yang punya callback
+    di `on_text` dikirim per langkah decode. Seperti TicketStoppingCriteria,
+    token yang belum menjadi karakter utuh ditahan sampai token berikutnya;
+    baris selesai di-stream setelah EOS / pad atau batasnya sendiri.
+    """
+
+    def __init__(self, tokenizer, on_text: list, limits: list, end_ids: set):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.limits = limits
+        self.end_ids = end_ids
+        self._prompt_seen = False
+        self._tokens = [0] * len(limits)
+        self._done = [callback is None for callback in on_text]
+        self._pending = [[] for _ in limits]
+
+    def put(self, value):
+        # Panggilan pertama = token prompt
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        active = []
+        for row, token_id in enumerate(value.reshape(-1).tolist()):
+            if self._done[row]:
+                continue
+            self._tokens[row] += 1
+            if token_id in self.end_ids or self._tokens[row] > self.limits[row]:
+                self._done[row] = True
+                continue
+            self._pending[row].append(token_id)
+            active.append(row)
+        self._emit(active, final=False)
+
+    def end(self):
+        self._emit([row for row, pending in enumerate(self._pending) if pending], final=True)
+
+    def _emit(self, rows: list, final: bool):
+        if not rows:
+            return
+        chunks = self.tokenizer.batch_decode(
+            [self._pending[row] for row in rows], skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+        for row, chunk in zip(rows, chunks):
+            if not final and (not chunk or chunk.endswith("\ufffd")):
+                continue
+            self._pending[row] = []
+            if chunk:
+                self.on_text[row](chunk)
+
+
+def generate_texts(images: list, prompts: list, max_new_tokens, on_text: list = None) -> list:
+    """
+    Jalankan satu pemanggilan model.generate untuk beberapa pasangan (image, prompt).
+    max_new_tokens boleh int atau list per baris; generate memakai nilai terbesar
+    lalu setiap baris dipotong ke batasnya sendiri (greedy decoding, jadi hasilnya
+    sama dengan generate terpisah).
+    `on_text` (opsional): list per baris berisi callback(chunk) atau None; teks
+    baru baris tersebut dikirim selama generate (lihat RowStreamer).
+    Return list string hasil decode, urutannya sama dengan input.
+    """
+    if len(images) != len(prompts):
+        raise ValueError("images dan prompts harus sama panjang.")
+    if isinstance(max_new_tokens, int):
+        max_new_tokens = [max_new_tokens] * len(prompts)
+
+    model, processor, device = get_model()
+    inputs = prepare_inputs(processor, device, images, prompts)
+    streamer = None
+    if on_text and any(on_text):
+        tokenizer = getattr(processor, "tokenizer", processor)
+        end_ids = special_token_ids(model, processor) | special_token_ids(model, processor, "pad_token_id")
+        streamer = RowStreamer(tokenizer, on_text, max_new_tokens, end_ids)
+    # TokenTimer sebagai streamer: memisahkan waktu prefill dan decode
+    timer = TokenTimer(inner=streamer, backend=backend_name(model))
+    with _generate_lock, torch.no_grad():
+        # KV awalan prompt (system + instruksi) dipakai ulang; prefill hanya image + sisa
+        inputs, past_key_values = apply_prefix_cache(model, processor, inputs)
+        prompt_len = inputs.input_ids.shape[1]
+        # Baris dengan prompt terdaftar (multi) dibatasi ke grammar JSON tiket
+        logits_processor = logits_processor_for(prompts, model, processor, prompt_len)
+        # Setiap baris berhenti begitu isinya lengkap atau batasnya sendiri tercapai
+        stopping_criteria = stopping_criteria_for(prompts, max_new_tokens, model, processor, prompt_len)
+        generated_ids = model.generate(
+            **inputs, max_new_tokens=max(max_new_tokens), streamer=timer, logits_processor=logits_processor,
+            stopping_criteria=stopping_criteria, past_key_values=past_key_values,
+        )
+    timer.record()
+    report_early_stop(stopping_criteria, timer.steps)
+    # Hilangkan token input, lalu potong sesuai batas tiap baris
+    generated_ids_trimmed = [
+        out_ids[prompt_len:prompt_len + limit]
+        for out_ids, limit in zip(generated_ids, max_new_tokens)
+    ]
+    with stage("batch_decode"):
+        output_text = processor.batch_decode(
+            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+
+    return [text.strip() for text in output_text]
+
+
+def stream_text(image, prompt: str, max_new_tokens: int, generate_fn=generate_texts):
+    """
+    Seperti generate_texts untuk satu pasangan (image, prompt), tetapi
+    menghasilkan potongan teks (generator) selama generate berjalan.
+    `generate_fn` (mis. BatchScheduler.generate) harus menerima on_text;
+    dijalankan di thread terpisah, error-nya dilempar ulang setelah stream selesai.
+    """
+    chunks = queue.Queue()
+    result = Future()
+
+    def run_generate():
+        try:
+            result.set_result(generate_fn([image], [prompt], [max_new_tokens], on_text=[chunks.put])[0])
+        except Exception as exc:
+            result.set_exception(exc)
+        finally:
+            # Pastikan iterasi berhenti walau generate gagal
+            chunks.put(None)
+
+    # Konteks (trace ID) ikut ke thread generate
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(run_generate,), name="generate-stream", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        thread.join()
+    result.result()
@@ -0,0 +1,297 @@
+# job_queue.py
+"""
+Antrian job upload + penyimpanan hasil, di atas SQLite (stdlib, tanpa
+layanan luar).
+
+  path ":memory:"  antrian di dalam proses (default): web dan worker model
+                   berjalan di proses yang sama (JobWorker di thread app)
+  path file        antrian bersama antar proses di satu host: proses web
+                   (uvicorn, bisa banyak worker) hanya enqueue, proses
+                   `python job_worker.py --workers N` memuat model dan
+                   mengambil job
+
+Setiap job: id, jenis ("upload" / "stream"), path file image + SHA-256 isinya,
+status (queued -> running -> done / error), hasil JSON atau pesan error.
+Antrian di memori juga bisa membawa isi file (bytes) ke worker, sehingga
+image di-decode dari memori tanpa membaca ulang file. Event per
+job (tiket sementara untuk job stream, lalu "done" / "error") disimpan
+berurutan di job_events sehingga GET /jobs/{id}/events bisa dilayani proses
+web mana pun.
+
+Job "running" yang worker-nya mati (lebih lama dari lease_s) dikembalikan ke
+antrian, paling banyak max_attempts kali. Worker lama yang ternyata masih
+jalan lalu selesai belakangan tidak boleh menimpa hasil percobaan berikutnya:
+finish / fail / add_event dengan `attempt` (nilai attempts dari claim) hanya
+berlaku selama job masih "running" di percobaan itu, selain itu dibuang
+(return False). Job selesai dihapus setelah retention_s.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    file_path   TEXT NOT NULL,
+    image_url   TEXT NOT NULL,
+    image_sha   TEXT,
+    status      TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    trace_id    TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    result      TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq    INTEGER NOT NULL,
+    event  TEXT NOT NULL,
+    data   TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+FINISHED = ("done", "error")
+
+
+class QueueFullError(RuntimeError):
+    """Jumlah job yang menunggu sudah mencapai batas antrian."""
+
+    def __init__(self, retry_after_s: int):
+        super().__init__("Antrian job penuh, coba lagi nanti.")
+        self.retry_after_s = retry_after_s
+
+
+class JobQueue:
+    def __init__(self, path: str = ":memory:", max_queued: int = 64, retry_after_s: int = 5,
+                 lease_s: float = 300.0, max_attempts: int = 2, retention_s: float = 3600.0,
+                 poll_s: float = 0.05):
+        if max_queued < 1:
+            raise ValueError("max_queued minimal 1.")
+        self.path = path
+        self.max_queued = max_queued
+        self.retry_after_s = retry_after_s
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.retention_s = retention_s
+        self.poll_s = poll_s
+        self.shared = path != ":memory:"
+
+        if self.shared:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        # Satu koneksi per objek, dipakai bergantian antar thread lewat _lock;
+        # antar proses SQLite yang mengunci (timeout = tunggu lock)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # Bangunkan claim() di proses yang sama begitu ada job baru
+        self._wakeup = threading.Condition()
+        self._enqueued = 0
+        # Isi file per id job (hanya antrian di memori): {id: bytes}
+        self._blobs = {}
+        self._last_maintenance = 0.0
+        with self._lock:
+            if self.shared:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            # File antrian dari versi sebelum kolom image_sha
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "image_sha" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN image_sha TEXT")
+
+    def _write(self, fn):
+        """Jalankan fn(db) dalam satu transaksi tulis (BEGIN IMMEDIATE)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _read(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # -- producer ----------------------------------------------------------
+    def enqueue(self, kind: str, file_path: str, image_url: str, trace_id: str = None, image_sha: str = None,
+                data: bytes = None) -> str:
+        """
+        Tambahkan job; return id. QueueFullError jika antrian penuh. `data`
+        (isi file) hanya disimpan untuk antrian di memori; worker di proses
+        lain selalu membaca file_path.
+        """
+        job_id = uuid.uuid4().hex
+
+        def insert(db):
+            queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(self.retry_after_s)
+            db.execute(
+                "INSERT INTO jobs (id, kind, file_path, image_url, image_sha, status, trace_id, created_at)"
+                " VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, file_path, image_url, image_sha, trace_id, time.time()),
+            )
+            if data is not None and not self.shared:
+                self._blobs[job_id] = data
+
+        self._write(insert)
+        with self._wakeup:
+            self._enqueued += 1
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        """dict job (hasil sudah di-decode) atau None."""
+        rows = self._read("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def events(self, job_id: str, after: int = 0) -> list:
+        """[(seq, event, data)] dengan seq > after, berurutan."""
+        rows = self._read(
+            "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        )
+        return [(row["seq"], row["event"], json.loads(row["data"])) for row in rows]
+
+    # -- worker ------------------------------------------------------------
+    def claim(self, worker: str, timeout: float = 1.0):
+        """
+        Ambil job tertua yang menunggu (status -> running), atau None setelah
+        `timeout` detik. Job dari proses lain terlihat paling lambat poll_s.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self._maintenance()
+            with self._wakeup:
+                seen = self._enqueued
+            job = self._write(lambda db: self._claim_one(db, worker))
+            if job is not None:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._wakeup:
+                # Job yang masuk di antara claim dan wait tidak boleh terlewat
+                if self._enqueued == seen:
+                    self._wakeup.wait(min(remaining, self.poll_s) if self.shared else remaining)
+
+    def _claim_one(self, db, worker: str):
+        row = db.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+            (worker, time.time(), row["id"]),
+        )
+        job = dict(row)
+        job["attempts"] += 1
+        # Hanya diambil sekali; job yang dikembalikan ke antrian membaca file
+        job["data"] = self._blobs.pop(row["id"], None)
+        return job
+
+    def add_event(self, job_id: str, event: str, data, attempt: int = None) -> bool:
+        def insert(db):
+            if attempt is not None and not self._holds_lease(db, job_id, attempt):
+                return False
+            self._insert_event(db, job_id, event, data)
+            return True
+
+        return self._write(insert)
+
+    @staticmethod
+    def _holds_lease(db, job_id: str, attempt: int) -> bool:
+        """True jika job masih "running" di percobaan `attempt` (belum diambil alih / diselesaikan)."""
+        return db.execute("SELECT 1 FROM jobs WHERE id = ? AND status = 'running' AND attempts = ?",
+                          (job_id, attempt)).fetchone() is not None
+
+    def _insert_event(self, db, job_id: str, event: str, data):
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?",
+                         (job_id,)).fetchone()[0]
+        db.execute("INSERT INTO job_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                   (job_id, seq, event, json.dumps(data, ensure_ascii=False)))
+
+    def finish(self, job_id: str, result, attempt: int = None) -> bool:
+        """Simpan hasil job; False jika `attempt` sudah tidak memegang job (hasil dibuang)."""
+        return self._complete(job_id, "done", result=result, attempt=attempt)
+
+    def fail(self, job_id: str, error: str, attempt: int = None) -> bool:
+        return self._complete(job_id, "error", error=error, attempt=attempt)
+
+    def _complete(self, job_id: str, status: str, result=None, error: str = None, attempt: int = None) -> bool:
+        return self._write(lambda db: self._complete_row(db, job_id, status, result, error, attempt))
+
+    def _complete_row(self, db, job_id: str, status: str, result=None, error: str = None,
+                      attempt: int = None) -> bool:
+        result_text = json.dumps(result, ensure_ascii=False) if result is not None else None
+        event, data = ("done", {"tickets": result}) if status == "done" else ("error", {"detail": error})
+        sql = "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ? AND status = 'running'"
+        params = (status, time.time(), result_text, error, job_id)
+        if attempt is not None:
+            sql += " AND attempts = ?"
+            params += (attempt,)
+        if db.execute(sql, params).rowcount == 0:
+            return False
+        self._insert_event(db, job_id, event, data)
+        return True
+
+    # -- pemeliharaan ------------------------------------------------------
+    def _maintenance(self):
+        """Paling sering sekali per lease_s / 10: kembalikan job basi, hapus job lama."""
+        now = time.time()
+        if now - self._last_maintenance < min(self.lease_s / 10, 60):
+            return
+        self._last_maintenance = now
+
+        def sweep(db):
+            stale = now - self.lease_s
+            exhausted = db.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND started_at < ? AND attempts >= ?",
+                (stale, self.max_attempts),
+            ).fetchall()
+            for row in exhausted:
+                self._complete_row(db, row["id"], "error", error="Worker berhenti di tengah job.")
+            db.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND started_at < ?",
+                (stale,),
+            )
+            old = now - self.retention_s
+            db.execute(
+                "DELETE FROM job_events WHERE job_id IN"
+                " (SELECT id FROM jobs WHERE status IN ('done', 'error') AND finished_at < ?)",
+                (old,),
+            )
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND finished_at < ?", (old,))
+
+        self._write(sweep)
+
+    def metrics(self) -> dict:
+        counts = dict.fromkeys(("queued", "running", "done", "error"), 0)
+        for row in self._read("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = self._read("SELECT MIN(created_at) AS t FROM jobs WHERE status = 'queued'")[0]["t"]
+        counts["max_queued"] = self.max_queued
+        counts["oldest_queued_s"] = round(time.time() - oldest, 3) if oldest else 0.0
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._db.close()
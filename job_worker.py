@@ -0,0 +1,347 @@
+# job_worker.py
+"""
+Worker model untuk antrian job (job_queue): mengambil job upload, menjalankan
+pipeline tiket (single + multi lewat BatchScheduler, pilih hasil), menulis
+hasil / event kembali ke antrian, lalu menyimpan tiket ke ticket store. Hasil
+percobaan yang lease-nya sudah habis dibuang antrian dan tidak ikut disimpan.
+
+Dua cara jalan:
+  - di dalam proses app (INPROCESS_WORKER=1, default): app membuat JobWorker
+    di thread-nya sendiri dengan JobQueue di memori, seperti satu proses
+    uvicorn sebelumnya
+  - proses terpisah per host, berbagi antrian SQLite (JOB_QUEUE_PATH):
+
+    python job_worker.py --workers 2              # 2 proses model
+    python job_worker.py --workers 2 --web        # + uvicorn app (WEB_WORKERS proses, tanpa model)
+
+    Setiap proses model memuat model sekali; dengan beberapa GPU proses ke-i
+    memakai GPU i mod jumlah GPU. Proses web hanya menyimpan file dan
+    enqueue (INPROCESS_WORKER=0), jadi boleh banyak. File upload dibaca
+    worker dari path yang sama, jadi web dan worker harus di host yang sama.
+
+Di setiap proses model INFERENCE_WORKERS thread menjalankan job bersamaan,
+sehingga generate dari beberapa job tergabung dalam satu batch BatchScheduler.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from batch_scheduler import BatchScheduler
+from combined_inference import process_ticket, stream_ticket
+from inference_core import warmup_prefix_cache
+from job_queue import JobQueue
+from json_constraint import warmup as warmup_json_constraint
+from model_loader import warmup as warmup_model
+from multi_inference import MULTI_PROMPT
+from result_cache import ResultCache
+from single_inference import SINGLE_PROMPT
+from stations_data import get_station_index
+from telemetry import configure_logging, reset_trace_id, set_trace_id, stage
+from ticket_selection import cleanup_stations_inplace, select_final_data
+from ticket_store import TicketStore
+
+logger = logging.getLogger(__name__)
+
+# Dynamic batching: generate dari job yang datang dalam jendela BATCH_WAIT_MS
+# digabung ke satu model.generate (maksimal BATCH_MAX_SIZE pasangan image+prompt)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "20"))
+
+# Job yang dijalankan bersamaan per proses model (sumber batch untuk scheduler)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "4"))
+
+# Cache hasil model per isi image (SHA-256) + prompt + versi model.
+# RESULT_CACHE_SIZE=0 mematikan tier memori; RESULT_CACHE_DIR kosong = tanpa tier disk.
+# Tier disk dipakai bersama oleh semua proses model.
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "256"))
+
+# Hasil tiket: JSONL append-only + index kunci di json_outputs/ (aman antar proses).
+TICKET_STORE_PATH = os.getenv("TICKET_STORE_PATH", os.path.join("json_outputs", "tickets.jsonl"))
+
+# Antrian job: kosong = di memori (satu proses); path = SQLite bersama antar proses.
+# Jika JOB_MAX_QUEUED job sudah menunggu, upload dibalas 503 + Retry-After.
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "")
+DEFAULT_JOB_QUEUE_PATH = os.path.join("json_outputs", "jobs.sqlite3")
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "64"))
+RETRY_AFTER_S = int(os.getenv("RETRY_AFTER_S", "5"))
+JOB_LEASE_S = float(os.getenv("JOB_LEASE_S", "300"))
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", "3600"))
+JOB_POLL_MS = float(os.getenv("JOB_POLL_MS", "50"))
+
+# Proses per host untuk `python job_worker.py`
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "1"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))
+
+
+def build_job_queue(path: str = None) -> JobQueue:
+    return JobQueue(
+        path=(JOB_QUEUE_PATH if path is None else path) or ":memory:",
+        max_queued=JOB_MAX_QUEUED,
+        retry_after_s=RETRY_AFTER_S,
+        lease_s=JOB_LEASE_S,
+        retention_s=JOB_RETENTION_S,
+        poll_s=JOB_POLL_MS / 1000.0,
+    )
+
+
+def build_scheduler() -> BatchScheduler:
+    return BatchScheduler(max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_WAIT_MS)
+
+
+def build_result_cache() -> ResultCache:
+    return ResultCache(
+        max_entries=RESULT_CACHE_SIZE,
+        disk_dir=RESULT_CACHE_DIR or None,
+        disk_max_bytes=int(RESULT_CACHE_DISK_MB * 1024 * 1024),
+    )
+
+
+def build_ticket_store() -> TicketStore:
+    return TicketStore(TICKET_STORE_PATH)
+
+
+def warmup():
+    """Muat model + token index grammar JSON + KV awalan prompt sebelum job pertama."""
+    model, processor, _ = warmup_model()
+    warmup_json_constraint(model, processor)
+    warmup_prefix_cache([SINGLE_PROMPT, MULTI_PROMPT])
+
+
+def finalize_tickets(single_data: list, multi_data: list) -> list:
+    """Pilih hasil single/multi dan bersihkan stasiun; return list tiket."""
+    with stage("validation"):
+        final_data = select_final_data(single_data, multi_data)
+
+    # (Opsional) Bersihkan stasiun palsu
+    for t in final_data:
+        cleanup_stations_inplace(t)
+
+    if isinstance(final_data, dict):
+        final_data = [final_data]
+    return final_data
+
+
+class JobWorker:
+    """
+    `concurrency` thread yang masing-masing mengambil satu job dari antrian,
+    menjalankannya lewat `scheduler` dan menulis hasilnya ke antrian.
+    """
+
+    def __init__(self, job_queue: JobQueue, scheduler: BatchScheduler, result_cache: ResultCache,
+                 ticket_store: TicketStore, concurrency: int = 4):
+        if concurrency < 1:
+            raise ValueError("concurrency minimal 1.")
+        self.job_queue = job_queue
+        self.scheduler = scheduler
+        self.result_cache = result_cache
+        self.ticket_store = ticket_store
+        self.concurrency = concurrency
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._completed = 0
+        self._failed = 0
+        self._stale = 0
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.scheduler.start()
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        if not self._threads:
+            return
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.scheduler.stop()
+
+    def request_stop(self):
+        """Minta thread berhenti setelah job yang sedang jalan (aman dari signal handler)."""
+        self._stop.set()
+
+    def wait(self):
+        """Blok sampai request_stop() / stop() dipanggil (proses worker)."""
+        while not self._stop.wait(1.0):
+            pass
+
+    # -- job ---------------------------------------------------------------
+    def _run(self):
+        worker = f"{self.name}:{threading.current_thread().name}"
+        while not self._stop.is_set():
+            job = self.job_queue.claim(worker, timeout=1.0)
+            if job is not None:
+                self.process(job)
+
+    def process(self, job: dict):
+        token = set_trace_id(job["trace_id"] or job["id"])
+        # Hasil / event hanya diterima selama job masih di percobaan ini (lihat job_queue)
+        attempt = job["attempts"]
+        with self._lock:
+            self._busy += 1
+        try:
+            # SHA-256 sudah dihitung saat upload; isi file ikut di memori jika antrian di proses ini
+            source = {"cache": self.result_cache, "image_sha": job["image_sha"], "data": job.get("data")}
+            if job["kind"] == "stream":
+                single_data, multi_data = [], []
+                for kind, payload in stream_ticket(job["file_path"], self.scheduler.generate, **source):
+                    if kind == "ticket":
+                        self.job_queue.add_event(job["id"], "ticket", payload, attempt=attempt)
+                    else:
+                        single_data, multi_data = payload
+            else:
+                # SINGLE dan MULTI inference dalam satu pemanggilan generate, lewat scheduler
+                # agar bisa di-batch bersama job lain. Isi yang sama diambil dari result_cache.
+                single_data, multi_data = process_ticket(job["file_path"], self.scheduler.generate, **source)
+            final_data = finalize_tickets(single_data, multi_data)
+        except Exception as exc:
+            logger.exception("job gagal", extra={"job_id": job["id"]})
+            self._record(job, self.job_queue.fail(job["id"], str(exc), attempt=attempt), failed=True)
+        else:
+            accepted = self.job_queue.finish(job["id"], final_data, attempt=attempt)
+            if accepted:
+                # Hanya percobaan yang hasilnya diterima antrian yang menulis ke ticket store
+                self._store(job, final_data)
+            self._record(job, accepted, failed=False)
+        finally:
+            with self._lock:
+                self._busy -= 1
+            reset_trace_id(token)
+
+    def _store(self, job: dict, tickets: list):
+        """Simpan tiket tanpa duplikasi (append-only, dedup per kunci kanonik)."""
+        try:
+            with stage("store_write"):
+                self.ticket_store.add(tickets)
+        except Exception:
+            # Job sudah selesai di antrian (hasil tetap sampai ke klien); jangan matikan thread
+            logger.exception("simpan tiket gagal", extra={"job_id": job["id"]})
+
+    def _record(self, job: dict, accepted: bool, failed: bool):
+        if not accepted:
+            # Lease habis: job sudah dijalankan ulang / diselesaikan worker lain, hasil ini dibuang
+            logger.warning("hasil job basi dibuang", extra={"job_id": job["id"], "attempt": job["attempts"]})
+        with self._lock:
+            if not accepted:
+                self._stale += 1
+            elif failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "threads": self.concurrency,
+                "busy": self._busy,
+                "completed": self._completed,
+                "failed": self._failed,
+                "stale": self._stale,
+            }
+
+
+# ---------------------------------------------------------------------------
+# Proses worker per host
+# ---------------------------------------------------------------------------
+def run_worker_process(index: int, gpu_count: int):
+    """Entry point satu proses model: muat model sekali, ambil job sampai SIGTERM."""
+    if gpu_count > 1:
+        # Dibaca saat CUDA pertama kali dipakai (warmup), bukan saat import torch
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(index % gpu_count)
+    configure_logging()
+    get_station_index()
+    warmup()
+    worker = JobWorker(build_job_queue(), build_scheduler(), build_result_cache(), build_ticket_store(),
+                       concurrency=INFERENCE_WORKERS)
+    signal.signal(signal.SIGTERM, lambda *_: worker.request_stop())
+    worker.start()
+    logger.info("worker model siap", extra={"worker": worker.name, "index": index})
+    try:
+        worker.wait()
+    except KeyboardInterrupt:
+        pass
+    worker.stop()
+
+
+def supervise(processes: dict, gpu_count: int, stop: threading.Event):
+    """Jalankan ulang proses model yang mati (mis. OOM) sampai `stop`."""
+    context = multiprocessing.get_context("spawn")
+    while not stop.wait(5.0):
+        for index, process in list(processes.items()):
+            if not process.is_alive():
+                logger.warning("worker model mati, dijalankan ulang",
+                               extra={"index": index, "exitcode": process.exitcode})
+                processes[index] = context.Process(target=run_worker_process, args=(index, gpu_count),
+                                                   name=f"model-worker-{index}")
+                processes[index].start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=MODEL_WORKERS, help="proses model (default MODEL_WORKERS)")
+    parser.add_argument("--web", action="store_true", help="jalankan juga uvicorn app di proses ini")
+    parser.add_argument("--web-workers", type=int, default=WEB_WORKERS, help="proses uvicorn (default WEB_WORKERS)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    configure_logging()
+    # Antrian harus berupa file agar bisa dibagi; diwariskan ke proses anak lewat env
+    os.environ["JOB_QUEUE_PATH"] = JOB_QUEUE_PATH or DEFAULT_JOB_QUEUE_PATH
+    os.environ["INPROCESS_WORKER"] = "0"
+    # Buat skema sekali sebelum proses lain membuka file yang sama
+    build_job_queue(os.environ["JOB_QUEUE_PATH"]).close()
+
+    import torch
+
+    gpu_count = torch.cuda.device_count() if "CUDA_VISIBLE_DEVICES" not in os.environ else 0
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    for index in range(args.workers):
+        processes[index] = context.Process(target=run_worker_process, args=(index, gpu_count),
+                                           name=f"model-worker-{index}")
+        processes[index].start()
+    logger.info("worker model dijalankan", extra={"workers": args.workers, "queue": os.environ["JOB_QUEUE_PATH"]})
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    supervisor = threading.Thread(target=supervise, args=(processes, gpu_count, stop), daemon=True)
+    supervisor.start()
+    try:
+        if args.web:
+            import uvicorn
+
+            uvicorn.run("app:app", host=args.host, port=args.port, workers=args.web_workers)
+        else:
+            while not stop.wait(1.0):
+                pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        supervisor.join()
+        for process in processes.values():
+            process.terminate()
+        deadline = time.monotonic() + 30
+        for process in processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+
+
+if __name__ == "__main__":
+    main()
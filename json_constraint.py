@@ -0,0 +1,397 @@
+# json_constraint.py
+"""
+Constrained decoding untuk output prompt multi: model.generate hanya boleh
+menghasilkan array JSON tiket dengan enam field (urutan tetap), sehingga tidak
+ada lagi pagar markdown, gema prompt, atau teks penjelasan, dan hasilnya
+selalu bisa di-parse (kecuali terpotong max_new_tokens).
+
+    [{"date": "YYYY.MM.DD", "departure_station": "...", "arrival_station": "...",
+      "departure_time": "HH:MM", "arrival_time": "HH:MM", "price": "123"}, ...]
+
+  - date        "" atau \\d{4}[./]\\d{2}[./]\\d{2}
+  - *_time      "" atau \\d{1,2}:\\d{2}
+  - price       "" atau maksimal 6 digit
+  - *_station   string tanpa kutip/backslash/karakter kontrol, <= 40 karakter
+  - spasi/baris baru di antara token JSON, <= 12 berturut-turut
+  Batas panjang mencegah model berputar (spasi / nama stasiun tanpa akhir)
+  sampai max_new_tokens habis.
+
+Cara kerja: grammar di atas sebagai automaton per karakter; string setiap
+token vocab disusun jadi trie, dan untuk setiap state grammar, token yang
+seluruh karakternya diterima dihitung sekali (DFS trie) lalu di-cache.
+Di dalam nama stasiun hampir semua token sah, jadi state itu tidak lewat DFS
+melainkan dua perbandingan vektor (panjang token teks murni / posisi kutip
+penutup) terhadap sisa batas panjang. Begitu array ditutup, hanya token EOS
+yang boleh => baris berhenti.
+
+Prompt yang dibatasi didaftarkan lewat constrain_prompt() (multi_inference);
+inference_core memasang TicketJsonLogitsProcessor untuk baris dengan prompt
+tersebut, baris lain di batch yang sama tidak disentuh.
+Diatur lewat CONSTRAINED_JSON (1/0).
+"""
+import logging
+import os
+import threading
+import time
+
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList
+
+from model_loader import special_token_ids
+
+logger = logging.getLogger(__name__)
+
+CONSTRAINED_JSON = os.getenv("CONSTRAINED_JSON", "1") == "1"
+
+FIELDS = ("date", "departure_station", "arrival_station", "departure_time", "arrival_time", "price")
+_VALUE_KINDS = {
+    "date": "date",
+    "departure_station": "text",
+    "arrival_station": "text",
+    "departure_time": "time",
+    "arrival_time": "time",
+    "price": "price",
+}
+_WS_CHARS = frozenset(" \n\t\r")
+_DIGITS = frozenset("0123456789")
+MAX_PRICE_DIGITS = 6
+MAX_TEXT_CHARS = 40
+MAX_WS_CHARS = 12
+# Naikkan jika grammar berubah (ikut kunci result cache)
+GRAMMAR_VERSION = 1
+
+# -- grammar per karakter -------------------------------------------------
+# State = (phase, item, pos). Phase di luar objek: sebelum "[", setelah "[",
+# setelah "}", setelah ",", selesai. Di dalam objek: indeks item program objek
+# + posisi di dalam item (karakter literal / sub-state nilai).
+START, OPEN, OBJECT, NEXT, COMMA, DONE = range(6)
+WS, LITERAL, VALUE = range(3)
+
+
+def _object_program() -> tuple:
+    items = [(LITERAL, "{")]
+    for n, field in enumerate(FIELDS):
+        items += [
+            (WS, None), (LITERAL, f'"{field}"'), (WS, None), (LITERAL, ":"), (WS, None),
+            (LITERAL, '"'), (VALUE, _VALUE_KINDS[field]), (LITERAL, '"'), (WS, None),
+            (LITERAL, "," if n < len(FIELDS) - 1 else "}"),
+        ]
+    return tuple(items)
+
+
+_PROGRAM = _object_program()
+INITIAL_STATE = (START, 0, 0)
+DONE_STATE = (DONE, 0, 0)
+
+
+def _is_text_char(ch: str) -> bool:
+    return ch not in '"\\' and ch >= " "
+
+
+def _value_step(kind: str, pos: int, ch: str):
+    """Sub-state berikutnya di dalam string nilai, atau None jika ch ditolak."""
+    if kind == "text":
+        return pos + 1 if pos < MAX_TEXT_CHARS and _is_text_char(ch) else None
+    if kind == "date":
+        if pos in (4, 7):
+            return pos + 1 if ch in "./" else None
+        return pos + 1 if pos < 10 and ch in _DIGITS else None
+    if kind == "time":
+        # 0 awal, 1/2 digit jam, 3 ":", 4/5 digit menit
+        if pos in (0, 1) and ch in _DIGITS:
+            return pos + 1
+        if pos in (1, 2) and ch == ":":
+            return 3
+        if pos in (3, 4) and ch in _DIGITS:
+            return pos + 1
+        return None
+    # price
+    return pos + 1 if pos < MAX_PRICE_DIGITS and ch in _DIGITS else None
+
+
+def _value_can_end(kind: str, pos: int) -> bool:
+    if kind == "date":
+        return pos in (0, 10)
+    if kind == "time":
+        return pos in (0, 5)
+    return True
+
+
+def step(state: tuple, ch: str):
+    """State grammar setelah karakter ch, atau None jika ch tidak boleh di sini."""
+    phase, item, pos = state
+    if phase == OBJECT:
+        while item < len(_PROGRAM):
+            kind, arg = _PROGRAM[item]
+            if kind == LITERAL:
+                if arg[pos] != ch:
+                    return None
+                if pos + 1 < len(arg):
+                    return (OBJECT, item, pos + 1)
+                return (OBJECT, item + 1, 0) if item + 1 < len(_PROGRAM) else (NEXT, 0, 0)
+            if kind == WS:
+                if ch in _WS_CHARS and pos < MAX_WS_CHARS:
+                    return (OBJECT, item, pos + 1)
+            else:
+                new_pos = _value_step(arg, pos, ch)
+                if new_pos is not None:
+                    return (OBJECT, item, new_pos)
+                if not _value_can_end(arg, pos):
+                    return None
+            # Spasi opsional / nilai selesai: coba ch pada item berikutnya
+            item, pos = item + 1, 0
+        return None
+    if phase == DONE:
+        return None
+    if ch in _WS_CHARS:
+        return (phase, 0, pos + 1) if pos < MAX_WS_CHARS else None
+    if phase == START:
+        return (OPEN, 0, 0) if ch == "[" else None
+    if phase == OPEN:
+        if ch == "{":
+            return (OBJECT, 1, 0)
+        return DONE_STATE if ch == "]" else None
+    if phase == NEXT:
+        if ch == ",":
+            return (COMMA, 0, 0)
+        return DONE_STATE if ch == "]" else None
+    # COMMA
+    return (OBJECT, 1, 0) if ch == "{" else None
+
+
+def step_text(state: tuple, text: str):
+    for ch in text:
+        state = step(state, ch)
+        if state is None:
+            return None
+    return state
+
+
+def grammar_signature() -> str:
+    """Ikut kunci ResultCache: output multi berbeda jika constrained decoding aktif."""
+    return f"json={int(CONSTRAINED_JSON)}/v{GRAMMAR_VERSION}"
+
+
+# -- vocab ----------------------------------------------------------------
+_NEVER = 1 << 30
+
+
+class TokenIndex:
+    """
+    String setiap token vocab dalam trie karakter + cache token yang diizinkan
+    per state grammar. Dibangun sekali per tokenizer.
+    """
+
+    def __init__(self, tokenizer, eos_ids: set, pad_ids: set = ()):
+        started = time.perf_counter()
+        size = len(tokenizer)
+        pieces = tokenizer.batch_decode(
+            [[i] for i in range(size)], skip_special_tokens=False, clean_up_tokenization_spaces=False
+        )
+        # Token spesial (<|im_end|>, <|vision_start|>, ...) tidak boleh muncul sebagai teks
+        special = set(getattr(tokenizer, "all_special_ids", ()) or ())
+        special.update(getattr(tokenizer, "added_tokens_decoder", {}) or {})
+        self.eos_ids = frozenset(eos_ids)
+        # Baris yang dihentikan generate (EOS / stopping criteria) diisi token pad
+        self.end_ids = self.eos_ids | frozenset(pad_ids)
+        self.size = size
+        self.pieces = pieces
+        # node = (anak {karakter: node}, id token yang berakhir di node ini)
+        self.root = ({}, [])
+        # Untuk state nama stasiun: panjang token yang seluruhnya karakter teks,
+        # dan id token berisi kutip (kandidat penutup string)
+        text_len = [_NEVER] * size
+        self._quoted = []
+        for token_id, piece in enumerate(pieces):
+            # "" tidak memajukan grammar; "\ufffd" = potongan byte UTF-8
+            if token_id in special or not piece or "\ufffd" in piece:
+                continue
+            node = self.root
+            for ch in piece:
+                node = node[0].setdefault(ch, ({}, []))
+            node[1].append(token_id)
+            if all(_is_text_char(ch) for ch in piece):
+                text_len[token_id] = len(piece)
+            elif '"' in piece:
+                self._quoted.append(token_id)
+        self._text_len = torch.tensor(text_len, dtype=torch.int32)
+        self._close_at = {}
+        self._lock = threading.Lock()
+        self._allowed = {}
+        self._tensors = {}
+        logger.info("token index grammar JSON dibangun",
+                    extra={"vocab": size, "ms": round(1000 * (time.perf_counter() - started), 1)})
+
+    @staticmethod
+    def _text_item(state: tuple):
+        phase, item, _ = state
+        if phase == OBJECT and _PROGRAM[item] == (VALUE, "text"):
+            return item
+        return None
+
+    def _close_positions(self, item: int) -> torch.Tensor:
+        """
+        Per token: jumlah karakter teks sebelum kutip penutup, jika sisa token
+        setelahnya sah menurut grammar (tidak bergantung panjang nama); else _NEVER.
+        """
+        close_at = self._close_at.get(item)
+        if close_at is None:
+            values = [_NEVER] * self.size
+            for token_id in self._quoted:
+                piece = self.pieces[token_id]
+                quote = piece.index('"')
+                if all(_is_text_char(ch) for ch in piece[:quote]) and \
+                        step_text((OBJECT, item + 1, 0), piece[quote:]) is not None:
+                    values[token_id] = quote
+            close_at = torch.tensor(values, dtype=torch.int32)
+            with self._lock:
+                self._close_at[item] = close_at
+        return close_at
+
+    def allowed_ids(self, state: tuple) -> list:
+        """Semua token yang seluruh karakternya diterima grammar dari `state` (DFS trie)."""
+        cached = self._allowed.get(state)
+        if cached is not None:
+            return cached
+        if state == DONE_STATE:
+            allowed = sorted(self.eos_ids)
+        else:
+            allowed = []
+            stack = [(self.root, state)]
+            while stack:
+                node, current = stack.pop()
+                for ch, child in node[0].items():
+                    following = step(current, ch)
+                    if following is None:
+                        continue
+                    allowed.extend(child[1])
+                    if child[0]:
+                        stack.append((child, following))
+        with self._lock:
+            self._allowed[state] = allowed
+        return allowed
+
+    def restrict(self, scores: torch.Tensor, state: tuple) -> torch.Tensor:
+        """Salinan skor satu baris dengan token yang tidak sah = -inf."""
+        item = self._text_item(state)
+        if item is not None:
+            # Nama stasiun: token teks yang masih muat, atau token yang menutup string tepat waktu
+            room = MAX_TEXT_CHARS - state[2]
+            allowed = (self._text_len <= room) | (self._close_positions(item) <= room)
+            if scores.shape[-1] > self.size:
+                allowed = torch.cat([allowed, allowed.new_zeros(scores.shape[-1] - self.size)])
+            return scores.masked_fill(~allowed[:scores.shape[-1]].to(scores.device), float("-inf"))
+        key = (state, str(scores.device))
+        ids = self._tensors.get(key)
+        if ids is None:
+            ids = torch.tensor(self.allowed_ids(state), dtype=torch.long, device=scores.device)
+            ids = ids[ids < scores.shape[-1]]
+            with self._lock:
+                self._tensors[key] = ids
+        restricted = torch.full_like(scores, float("-inf"))
+        restricted[ids] = scores[ids]
+        return restricted
+
+    def advance(self, state: tuple, token_id: int):
+        if token_id >= self.size:
+            return None
+        return step_text(state, self.pieces[token_id])
+
+    def precompute(self, sample: str):
+        """Isi cache untuk state yang dilalui contoh output (warmup)."""
+        state = INITIAL_STATE
+        for ch in sample:
+            item = self._text_item(state)
+            if item is not None:
+                self._close_positions(item)
+            else:
+                self.allowed_ids(state)
+            state = step(state, ch)
+            if state is None:
+                raise ValueError("Contoh warmup tidak sesuai grammar.")
+
+
+_indexes_lock = threading.Lock()
+_indexes = {}
+
+
+def get_token_index(model, processor) -> TokenIndex:
+    tokenizer = getattr(processor, "tokenizer", processor)
+    key = id(tokenizer)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = _indexes[key] = TokenIndex(
+                    tokenizer, special_token_ids(model, processor), special_token_ids(model, processor, "pad_token_id")
+                )
+    return index
+
+
+# -- logits processor -----------------------------------------------------
+class TicketJsonLogitsProcessor(LogitsProcessor):
+    """
+    Mask logits baris `rows` ke token yang sah menurut grammar. Baris yang
+    sudah selesai (EOS) atau keluar dari grammar tidak dimask lagi.
+    """
+
+    def __init__(self, index: TokenIndex, rows: list, prompt_len: int):
+        self.index = index
+        self.prompt_len = prompt_len
+        self.states = {row: INITIAL_STATE for row in rows}
+        self.consumed = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        generated = input_ids.shape[1] - self.prompt_len
+        new_tokens = input_ids[:, self.prompt_len + self.consumed:].tolist() if generated > self.consumed else None
+        self.consumed = generated
+        for row in list(self.states):
+            state = self.states[row]
+            if new_tokens is not None:
+                for token_id in new_tokens[row]:
+                    if state == DONE_STATE or token_id in self.index.end_ids:
+                        state = None
+                        break
+                    state = self.index.advance(state, token_id)
+                    if state is None:
+                        logger.warning("token di luar grammar JSON; baris tidak dibatasi lagi",
+                                       extra={"row": row})
+                        break
+            if state is None:
+                del self.states[row]
+                continue
+            self.states[row] = state
+            scores[row] = self.index.restrict(scores[row], state)
+        return scores
+
+
+_constrained_prompts = set()
+
+
+def constrain_prompt(prompt: str):
+    """Daftarkan prompt yang outputnya harus mengikuti grammar (jika CONSTRAINED_JSON aktif)."""
+    if CONSTRAINED_JSON:
+        _constrained_prompts.add(prompt)
+
+
+def logits_processor_for(prompts: list, model, processor, prompt_len: int):
+    """LogitsProcessorList untuk batch ini, atau None jika tidak ada baris yang dibatasi."""
+    rows = [i for i, prompt in enumerate(prompts) if prompt in _constrained_prompts]
+    if not rows:
+        return None
+    return LogitsProcessorList([TicketJsonLogitsProcessor(get_token_index(model, processor), rows, prompt_len)])
+
+
+WARMUP_SAMPLE = (
+    '[{"date": "2024.01.05", "departure_station": "Taipei", "arrival_station": "Hsinchu", '
+    '"departure_time": "08:10", "arrival_time": "09:25", "price": "177"},\n'
+    ' {"date": "", "departure_station": "", "arrival_station": "", '
+    '"departure_time": "", "arrival_time": "", "price": ""}]'
+)
+
+
+def warmup(model, processor):
+    """Bangun token index + mask state yang umum sebelum request pertama."""
+    if CONSTRAINED_JSON and _constrained_prompts:
+        get_token_index(model, processor).precompute(WARMUP_SAMPLE)
@@ -1,26 +1,255 @@
 # model_loader.py
+import logging
+import os
+import threading
+
 import torch
 from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
 
-def load_model(model_name="Qwen/Qwen2.5-VL-3B-Instruct"):
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "Qwen/Qwen2.5-VL-3B-Instruct"
+
+# ---------------------------------------------------------------------------
+# Device / precision
+# ---------------------------------------------------------------------------
+# Backend dipilih lewat env (argumen load_model menimpa env):
+#   MODEL_DEVICE   auto (cuda jika ada, selain itu cpu) / cuda / cpu
+#   MODEL_DTYPE    auto (cuda: float16, cpu: bfloat16 jika CPU mendukung, selain itu float32)
+#                  / float16 / bfloat16 / float32
+#   MODEL_QUANTIZE none / int8 (cpu: torch.ao.quantization.quantize_dynamic
+#                  atas semua nn.Linear; butuh bobot float32)
+#   TORCH_THREADS  jumlah thread intra-op CPU (0 = default torch)
+#   TORCH_COMPILE  1 = model.forward dibungkus torch.compile
+MODEL_DEVICE = os.getenv("MODEL_DEVICE", "auto")
+MODEL_DTYPE = os.getenv("MODEL_DTYPE", "auto")
+MODEL_QUANTIZE = os.getenv("MODEL_QUANTIZE", "none")
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))
+TORCH_COMPILE = os.getenv("TORCH_COMPILE", "0") == "1"
+
+DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+
+
+def cpu_supports_bf16() -> bool:
+    """True jika CPU punya instruksi bf16 (AVX512-BF16 / AMX) untuk oneDNN."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+class Backend:
+    """Pilihan device + dtype + kuantisasi + compile untuk satu model."""
+
+    def __init__(self, device: str, dtype: str, quantize: str = "none", compile: bool = False):
+        self.device = device
+        self.dtype = dtype
+        self.quantize = quantize
+        self.compile = compile
+
+    @property
+    def name(self) -> str:
+        """Mis. "cuda-float16", "cpu-bfloat16", "cpu-float32-int8"; label metrik tokens/detik."""
+        parts = [self.device, self.dtype]
+        if self.quantize != "none":
+            parts.append(self.quantize)
+        if self.compile:
+            parts.append("compile")
+        return "-".join(parts)
+
+    @property
+    def signature(self) -> str:
+        """Bagian yang mengubah output model (compile tidak); ikut kunci cache hasil."""
+        suffix = f"-{self.quantize}" if self.quantize != "none" else ""
+        return f"{self.device}-{self.dtype}{suffix}"
+
+
+def select_backend(device: str = None, dtype: str = None, quantize: str = None, compile: bool = None) -> Backend:
     """
-    Loads the Qwen2.5-VL model and its processor to run exclusively on GPU.
-    Raises an error if CUDA (GPU) is not available.
+    Tentukan backend dari argumen (None => env). Raise ValueError untuk
+    kombinasi yang tidak didukung, EnvironmentError jika cuda diminta tanpa GPU.
     """
-    if not torch.cuda.is_available():
-        raise EnvironmentError("CUDA is not available. This model requires a GPU to run.")
+    device = device or MODEL_DEVICE
+    dtype = dtype or MODEL_DTYPE
+    quantize = quantize or MODEL_QUANTIZE
+    compile = TORCH_COMPILE if compile is None else compile
+
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device not in ("cuda", "cpu"):
+        raise ValueError(f"MODEL_DEVICE tidak dikenal: {device}")
+    if device == "cuda" and not torch.cuda.is_available():
+        raise EnvironmentError("CUDA is not available. Set MODEL_DEVICE=cpu (or auto) to run on CPU.")
+    if quantize not in ("none", "int8"):
+        raise ValueError(f"MODEL_QUANTIZE tidak dikenal: {quantize}")
+    if quantize == "int8" and device != "cpu":
+        raise ValueError("MODEL_QUANTIZE=int8 hanya untuk MODEL_DEVICE=cpu.")
 
-    device = torch.device("cuda")
+    if dtype == "auto":
+        if quantize == "int8":
+            dtype = "float32"
+        elif device == "cuda":
+            dtype = "float16"
+        else:
+            dtype = "bfloat16" if cpu_supports_bf16() else "float32"
+    if dtype not in DTYPES:
+        raise ValueError(f"MODEL_DTYPE tidak dikenal: {dtype}")
+    if quantize == "int8" and dtype != "float32":
+        raise ValueError("MODEL_QUANTIZE=int8 butuh MODEL_DTYPE=float32 (kuantisasi dinamis dari bobot float32).")
+    return Backend(device, dtype, quantize, compile)
 
-    model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-        model_name,
-        torch_dtype=torch.float16,   # GPU-compatible precision
-        device_map={"": device},     # Force loading entire model to single GPU
-        # load_in_4bit=True          # Optional: Uncomment if using quantized model and bitsandbytes installed
-    )
+
+def configure_threads(threads: int = None):
+    """Set jumlah thread intra-op torch (None => TORCH_THREADS; 0 => biarkan default)."""
+    threads = TORCH_THREADS if threads is None else threads
+    if threads > 0:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+
+def load_model(model_name=DEFAULT_MODEL_NAME, device=None, dtype=None, quantize=None, threads=None, compile=None):
+    """
+    Loads the Qwen2.5-VL model and its processor on the selected backend
+    (see select_backend): GPU in float16 by default, CPU in bfloat16/float32
+    with optional dynamic int8 quantization when CUDA is not available.
+    """
+    backend = select_backend(device, dtype, quantize, compile)
+    torch_device = torch.device(backend.device)
+
+    if backend.device == "cuda":
+        model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            model_name,
+            torch_dtype=DTYPES[backend.dtype],
+            device_map={"": torch_device},     # Force loading entire model to single GPU
+            # load_in_4bit=True          # Optional: Uncomment if using quantized model and bitsandbytes installed
+        )
+    else:
+        threads = configure_threads(threads)
+        model = Qwen2_5_VLForConditionalGeneration.from_pretrained(model_name, torch_dtype=DTYPES[backend.dtype])
+        logger.info("thread CPU", extra={"threads": threads})
 
     processor = AutoProcessor.from_pretrained(model_name, use_fast=True)
 
-    model.to(device)
+    model.to(torch_device)
+    model.eval()
+
+    if backend.quantize == "int8":
+        # Bobot Linear jadi int8, aktivasi dikuantisasi per batch saat jalan
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend.compile:
+        # dynamic=True: panjang prompt/batch berubah tiap request, hindari recompile per shape
+        model.forward = torch.compile(model.forward, dynamic=True)
+
+    model.backend = backend
+    logger.info("model dimuat", extra={"model": model_name, "backend": backend.name})
+    return model, processor, torch_device
+
+
+# ---------------------------------------------------------------------------
+# Shared model registry
+# ---------------------------------------------------------------------------
+# Satu proses hanya boleh memuat satu salinan model. single_inference dan
+# multi_inference mengambil (model, processor, device) dari sini saat
+# pertama kali dibutuhkan, bukan saat import.
+
+_registry_lock = threading.Lock()
+_loaded = None
+_loader = load_model
+_loader_kwargs = {}
+
+
+def set_loader(loader, **kwargs):
+    """
+    Replaces the function used to build the model bundle (e.g. a stub model
+    for CPU tests). Any already loaded bundle is dropped.
+    """
+    global _loader, _loader_kwargs
+    with _registry_lock:
+        _loader = loader
+        _loader_kwargs = dict(kwargs)
+        _drop_loaded()
+
+
+def get_model():
+    """
+    Returns the shared (model, processor, device) tuple, loading it on first use.
+    Concurrent callers block until the single load finishes.
+    """
+    global _loaded
+    bundle = _loaded
+    if bundle is not None:
+        return bundle
+    with _registry_lock:
+        if _loaded is None:
+            _loaded = _loader(**_loader_kwargs)
+        return _loaded
+
+
+def warmup():
+    """
+    Loads the model eagerly (e.g. at application startup) so the first
+    request does not pay the loading cost.
+    """
+    return get_model()
+
+
+def model_version() -> str:
+    """
+    Identitas model yang sedang dipakai (untuk kunci cache hasil).
+    load_model => nama model + backend; loader lain => nama loader + argumennya.
+    """
+    if _loader is load_model:
+        name = _loader_kwargs.get("model_name", DEFAULT_MODEL_NAME)
+        # dtype / kuantisasi mengubah output; hasil cache GPU dan CPU int8 tidak dicampur
+        backend = select_backend(*(_loader_kwargs.get(k) for k in ("device", "dtype", "quantize")))
+        return f"{name}|{backend.signature}"
+    kwargs = ",".join(f"{k}={v!r}" for k, v in sorted(_loader_kwargs.items()))
+    return f"{_loader.__module__}.{_loader.__qualname__}({kwargs})"
+
+
+def backend_name(model) -> str:
+    """Nama backend model (Backend.name) untuk label metrik; loader lain => "custom"."""
+    backend = getattr(model, "backend", None)
+    return backend.name if isinstance(backend, Backend) else "custom"
+
+
+def current_backend():
+    """Backend model yang sedang dimuat (None jika belum dimuat)."""
+    bundle = _loaded
+    return backend_name(bundle[0]) if bundle is not None else None
+
+
+def special_token_ids(model, processor, name: str = "eos_token_id") -> set:
+    """
+    Id token spesial `name` (eos_token_id / pad_token_id) dari generation_config
+    model dan tokenizer; keduanya bisa int atau list.
+    """
+    tokenizer = getattr(processor, "tokenizer", processor)
+    ids = set()
+    for source in (getattr(getattr(model, "generation_config", None), name, None),
+                   getattr(tokenizer, name, None)):
+        if isinstance(source, int):
+            ids.add(source)
+        elif source:
+            ids.update(source)
+    return ids
+
+
+def is_loaded() -> bool:
+    """True if the shared model bundle is already in memory."""
+    return _loaded is not None
+
+
+def unload_model():
+    """Drops the shared bundle so the next get_model() loads it again."""
+    with _registry_lock:
+        _drop_loaded()
+
 
-    return model, processor, device
+def _drop_loaded():
+    global _loaded
+    if _loaded is None:
+        return
+    _loaded = None
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -1,14 +1,103 @@
 # parse_ticket.py
 import re
-import pandas as pd
 import json
+import logging
+
+# Lookup O(1) untuk nama stasiun & mileage, CSV dimuat sekali per proses (lazy)
+from stations_data import get_station_index, get_station_matcher
+from station_index import is_chinese
+
+logger = logging.getLogger(__name__)
+
+# Pola dikompilasi sekali per proses (bukan per panggilan lewat cache modul re)
+_SEPARATOR = r"(?:\+|->|to|→|至)"
+_SEPARATOR_RE = re.compile(_SEPARATOR, re.IGNORECASE)
+_STATIONS_TW_RE = re.compile(r"([\u4e00-\u9fff]+)\s*" + _SEPARATOR + r"\s*([\u4e00-\u9fff]+)")
+_NON_LATIN_RE = re.compile(r"[^A-Za-z ]+")
+_CAPITAL_WORD_RE = re.compile(r"\b[A-Z][a-z]{4,}\b")
+_EXCLUDED_WORDS = frozenset({"Train", "Car", "Seat", "PSGR", "Ticket", "Time", "None"})
+# Satu pass tokenisasi untuk tanggal, waktu dan harga. Lookahead tanpa lebar:
+# setiap posisi awal token dilaporkan, jadi token yang berdempetan (mis.
+# "12:30元") terbaca sama seperti pencarian terpisah per jenis. Pada satu
+# posisi paling banyak satu jenis bisa cocok; (?=[\dN]) melewati posisi lain cepat.
+_TOKEN_RE = re.compile(
+    r"(?=[\dN])(?=(?P<date>\d{4}[./]\d{2}[./]\d{2})"
+    r"|(?P<time>\d{1,2}[:：]\d{2})"
+    r"|NT\$?\s?(?P<price_nt>\d+)"
+    r"|(?P<price_yuan>\d+)\s*元)"
+)
+# Sisa prompt yang kadang ikut dikembalikan model multi
+_PROMPT_ECHO_RE = re.compile(r"(?m)^\s*[-—]*\s*票據文本如下：\s*\n")
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _latin_only(raw: str) -> str:
+    """Hanya huruf Latin + spasi (digit dan karakter lain dibuang)."""
+    return _NON_LATIN_RE.sub("", raw).strip()
+
+
+def _scan_tokens(text: str) -> tuple:
+    """
+    Satu pass atas teks OCR => (tanggal pertama, dua waktu pertama, harga
+    pertama). Semantik sama dengan re.search untuk tanggal/harga dan
+    re.findall (tidak tumpang tindih) untuk waktu.
+    """
+    date = price = None
+    times = []
+    time_end = 0
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "time":
+            # findall: waktu berikutnya baru dicari setelah waktu sebelumnya
+            if len(times) < 2 and match.start() >= time_end:
+                times.append(match.group(kind).replace("：", ":"))
+                time_end = match.end(kind)
+        elif kind == "date":
+            if date is None:
+                date = match.group(kind)
+        elif price is None:
+            price = match.group(kind)
+    return date, times, price
+
+
+def _find_stations(text: str):
+    """
+    (teks sebelum, teks sesudah) separator stasiun pertama, persis seperti
+    re.search(r"(.+?)\s*(?:\+|->|to|→|至)\s*(.+)", text, re.IGNORECASE)
+    tetapi linear: pola itu mencoba setiap posisi awal dan memanjangkan `.+?`
+    karakter demi karakter (kuadratik per baris). Sisi sebelum: dari awal baris
+    karakter non-spasi terakhir sebelum separator; sisi sesudah: baris pertama
+    setelah spasi. Hasil hanya dipakai lewat _latin_only, jadi spasi/baris baru
+    di ujung tidak berpengaruh. None jika tidak ada.
+    """
+    length = len(text)
+    for match in _SEPARATOR_RE.finditer(text):
+        start, end = match.span()
+        # Sebelum: `.+?` minimal satu karakter bukan "\n", lalu \s* sampai separator
+        ws_start = start
+        while ws_start > 0 and text[ws_start - 1].isspace():
+            ws_start -= 1
+        if ws_start > 0:
+            before_start = text.rfind("\n", 0, ws_start - 1) + 1
+        else:
+            before_start = next((i for i in range(start) if text[i] != "\n"), None)
+            if before_start is None:
+                continue
+        # Sesudah: \s* lalu `.+` (tidak melewati baris baru)
+        after_start = end
+        while after_start < length and text[after_start].isspace():
+            after_start += 1
+        if after_start < length:
+            line_end = text.find("\n", after_start)
+            after = text[after_start:] if line_end == -1 else text[after_start:line_end]
+        elif text.count("\n", end) < length - end:
+            # Hanya spasi sampai akhir teks: `.+` mengambil satu karakter spasi
+            after = ""
+        else:
+            continue
+        return text[before_start:start], after
+    return None
 
-STATIONS_CSV = "stations_database_modified.csv"
-df_stations = pd.read_csv(STATIONS_CSV)
-
-def is_chinese(text: str) -> bool:
-    """True jika text mengandung huruf China."""
-    return bool(re.search(r'[\u4e00-\u9fff]+', text))
 
 def parse_single_ticket_text(text: str) -> dict:
     """
@@ -23,37 +112,22 @@ def parse_single_ticket_text(text: str) -> dict:
         "arrival_time": "",
         "price": ""
     }
+    date, times, price = _scan_tokens(text)
 
     # 1) Tanggal
-    match_date = re.search(r"\d{4}[./]\d{2}[./]\d{2}", text)
-    if match_date:
-        data["date"] = match_date.group(0)
-
-    # 2) Stasiun (cari pattern "xxx -> yyy" dengan kemungkinan separator yang berbeda)
-    match_stations = re.search(r"(.+?)\s*(?:\+|->|to|→|至)\s*(.+)", text, re.IGNORECASE)
-    if match_stations:
-        departure_raw = match_stations.group(1).strip()
-        arrival_raw = match_stations.group(2).strip()
-
-        # Hapus digit
-        dep_clean = re.sub(r'\d+', '', departure_raw).strip()
-        arr_clean = re.sub(r'\d+', '', arrival_raw).strip()
+    if date:
+        data["date"] = date
 
-        # Ambil hanya huruf Latin + spasi
-        dep_alphabet = re.sub(r'[^A-Za-z ]+', '', dep_clean).strip()
-        arr_alphabet = re.sub(r'[^A-Za-z ]+', '', arr_clean).strip()
-
-        if dep_alphabet:
-            data["departure_station"] = dep_alphabet
-        if arr_alphabet:
-            data["arrival_station"] = arr_alphabet
+    # 2) Stasiun (cari pattern "xxx -> yyy" dengan kemungkinan separator yang berbeda),
+    #    ambil hanya huruf Latin + spasi
+    stations = _find_stations(text)
+    if stations:
+        data["departure_station"] = _latin_only(stations[0])
+        data["arrival_station"] = _latin_only(stations[1])
 
     # Fallback: jika masih kosong, gunakan ekstraksi dari kata yang diawali huruf kapital
     if not data["departure_station"] or not data["arrival_station"]:
-        stations_capital = re.findall(r"\b[A-Z][a-z]{4,}\b", text)
-        excluded_words = {"Train", "Car", "Seat", "PSGR", "Ticket", "Time", "None"}
-        stations_capital = [w for w in stations_capital if w not in excluded_words]
-
+        stations_capital = [w for w in _CAPITAL_WORD_RE.findall(text) if w not in _EXCLUDED_WORDS]
         if stations_capital:
             if not data["departure_station"]:
                 data["departure_station"] = stations_capital[0]
@@ -62,8 +136,7 @@ def parse_single_ticket_text(text: str) -> dict:
 
     # Logika tambahan: ekstrak stasiun bertuliskan Taiwan (karakter Cina) jika salah satu masih kosong
     if not data["departure_station"] or not data["arrival_station"]:
-        # Cari pola dengan karakter Cina dan separator yang sama
-        match_tw = re.search(r"([\u4e00-\u9fff]+)\s*(?:\+|->|to|→|至)\s*([\u4e00-\u9fff]+)", text)
+        match_tw = _STATIONS_TW_RE.search(text)
         if match_tw:
             if not data["departure_station"]:
                 data["departure_station"] = match_tw.group(1).strip()
@@ -71,20 +144,54 @@ def parse_single_ticket_text(text: str) -> dict:
                 data["arrival_station"] = match_tw.group(2).strip()
 
     # 3) Waktu
-    times = re.findall(r"(\d{1,2}[:：]\d{2})", text)
-    times = [t.replace("：", ":") for t in times]
     if len(times) > 0:
         data["departure_time"] = times[0]
     if len(times) > 1:
         data["arrival_time"] = times[1]
 
     # 4) Harga
-    match_price = re.search(r"(?:NT\$?\s?(\d+)|(\d+)\s*元)", text)
-    if match_price:
-        data["price"] = match_price.group(1) if match_price.group(1) else match_price.group(2)
+    if price:
+        data["price"] = price
 
     return data
 
+
+def single_ticket_complete(text: str) -> bool:
+    """
+    True jika output single yang sedang di-generate sudah memuat tanggal,
+    stasiun (lewat separator, keduanya berhuruf Latin), dua waktu dan harga,
+    dan baris terakhirnya sudah selesai. Semua field memakai kecocokan
+    pertama, jadi teks tambahan tidak lagi mengubah hasil
+    parse_single_ticket_text => generate boleh berhenti di sini.
+    """
+    if not text.endswith("\n"):
+        return False
+    date, times, price = _scan_tokens(text)
+    if not date or len(times) < 2 or not price:
+        return False
+    stations = _find_stations(text)
+    return bool(stations) and bool(_latin_only(stations[0])) and bool(_latin_only(stations[1]))
+
+
+def _scan_json_objects(text: str, start: int = 0) -> list:
+    """
+    Semua objek JSON lengkap di text mulai dari `start`, lewat raw_decode
+    (objek bersarang & "}" di dalam string aman). Bagian yang tidak bisa
+    di-decode (mis. objek terakhir yang terpotong max_new_tokens) dilewati.
+    """
+    objects = []
+    pos = text.find("{", start)
+    while pos != -1:
+        try:
+            obj, end = _JSON_DECODER.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            pos = text.find("{", pos + 1)
+            continue
+        objects.append(obj)
+        pos = text.find("{", end)
+    return objects
+
+
 def parse_multi_ticket_json(raw_json: str):
     """
     1) Bersihkan markdown
@@ -93,74 +200,164 @@ def parse_multi_ticket_json(raw_json: str):
        Jika arrival_station adalah Chinese & cocok di endStaName, ganti dengan endStaEName
        Kalau tidak cocok, biarkan apa adanya.
     """
-
-    import re
-    import json
-
-    # (a) Bersihkan format markdown
+    # (a) Bersihkan format markdown dan sisa prompt di luar JSON
     cleaned = raw_json.replace("```", "").replace("json\n", "").strip()
+    cleaned = _PROMPT_ECHO_RE.sub("", cleaned).strip()
 
-    # Hapus teks yang tidak diinginkan (jika ada).
-    # Contoh, kalau Qwen memunculkan tambahan keterangan di luar JSON
-    # Anda bisa pakai regex atau .split() dsb.
-    cleaned = re.sub(r"(?m)^\s*[-—]*\s*票據文本如下：\s*\n", "", cleaned).strip()
-
-    # (b) Coba parse JSON dengan beberapa fallback
+    # (b) Nilai JSON pertama: array utuh jika bisa di-decode; selain itu
+    #     (objek lepas, array terpotong, teks pengantar) ambil setiap objek lengkap
     parsed = None
-    try:
-        # Jika langsung berupa array JSON
-        if cleaned.startswith("["):
-            parsed = json.loads(cleaned)
-
-        # Jika langsung berupa object JSON
-        elif cleaned.startswith("{"):
-            # Periksa apakah ada beberapa objek
-            json_objects = re.findall(r'\{.*?\}', cleaned, re.DOTALL)
-
-            if len(json_objects) == 1:
-                parsed = json.loads(json_objects[0])
-            else:
-                # Jika ada beberapa object JSON, parse semuanya lalu jadikan list
-                parsed_list = []
-                for obj in json_objects:
-                    try:
-                        parsed_list.append(json.loads(obj))
-                    except:
-                        pass
-                parsed = parsed_list if parsed_list else []
-        else:
-            # Terakhir, coba parse langsung
-            parsed = json.loads(cleaned)
-
-    except json.JSONDecodeError:
-        # Kalau tetap gagal parse, Anda bisa memutuskan mau return apa
-        # supaya aplikasi tidak langsung crash
-        print("Warning: Gagal decode JSON dari output model.")
-        return []  # fallback: kosong saja
+    first = min((i for i in (cleaned.find("["), cleaned.find("{")) if i != -1), default=-1)
+    if first != -1 and cleaned[first] == "[":
+        try:
+            parsed, _ = _JSON_DECODER.raw_decode(cleaned, first)
+        except json.JSONDecodeError:
+            pass
+    if parsed is None:
+        parsed = _scan_json_objects(cleaned, first) if first != -1 else []
+        if not parsed:
+            # Supaya aplikasi tidak crash: kembalikan list kosong
+            logger.warning("Gagal decode JSON dari output model.")
 
     # (c) Normalisasi => pastikan `parsed` berbentuk list
     if isinstance(parsed, dict):
         parsed = [parsed]
     elif not isinstance(parsed, list):
-        # Kalau aneh, ya fallback jadi list kosong
         parsed = []
 
     # (d) Cocokkan departure_station & arrival_station ke data stasiun
-    for ticket in parsed:
+    map_station_names(parsed)
+    return parsed
+
+
+def map_station_names(tickets: list) -> list:
+    """
+    Jika departure_station adalah nama China di startStaName, ganti dengan startStaEName;
+    jika arrival_station ada di endStaName, ganti dengan endStaEName. Selain itu biarkan.
+    """
+    station_index = get_station_index()
+    for ticket in tickets:
         dep = ticket.get("departure_station", "")
         arr = ticket.get("arrival_station", "")
 
-        matching_dep = df_stations[df_stations["startStaName"] == dep]
-        if not matching_dep.empty:
-            ticket["departure_station"] = matching_dep.iloc[0]["startStaEName"]
+        dep_ename = station_index.english_departure(dep)
+        if dep_ename is not None:
+            ticket["departure_station"] = dep_ename
 
-        matching_arr = df_stations[df_stations["endStaName"] == arr]
-        if not matching_arr.empty:
-            ticket["arrival_station"] = matching_arr.iloc[0]["endStaEName"]
+        arr_ename = station_index.english_arrival(arr)
+        if arr_ename is not None:
+            ticket["arrival_station"] = arr_ename
+    return tickets
 
-    return parsed
+
+class TicketStreamParser:
+    """
+    Parser inkremental untuk output multi-ticket yang sedang di-stream.
+    feed() menerima potongan teks dan mengembalikan setiap objek JSON top-level
+    (mis. elemen array) yang sudah lengkap sejak pemanggilan sebelumnya.
+    Teks di luar objek (kurung siku, koma, pagar markdown) diabaikan.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list:
+        completed = []
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads("".join(self._buffer))
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(obj, dict):
+                        completed.append(obj)
+        return completed
 
 
+class JsonArrayTracker:
+    """
+    Seperti TicketStreamParser, tetapi hanya melacak apakah array JSON
+    top-level pertama sudah ditutup. Teks sebelum "[" (pengantar, pagar
+    markdown) diabaikan; kurung di dalam string tidak dihitung.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        for ch in chunk:
+            if self.closed:
+                break
+            if self._depth == 0:
+                if ch == "[":
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                self.closed = self._depth == 0
+        return self.closed
+
+
+def resolve_ticket_stations(tickets: list) -> list:
+    """
+    Koreksi nama stasiun hasil OCR yang tidak cocok persis dengan CSV
+    (mis. "Taipel" -> "Taipei") lewat pencocokan fuzzy, sebelum mileage,
+    validasi dan fallback di app. Semua nama dalam list dicocokkan dalam satu batch.
+    Nama tanpa kandidat yang cukup mirip dibiarkan apa adanya.
+    """
+    dict_tickets = [t for t in tickets if isinstance(t, dict)]
+    if not dict_tickets:
+        return tickets
+
+    matcher = get_station_matcher()
+    for field, match in (
+        ("departure_station", matcher.match_departures),
+        ("arrival_station", matcher.match_arrivals),
+    ):
+        names = [t.get(field, "") for t in dict_tickets]
+        for ticket, name, matched in zip(dict_tickets, names, match(names)):
+            if matched is not None and matched != name:
+                logger.info("koreksi stasiun", extra={"field": field, "from": name, "to": matched})
+                ticket[field] = matched
+    return tickets
+
 
 def add_mileage_to_ticket(ticket: dict) -> dict:
     dep = ticket.get("departure_station", "").strip()
@@ -171,22 +368,7 @@ def add_mileage_to_ticket(ticket: dict) -> dict:
         ticket["mileage"] = None
         return ticket
 
-    # Pilih kolom (is_chinese akan False jika dep Latin)
-    departure_col = "startStaName" if is_chinese(dep) else "startStaEName"
-    arrival_col   = "endStaName"   if is_chinese(arr) else "endStaEName"
-
-    # Samakan ke format lower() agar match
-    dep_lower = dep.lower()
-    arr_lower = arr.lower()
-
-    # Bandingkan df
-    matching_rows = df_stations[
-        (df_stations[departure_col].str.strip().str.lower() == dep_lower) &
-        (df_stations[arrival_col].str.strip().str.lower() == arr_lower)
-    ]
-    if not matching_rows.empty:
-        ticket["mileage"] = matching_rows.iloc[0]["mileage"]
-    else:
-        ticket["mileage"] = None
+    # Kolom China/Inggris dipilih per sisi (is_chinese), cocokkan strip + lower()
+    ticket["mileage"] = get_station_index().mileage(dep, arr)
 
     return ticket
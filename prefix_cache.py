@@ -0,0 +1,214 @@
+# prefix_cache.py
+"""
+Reuse KV-cache untuk awalan prompt yang sama di setiap request.
+
+Setiap request mengirim system prompt + instruksi yang sama (prompt multi
+ratusan token); hanya image yang berbeda. Dengan PREFIX_CACHE=1:
+  - past_key_values awalan (token sampai <|vision_start|> pertama) dihitung
+    sekali per model (per awalan unik, LRU PREFIX_CACHE_SIZE) lalu dipakai
+    ulang di semua request dan batch; prefill hanya menghitung image + sisa
+  - awalan itu panjang hanya jika PROMPT_TEXT_FIRST=1: build_messages
+    menaruh teks prompt SEBELUM image. Dengan urutan semula (image dulu)
+    yang di-cache hanya system prompt + header pesan user
+
+Batch campuran (mis. prompt single + multi) tetap bisa: setiap baris memakai
+awalannya sendiri. Input disusun ulang per baris menjadi
+    [pad][awalan] [pad][image + sisa]
+dengan attention_mask 0 di pad, sehingga KV awalan (di-pad kiri) bisa
+disusun jadi satu cache batch.
+
+Ditulis untuk API transformers 4.49 (requirements.txt): Qwen2.5-VL di sana
+membuang pixel_values begitu cache_position tidak mulai dari 0. Karena itu
+apply() sendiri yang mem-prefill image + sisa prompt (kecuali token
+terakhir) di atas KV awalan, dengan posisi mRoPE dari get_rope_index atas
+seluruh baris, lalu mengisi model.rope_deltas. generate hanya memproses
+token terakhir (teks), jadi hasilnya sama dengan prefill penuh. apply() dan
+generate harus berada di bawah lock generate yang sama (inference_core).
+
+PREFIX_CACHE default aktif; PROMPT_TEXT_FIRST default mati karena urutan
+teks-lalu-image mengubah prompt yang dilihat model (bukan hanya kecepatan),
+jadi ikut kunci result cache (prefix_signature) dan harus dibandingkan
+akurasinya dulu lewat benchmarks/bench_upload.py --mode real dengan
+PROMPT_TEXT_FIRST=0 vs 1.
+
+Model tanpa config Qwen-VL (mis. stub) tidak memakai cache KV, hanya urutan
+pesannya.
+"""
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+from telemetry import register_collector, stage
+
+logger = logging.getLogger(__name__)
+
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_SIZE = int(os.getenv("PREFIX_CACHE_SIZE", "8"))
+PROMPT_TEXT_FIRST = os.getenv("PROMPT_TEXT_FIRST", "0") == "1"
+
+def text_first() -> bool:
+    """True jika teks prompt ditaruh sebelum image dalam pesan chat."""
+    return PROMPT_TEXT_FIRST
+
+
+def enabled() -> bool:
+    """True jika KV awalan prompt dipakai ulang (PREFIX_CACHE)."""
+    return PREFIX_CACHE
+
+
+def prefix_signature() -> str:
+    """Ikut kunci ResultCache: urutan teks/image mengubah output model."""
+    return "order=text-first" if text_first() else "order=image-first"
+
+
+class PrefixStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.entries = 0
+
+    def record(self, hit: bool, tokens: int):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.reused_tokens += tokens
+            else:
+                self.misses += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens,
+                "entries": self.entries,
+            }
+
+
+stats = PrefixStats()
+register_collector("ticket_prefix_cache", stats.snapshot)
+
+
+class PrefixKV:
+    """KV awalan per model: {tuple token awalan: [(keys, values) per layer]}, LRU."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, model, tokens: tuple) -> list:
+        with self._lock:
+            layers = self._entries.get(tokens)
+            if layers is not None:
+                self._entries.move_to_end(tokens)
+                stats.record(True, len(tokens))
+                return layers
+            # Dihitung di dalam lock: request bersamaan dengan awalan sama tidak menghitung dua kali
+            with stage("prefix_prefill"), torch.no_grad():
+                input_ids = torch.tensor([tokens], dtype=torch.long, device=model.device)
+                output = model(input_ids=input_ids, use_cache=True)
+            layers = list(output.past_key_values.to_legacy_cache())
+            self._entries[tokens] = layers
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            stats.entries = len(self._entries)
+            stats.record(False, len(tokens))
+            logger.info("KV awalan prompt dihitung", extra={"tokens": len(tokens)})
+            return layers
+
+
+# Per objek model; entri hilang bersama model saat unload_model()
+_prefixes = weakref.WeakKeyDictionary()
+_prefixes_lock = threading.Lock()
+
+
+def _prefix_kv(model) -> PrefixKV:
+    with _prefixes_lock:
+        prefix_kv = _prefixes.get(model)
+        if prefix_kv is None:
+            prefix_kv = _prefixes[model] = PrefixKV(PREFIX_CACHE_SIZE)
+        return prefix_kv
+
+
+def _vision_start_id(model):
+    return getattr(getattr(model, "config", None), "vision_start_token_id", None)
+
+
+def apply(model, processor, inputs):
+    """
+    (inputs, past_key_values) untuk model.generate. past_key_values sudah
+    berisi seluruh prompt kecuali token terakhir (lihat docstring modul). Jika
+    cache awalan tidak bisa dipakai (nonaktif, model bukan Qwen-VL, baris
+    tanpa image), inputs dikembalikan apa adanya dengan past_key_values None.
+    """
+    start_id = _vision_start_id(model)
+    if start_id is None or not enabled():
+        return inputs, None
+
+    input_ids, attention_mask = inputs["input_ids"], inputs["attention_mask"]
+    # Kolom token asli per baris, dipisah di <|vision_start|> pertama
+    splits = []
+    for row, mask in zip(input_ids.tolist(), attention_mask.tolist()):
+        columns = [i for i, m in enumerate(mask) if m]
+        tokens = [row[i] for i in columns]
+        if start_id not in tokens[1:]:
+            return inputs, None
+        split = tokens.index(start_id)
+        splits.append((columns[:split], columns[split:], tuple(tokens[:split])))
+
+    prefix_len = max(len(prefix) for prefix, _, _ in splits)
+    rest_len = max(len(rest) for _, rest, _ in splits)
+    width = prefix_len + rest_len
+    tokenizer = getattr(processor, "tokenizer", processor)
+    pad_id = getattr(tokenizer, "pad_token_id", None) or 0
+
+    # Semua tensor per token (input_ids, attention_mask, mm_token_type_ids, ...) disusun ulang sama
+    batch, length = input_ids.shape
+    for key, value in list(inputs.items()):
+        if not (isinstance(value, torch.Tensor) and value.shape == (batch, length)):
+            continue
+        arranged = value.new_full((batch, width), pad_id if key == "input_ids" else 0)
+        for row, (prefix, rest, _) in enumerate(splits):
+            arranged[row, prefix_len - len(prefix):prefix_len] = value[row, prefix]
+            arranged[row, width - len(rest):] = value[row, rest]
+        inputs[key] = arranged
+
+    prefix_kv = _prefix_kv(model)
+    per_row = [prefix_kv.get(model, tokens) for _, _, tokens in splits]
+    layers = []
+    for layer in range(len(per_row[0])):
+        keys, values = per_row[0][layer]
+        batch_keys = keys.new_zeros((batch, keys.shape[1], prefix_len, keys.shape[3]))
+        batch_values = values.new_zeros((batch, values.shape[1], prefix_len, values.shape[3]))
+        for row, row_layers in enumerate(per_row):
+            row_keys, row_values = row_layers[layer]
+            batch_keys[row, :, prefix_len - row_keys.shape[2]:] = row_keys[0]
+            batch_values[row, :, prefix_len - row_values.shape[2]:] = row_values[0]
+        layers.append((batch_keys, batch_values))
+
+    cache = DynamicCache.from_legacy_cache(tuple(layers))
+
+    # Prefill image + sisa prompt di atas KV awalan; token terakhir diproses generate
+    input_ids, attention_mask = inputs["input_ids"], inputs["attention_mask"]
+    with stage("prefix_rest_prefill"), torch.no_grad():
+        position_ids, rope_deltas = model.get_rope_index(
+            input_ids, inputs.get("image_grid_thw"), inputs.get("video_grid_thw"), inputs.get("second_per_grid_ts"),
+            attention_mask,
+        )
+        model(
+            input_ids=input_ids[:, prefix_len:-1], attention_mask=attention_mask[:, :-1],
+            position_ids=position_ids[:, :, prefix_len:-1], past_key_values=cache,
+            pixel_values=inputs.get("pixel_values"), image_grid_thw=inputs.get("image_grid_thw"),
+            cache_position=torch.arange(prefix_len, width - 1, device=input_ids.device), use_cache=True,
+        )
+    # Posisi token berikutnya = cache_position + rope_deltas (seperti setelah prefill biasa)
+    model.rope_deltas = rope_deltas
+    return inputs, cache
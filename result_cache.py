@@ -0,0 +1,162 @@
+# result_cache.py
+"""
+Cache hasil model (teks mentah per prompt) dengan kunci konten:
+SHA-256 byte image + prompt + max_new_tokens + versi model.
+
+Dua tingkat:
+  - memori: LRU (OrderedDict) dengan batas jumlah entri
+  - disk (opsional): satu file per kunci di `disk_dir`, entri paling lama
+    tidak dipakai (mtime) dihapus jika total ukuran melewati `disk_max_bytes`
+
+Yang disimpan adalah teks mentah dari generate, bukan hasil parse, sehingga
+parsing/validasi tetap memakai data stasiun terbaru.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(image_sha256: str, prompt: str, max_new_tokens: int, model_version: str) -> str:
+    payload = json.dumps([image_sha256, prompt, max_new_tokens, model_version], ensure_ascii=False)
+    return sha256_bytes(payload.encode("utf-8"))
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, disk_dir: str = None, disk_max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    # -- akses -------------------------------------------------------------
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value)
+        return value
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    # -- memori ------------------------------------------------------------
+    def _memory_put(self, key: str, value: str):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # -- disk --------------------------------------------------------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.txt")
+
+    def _disk_entries(self):
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _disk_get(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            # mtime dipakai sebagai penanda "terakhir dipakai" untuk eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def _disk_put(self, key: str, value: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+            new_size = os.path.getsize(path)
+        except OSError as exc:
+            logger.warning(f"Gagal menulis result cache ({exc}).")
+            return
+        with self._lock:
+            self._disk_bytes += new_size - old_size
+            over_limit = self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.disk_evictions += evicted
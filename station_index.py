@@ -0,0 +1,122 @@
+# station_index.py
+"""
+Index stasiun yang dibangun sekali dari DataFrame stations_database_modified.csv.
+
+Menggantikan filter pandas per panggilan (`.str.strip().str.lower()` atas seluruh
+kolom) di is_valid_ticket, parse_multi_ticket_json dan add_mileage_to_ticket
+dengan lookup dict/set O(1). Semantik pencocokan sama dengan versi pandas:
+  - validasi & mileage: strip() + lower(), baris pertama yang cocok menang
+  - penggantian nama China -> Inggris: sama persis (tanpa normalisasi)
+"""
+import re
+from collections import namedtuple
+
+Station = namedtuple("Station", ["name", "ename"])
+
+_CHINESE_RE = re.compile(r'[\u4e00-\u9fff]+')
+
+
+def normalize_name(name) -> str:
+    """Kunci lookup: sama dengan .str.strip().str.lower() di pandas."""
+    return str(name).strip().lower()
+
+
+def is_chinese(text: str) -> bool:
+    """True jika text mengandung huruf China."""
+    return bool(_CHINESE_RE.search(text))
+
+
+class StationIndex:
+    """
+    Lookup stasiun dari tabel rute (startStaName, startStaEName, endStaName,
+    endStaEName, mileage).
+    """
+
+    def __init__(self, rows):
+        """
+        `rows`: iterable of (start_name, start_ename, end_name, end_ename, mileage).
+        Gunakan StationIndex.from_dataframe untuk membangun dari df_stations.
+        """
+        # Nama (China/Inggris, dinormalisasi) -> Station kanonik
+        self.departures = {}
+        self.arrivals = {}
+        # Nama China persis -> nama Inggris (dipakai parse_multi_ticket_json)
+        self.departure_enames = {}
+        self.arrival_enames = {}
+        # (dep pakai kolom China?, arr pakai kolom China?) -> {(dep, arr): mileage}
+        self.mileage_by_columns = {
+            (False, False): {},
+            (False, True): {},
+            (True, False): {},
+            (True, True): {},
+        }
+        self.route_count = 0
+
+        for start_name, start_ename, end_name, end_ename, mileage in rows:
+            self.route_count += 1
+            dep_keys = {True: _key(start_name), False: _key(start_ename)}
+            arr_keys = {True: _key(end_name), False: _key(end_ename)}
+
+            self._add_station(self.departures, start_name, start_ename, dep_keys.values())
+            self._add_station(self.arrivals, end_name, end_ename, arr_keys.values())
+            if isinstance(start_name, str):
+                self.departure_enames.setdefault(start_name, start_ename)
+            if isinstance(end_name, str):
+                self.arrival_enames.setdefault(end_name, end_ename)
+
+            for (dep_zh, arr_zh), table in self.mileage_by_columns.items():
+                dep_key, arr_key = dep_keys[dep_zh], arr_keys[arr_zh]
+                if dep_key is not None and arr_key is not None:
+                    table.setdefault((dep_key, arr_key), mileage)
+
+        # Set validitas (nama dinormalisasi dari kolom China dan Inggris)
+        self.departure_names = frozenset(self.departures)
+        self.arrival_names = frozenset(self.arrivals)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        columns = ["startStaName", "startStaEName", "endStaName", "endStaEName", "mileage"]
+        return cls(df[columns].itertuples(index=False, name=None))
+
+    @staticmethod
+    def _add_station(table: dict, name, ename, keys):
+        station = Station(name, ename)
+        for key in keys:
+            if key is not None:
+                table.setdefault(key, station)
+
+    # -- lookup ------------------------------------------------------------
+    def lookup_departure(self, name: str):
+        """Nama China atau Inggris -> Station kanonik, atau None."""
+        return self.departures.get(normalize_name(name))
+
+    def lookup_arrival(self, name: str):
+        return self.arrivals.get(normalize_name(name))
+
+    def english_departure(self, name: str):
+        """Nama China persis (tanpa normalisasi) -> nama Inggris, atau None."""
+        return self.departure_enames.get(name) if isinstance(name, str) else None
+
+    def english_arrival(self, name: str):
+        return self.arrival_enames.get(name) if isinstance(name, str) else None
+
+    def is_valid_departure(self, name: str) -> bool:
+        return normalize_name(name) in self.departure_names
+
+    def is_valid_arrival(self, name: str) -> bool:
+        return normalize_name(name) in self.arrival_names
+
+    def mileage(self, dep: str, arr: str):
+        """
+        Mileage rute dep -> arr, atau None. Kolom China/Inggris dipilih per sisi
+        dengan is_chinese, sama seperti add_mileage_to_ticket versi pandas.
+        """
+        table = self.mileage_by_columns[(is_chinese(dep), is_chinese(arr))]
+        return table.get((normalize_name(dep), normalize_name(arr)))
+
+
+def _key(value):
+    # NaN / nilai non-string tidak pernah cocok di .str accessor pandas
+    if not isinstance(value, str):
+        return None
+    return normalize_name(value)
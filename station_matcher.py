@@ -0,0 +1,84 @@
+# station_matcher.py
+"""
+Pencocokan fuzzy nama stasiun hasil OCR ("Taipel", "Kaohsiung Sta") ke nama
+di stations_database_modified.csv.
+
+Nama yang sudah cocok persis di StationIndex tidak disentuh. Sisanya dicocokkan
+sekaligus dengan rapidfuzz.process.cdist (satu matriks skor per batch), lalu
+diambil kandidat terbaik yang skornya >= score_cutoff.
+"""
+import os
+
+from rapidfuzz import fuzz, process, utils
+
+from station_index import StationIndex, normalize_name
+
+# Skor minimal (0-100) agar nama dianggap cocok; naikkan jika terlalu longgar
+STATION_FUZZY_CUTOFF = float(os.getenv("STATION_FUZZY_CUTOFF", "80"))
+
+
+class _SideMatcher:
+    """Kandidat untuk satu sisi (departure / arrival)."""
+
+    def __init__(self, stations: dict):
+        # Satu kandidat per nama asli (China & Inggris) dari tabel stasiun
+        names = {}
+        for station in stations.values():
+            for name in (station.name, station.ename):
+                if isinstance(name, str) and name.strip():
+                    names.setdefault(utils.default_process(name), name.strip())
+        self.keys = list(names)
+        self.names = [names[key] for key in self.keys]
+        self.valid = frozenset(stations)
+
+    def match(self, queries: list, scorer, score_cutoff: float, workers: int) -> list:
+        results = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            if not isinstance(query, str) or not query.strip():
+                continue
+            if normalize_name(query) in self.valid:
+                results[i] = query
+            else:
+                pending.append(i)
+        if not pending or not self.keys:
+            return results
+
+        processed = [utils.default_process(queries[i]) for i in pending]
+        scores = process.cdist(
+            processed, self.keys, scorer=scorer, score_cutoff=score_cutoff, workers=workers
+        )
+        best = scores.argmax(axis=1)
+        for row, i in enumerate(pending):
+            col = best[row]
+            if scores[row, col] >= score_cutoff:
+                results[i] = self.names[col]
+        return results
+
+
+class StationMatcher:
+    """
+    Dibangun sekali per StationIndex (lihat stations_data.get_station_matcher).
+    match_*() menerima list nama dan mengembalikan list nama kanonik
+    (atau None jika tidak ada kandidat di atas cutoff).
+    """
+
+    def __init__(self, index: StationIndex, score_cutoff: float = STATION_FUZZY_CUTOFF,
+                 scorer=fuzz.WRatio, workers: int = 1):
+        self.score_cutoff = score_cutoff
+        self.scorer = scorer
+        self.workers = workers
+        self._departures = _SideMatcher(index.departures)
+        self._arrivals = _SideMatcher(index.arrivals)
+
+    def match_departures(self, names: list) -> list:
+        return self._departures.match(names, self.scorer, self.score_cutoff, self.workers)
+
+    def match_arrivals(self, names: list) -> list:
+        return self._arrivals.match(names, self.scorer, self.score_cutoff, self.workers)
+
+    def match_departure(self, name: str):
+        return self.match_departures([name])[0]
+
+    def match_arrival(self, name: str):
+        return self.match_arrivals([name])[0]
@@ -0,0 +1,148 @@
+# stations_data.py
+"""
+Satu sumber data stasiun untuk seluruh proses.
+
+stations_database_modified.csv di-parse secara lazy saat pertama kali
+dibutuhkan, lalu disimpan sebagai pickle di STATIONS_CACHE_DIR dengan kunci
+SHA-256 isi CSV. Worker berikutnya cukup membaca pickle tersebut (tanpa import
+pandas). Jika CSV berubah (mtime/ukuran berbeda), reload() atau pengecekan
+berkala di get_station_index() membangun ulang index tanpa restart.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+
+from station_index import StationIndex
+from station_matcher import StationMatcher
+
+logger = logging.getLogger(__name__)
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STATIONS_CSV = os.getenv("STATIONS_CSV", os.path.join(_BASE_DIR, "stations_database_modified.csv"))
+STATIONS_CACHE_DIR = os.getenv("STATIONS_CACHE_DIR", os.path.join(_BASE_DIR, ".cache"))
+# Selang minimal (detik) antar pengecekan mtime CSV; 0 = tidak pernah cek otomatis
+STATIONS_RELOAD_INTERVAL_S = float(os.getenv("STATIONS_RELOAD_INTERVAL_S", "30"))
+
+COLUMNS = ["startStaName", "startStaEName", "endStaName", "endStaEName", "mileage"]
+# Naikkan jika format isi pickle berubah
+_CACHE_FORMAT = 1
+
+_lock = threading.Lock()
+_index = None
+_matcher = None
+_signature = None
+_last_check = 0.0
+
+
+def _csv_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _csv_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(sha: str) -> str:
+    return os.path.join(STATIONS_CACHE_DIR, f"stations-v{_CACHE_FORMAT}-{sha[:16]}.pkl")
+
+
+def _read_rows_from_csv(path: str) -> list:
+    # pandas hanya di-import saat cache miss
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    return list(df[COLUMNS].itertuples(index=False, name=None))
+
+
+def _load_rows(path: str) -> list:
+    """Baris rute dari pickle cache jika ada, kalau tidak parse CSV lalu tulis cache."""
+    sha = _csv_sha256(path)
+    cache_file = _cache_path(sha)
+    try:
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    rows = _read_rows_from_csv(path)
+    try:
+        os.makedirs(STATIONS_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        _remove_stale_caches(keep=cache_file)
+    except OSError as exc:
+        # Cache hanya optimasi; kegagalan tulis tidak boleh menggagalkan request
+        logger.warning(f"Gagal menulis cache stasiun ({exc}).")
+    return rows
+
+
+def _remove_stale_caches(keep: str):
+    for name in os.listdir(STATIONS_CACHE_DIR):
+        path = os.path.join(STATIONS_CACHE_DIR, name)
+        if name.startswith("stations-") and name.endswith(".pkl") and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def reload(force: bool = False) -> bool:
+    """
+    Bangun ulang index jika CSV berubah sejak dimuat (atau selalu jika force).
+    Return True jika index dimuat ulang.
+    """
+    global _index, _signature, _last_check
+    with _lock:
+        signature = _csv_signature(STATIONS_CSV)
+        _last_check = time.monotonic()
+        if not force and _index is not None and signature == _signature:
+            return False
+        _index = StationIndex(_load_rows(STATIONS_CSV))
+        _signature = signature
+        return True
+
+
+def get_station_index() -> StationIndex:
+    """
+    Index stasiun bersama, dimuat pada pemanggilan pertama. Setiap
+    STATIONS_RELOAD_INTERVAL_S detik mtime CSV dicek dan index dimuat ulang
+    bila berubah.
+    """
+    index = _index
+    if index is None:
+        reload()
+    elif STATIONS_RELOAD_INTERVAL_S > 0 and time.monotonic() - _last_check >= STATIONS_RELOAD_INTERVAL_S:
+        try:
+            reload()
+        except OSError as exc:
+            # CSV sedang diganti / hilang sementara: tetap pakai index lama
+            logger.warning(f"Gagal memeriksa CSV stasiun ({exc}).")
+    return _index
+
+
+def is_loaded() -> bool:
+    return _index is not None
+
+
+def get_station_matcher() -> StationMatcher:
+    """Matcher fuzzy untuk index saat ini; dibangun ulang setelah reload."""
+    global _matcher
+    index = get_station_index()
+    matcher = _matcher
+    if matcher is None or matcher[0] is not index:
+        with _lock:
+            if _matcher is None or _matcher[0] is not index:
+                _matcher = (index, StationMatcher(index))
+            matcher = _matcher
+    return matcher[1]
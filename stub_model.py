@@ -0,0 +1,202 @@
+# stub_model.py
+"""
+Model tiruan (stub) yang meniru antarmuka Qwen2.5-VL + processor secukupnya
+untuk pipeline inference. Dipakai untuk menguji perilaku loading/batching di CPU
+tanpa mengunduh bobot model.
+
+Contoh:
+    import model_loader, stub_model
+    model_loader.set_loader(stub_model.load_stub_model)
+"""
+import torch
+from transformers import BatchFeature
+
+PAD_ID = 0
+EOS_ID = 1
+_BYTE_OFFSET = 2
+_WHITESPACE_IDS = tuple(ord(ch) + _BYTE_OFFSET for ch in " \t\n\r")
+
+DEFAULT_SINGLE_RESPONSE = "2024.01.05 Taipei → Hsinchu 08:10 09:25 NT$177"
+DEFAULT_MULTI_RESPONSE = (
+    '[{"date": "2024.01.05", "departure_station": "Taipei", "arrival_station": "Hsinchu", '
+    '"departure_time": "08:10", "arrival_time": "09:25", "price": "177"}]'
+)
+
+load_count = 0
+
+
+def _encode(text: str) -> list:
+    return [b + _BYTE_OFFSET for b in text.encode("utf-8")]
+
+
+def _decode(ids) -> str:
+    data = bytes(int(i) - _BYTE_OFFSET for i in ids if _BYTE_OFFSET <= int(i) < 256 + _BYTE_OFFSET)
+    return data.decode("utf-8", errors="ignore")
+
+
+class StubProcessor:
+    """Processor tiruan: tokenisasi per byte UTF-8, image diwakili satu token."""
+
+    image_token_id = 255 + _BYTE_OFFSET + 1
+    eos_token_id = EOS_ID
+    pad_token_id = PAD_ID
+
+    def __init__(self):
+        self.padding_side = "left"
+
+    def __len__(self):
+        return self.image_token_id + 1
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        parts = []
+        for message in messages:
+            for item in message["content"]:
+                if item["type"] == "image":
+                    parts.append("<image>")
+                elif item["type"] == "text":
+                    parts.append(item["text"])
+        text = "".join(parts)
+        if add_generation_prompt:
+            text += "\n"
+        return text
+
+    def __call__(self, text, images=None, videos=None, padding=True, return_tensors="pt", **kwargs):
+        rows = []
+        for t in text:
+            ids = []
+            for i, chunk in enumerate(t.split("<image>")):
+                if i:
+                    ids.append(self.image_token_id)
+                ids.extend(_encode(chunk))
+            rows.append(ids)
+        width = max(len(r) for r in rows)
+        input_ids = torch.full((len(rows), width), PAD_ID, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, ids in enumerate(rows):
+            if self.padding_side == "left":
+                input_ids[i, width - len(ids):] = torch.tensor(ids)
+                attention_mask[i, width - len(ids):] = 1
+            else:
+                input_ids[i, :len(ids)] = torch.tensor(ids)
+                attention_mask[i, :len(ids)] = 1
+        data = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if images:
+            data["pixel_values"] = torch.zeros((len(images), 3))
+        return BatchFeature(data=data)
+
+    def batch_decode(self, sequences, skip_special_tokens=True, clean_up_tokenization_spaces=False):
+        return [_decode(seq) for seq in sequences]
+
+    def decode(self, ids, skip_special_tokens=True, **kwargs):
+        return _decode(ids)
+
+
+class StubModel:
+    """
+    Model tiruan. Jawaban dipilih dari prompt: prompt multi (berisi "JSON")
+    mendapat multi_response, selain itu single_response; `respond(prompt)`
+    (opsional) menggantikan keduanya.
+    Setiap pemanggilan generate dicatat di `calls` (bentuk batch, attention_mask
+    & max_new_tokens).
+    Jika `logits_processor` / `stopping_criteria` diberikan, decode greedy per
+    langkah: skor token tertinggi untuk karakter jawaban berikutnya, lebih
+    rendah untuk karakter yang muncul lebih jauh, sehingga processor yang
+    menolak karakter (mis. pagar markdown) membuat stub melompat ke karakter
+    sah terdekat. Baris yang dihentikan stopping_criteria diisi PAD_ID.
+    """
+
+    def __init__(self, single_response=DEFAULT_SINGLE_RESPONSE, multi_response=DEFAULT_MULTI_RESPONSE,
+                 respond=None):
+        self.single_response = single_response
+        self.multi_response = multi_response
+        self.respond = respond
+        self.calls = []
+        self.device = torch.device("cpu")
+
+    def _response_for(self, prompt_ids) -> str:
+        prompt = _decode(prompt_ids)
+        if self.respond is not None:
+            return self.respond(prompt)
+        return self.multi_response if "JSON" in prompt else self.single_response
+
+    def generate(self, input_ids=None, attention_mask=None, max_new_tokens=20, streamer=None,
+                 logits_processor=None, stopping_criteria=None, **kwargs):
+        self.calls.append({
+            "batch_shape": tuple(input_ids.shape),
+            "attention_mask": attention_mask.clone() if attention_mask is not None else None,
+            "max_new_tokens": max_new_tokens,
+            "constrained": bool(logits_processor),
+            "early_stop": bool(stopping_criteria),
+        })
+        if logits_processor or stopping_criteria:
+            return self._generate_stepwise(input_ids, max_new_tokens, streamer, logits_processor, stopping_criteria)
+        outputs = []
+        for row in input_ids:
+            answer = (_encode(self._response_for(row)) + [EOS_ID])[:max_new_tokens]
+            outputs.append(answer)
+        width = max(len(o) for o in outputs)
+        new_tokens = torch.full((input_ids.shape[0], width), PAD_ID, dtype=torch.long)
+        for i, answer in enumerate(outputs):
+            new_tokens[i, :len(answer)] = torch.tensor(answer)
+        if streamer is not None:
+            # Seperti transformers: prompt dulu, lalu token baru semua baris per langkah
+            streamer.put(input_ids)
+            for step in range(width):
+                streamer.put(new_tokens[:, step])
+            streamer.end()
+        return torch.cat([input_ids, new_tokens], dim=1)
+
+    def _generate_stepwise(self, input_ids, max_new_tokens, streamer, logits_processor, stopping_criteria):
+        vocab = StubProcessor.image_token_id + 1
+        answers = [_encode(self._response_for(row)) for row in input_ids]
+        positions = [0] * len(answers)
+        finished = [False] * len(answers)
+        sequences = input_ids
+        if streamer is not None:
+            streamer.put(input_ids)
+        for _ in range(max_new_tokens):
+            scores = torch.full((len(answers), vocab), -1.0)
+            # Di luar jawaban: spasi paling tidak disukai (seperti model sungguhan)
+            scores[:, list(_WHITESPACE_IDS)] = -2.0
+            for i, answer in enumerate(answers):
+                remaining = answer[positions[i]:]
+                for distance, token in reversed(list(enumerate(remaining))):
+                    scores[i, token] = 1.0 / (1 + distance)
+                scores[i, EOS_ID] = 1.0 / (1 + len(remaining))
+            if logits_processor:
+                scores = logits_processor(sequences, scores)
+            next_tokens = scores.argmax(dim=-1)
+            for i, token in enumerate(next_tokens.tolist()):
+                if finished[i]:
+                    next_tokens[i] = PAD_ID
+                    continue
+                remaining = answers[i][positions[i]:]
+                if token in remaining:
+                    positions[i] += remaining.index(token) + 1
+                finished[i] = token == EOS_ID
+            sequences = torch.cat([sequences, next_tokens[:, None]], dim=1)
+            if stopping_criteria:
+                stopped = stopping_criteria(sequences, scores).tolist()
+                finished = [done or stop for done, stop in zip(finished, stopped)]
+            if streamer is not None:
+                streamer.put(next_tokens)
+            if all(finished):
+                break
+        if streamer is not None:
+            streamer.end()
+        return sequences
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+
+def load_stub_model(single_response=DEFAULT_SINGLE_RESPONSE, multi_response=DEFAULT_MULTI_RESPONSE,
+                    respond=None):
+    """Pengganti load_model() untuk CPU: return (model, processor, device)."""
+    global load_count
+    load_count += 1
+    model = StubModel(single_response=single_response, multi_response=multi_response, respond=respond)
+    return model, StubProcessor(), torch.device("cpu")
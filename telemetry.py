@@ -0,0 +1,341 @@
+# telemetry.py
+"""
+Latensi per tahap, metrik format Prometheus, trace ID per request dan logging
+terstruktur, tanpa dependency tambahan.
+
+  - stage("nama")       context manager: durasi masuk histogram
+                        ticket_stage_seconds{stage="nama"} (+ log DEBUG)
+  - TokenTimer          streamer untuk model.generate: memisahkan prefill
+                        (sampai token pertama) dan decode, plus tokens/detik
+  - trace ID            contextvar; diisi middleware app dari header X-Request-ID
+                        (atau dibuat baru) dan ikut di setiap baris log
+  - render_metrics()    teks exposition Prometheus untuk GET /metrics
+  - configure_logging() LOG_LEVEL (default INFO) dan LOG_FORMAT (json / text)
+
+Teks mentah model dan detail per tahap hanya di level DEBUG, jadi pada level
+INFO jalur panas tidak memformat apa pun.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+TRACE_IDS = os.getenv("TRACE_IDS", "1") == "1"
+
+# Batas bucket (detik): dari tahap CPU milidetik sampai generate belasan detik
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+logger = logging.getLogger("telemetry")
+
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+# -- trace ID -------------------------------------------------------------
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_trace_id() -> str:
+    return trace_id_var.get()
+
+
+def set_trace_id(trace_id: str):
+    """Set trace ID untuk konteks saat ini; return token untuk reset_trace_id."""
+    return trace_id_var.set(trace_id or "-")
+
+
+def reset_trace_id(token):
+    trace_id_var.reset(token)
+
+
+# -- metrik ---------------------------------------------------------------
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        # labels => [jumlah per bucket (tidak kumulatif), sum, count]
+        self._series = {}
+
+    def observe(self, value: float, *labels):
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self, *labels) -> tuple:
+        """(sum, count) untuk satu kombinasi label (mis. benchmark per backend)."""
+        with self._lock:
+            series = self._series.get(labels)
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(c), s, n)) for labels, (c, s, n) in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "ticket_stage_seconds", "Durasi per tahap pipeline tiket (detik).", ("stage",)
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "ticket_http_request_seconds", "Durasi request HTTP (detik).", ("method", "route", "status")
+)
+GENERATED_TOKENS = Counter(
+    "ticket_generated_tokens_total", "Token baru yang dihasilkan model.generate (semua baris batch)."
+)
+DECODE_TOKENS_PER_SECOND = Histogram(
+    "ticket_decode_tokens_per_second", "Throughput tahap decode per pemanggilan generate (token/detik).",
+    ("backend",), buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+DECODE_STEPS_SAVED = Counter(
+    "ticket_decode_steps_saved_total", "Langkah decode yang tidak dijalankan karena early stopping (per generate)."
+)
+GENERATE_ROWS = Counter(
+    "ticket_generate_rows_total", "Baris generate menurut alasan berhenti (complete / eos / limit).", ("reason",)
+)
+VISION_TOKENS = Counter(
+    "ticket_vision_tokens_total", "Token vision image yang dibuka, sebelum / sesudah preprocessing.", ("when",)
+)
+
+_collectors_lock = threading.Lock()
+_collectors = []
+
+
+def register_collector(prefix: str, snapshot_fn):
+    """
+    Tambahkan metrik dari fungsi yang mengembalikan dict (mis. job_queue.metrics,
+    scheduler.metrics): setiap nilai angka jadi gauge `<prefix>_<key>`.
+    """
+    with _collectors_lock:
+        _collectors.append((prefix, snapshot_fn))
+
+
+def _render_collectors() -> list:
+    with _collectors_lock:
+        collectors = list(_collectors)
+    lines = []
+    for prefix, snapshot_fn in collectors:
+        try:
+            snapshot = snapshot_fn()
+        except Exception as exc:
+            logger.warning("collector gagal", extra={"collector": prefix, "error": str(exc)})
+            continue
+        for key, value in snapshot.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+    return lines
+
+
+def render_metrics() -> str:
+    """Semua metrik dalam format teks Prometheus (version 0.0.4)."""
+    lines = []
+    for metric in (STAGE_SECONDS, HTTP_REQUEST_SECONDS, GENERATED_TOKENS, DECODE_TOKENS_PER_SECOND,
+                   DECODE_STEPS_SAVED, GENERATE_ROWS):
+        lines.extend(metric.render())
+    lines.extend(_render_collectors())
+    return "\n".join(lines) + "\n"
+
+
+# -- timing ---------------------------------------------------------------
+@contextmanager
+def stage(name: str):
+    """Ukur durasi blok sebagai satu tahap pipeline."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("stage", extra={"stage": name, "ms": round(1000 * elapsed, 2)})
+
+
+def observe_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+
+
+class TokenTimer:
+    """
+    Dipasang sebagai `streamer` model.generate. transformers memanggil put()
+    sekali dengan token prompt sebelum prefill, lalu sekali per langkah decode
+    (token baru semua baris batch), dan end() di akhir. Jika `inner` diberikan
+    (mis. inference_core.RowStreamer), semua panggilan diteruskan. `backend`
+    (model_loader.backend_name) jadi label tokens/detik.
+    """
+
+    def __init__(self, inner=None, backend: str = "custom"):
+        self.inner = inner
+        self.backend = backend
+        self.started = None
+        self.first_token_at = None
+        self.finished = None
+        self.steps = 0
+        self.tokens = 0
+        self.prefill_tokens = 0
+
+    def put(self, value):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        else:
+            count = int(value.numel()) if hasattr(value, "numel") else 1
+            if self.first_token_at is None:
+                self.first_token_at = now
+                self.prefill_tokens = count
+            self.steps += 1
+            self.tokens += count
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def end(self):
+        self.finished = time.perf_counter()
+        if self.inner is not None:
+            self.inner.end()
+
+    def record(self):
+        """Masukkan prefill/decode/tokens ke metrik; return ringkasan dict."""
+        if self.started is None or self.first_token_at is None:
+            return None
+        finished = self.finished or time.perf_counter()
+        prefill_s = self.first_token_at - self.started
+        decode_s = finished - self.first_token_at
+        # Token pertama tiap baris dihasilkan oleh prefill; sisanya oleh langkah decode
+        decode_tokens = self.tokens - self.prefill_tokens
+        tokens_per_s = decode_tokens / decode_s if decode_s > 0 else 0.0
+        STAGE_SECONDS.observe(prefill_s, "prefill")
+        STAGE_SECONDS.observe(decode_s, "decode")
+        GENERATED_TOKENS.inc(self.tokens)
+        if decode_tokens:
+            DECODE_TOKENS_PER_SECOND.observe(tokens_per_s, self.backend)
+        summary = {
+            "prefill_ms": round(1000 * prefill_s, 1),
+            "decode_ms": round(1000 * decode_s, 1),
+            "steps": self.steps,
+            "tokens": self.tokens,
+            "tokens_per_s": round(tokens_per_s, 1),
+            "backend": self.backend,
+        }
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("generate", extra=summary)
+        return summary
+
+
+# -- logging --------------------------------------------------------------
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Satu objek JSON per baris: waktu, level, logger, pesan, trace_id + field extra."""
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        extra = {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith("_")}
+        if extra:
+            text += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return text
+
+
+def configure_logging(level: str = None, fmt: str = None, stream=None):
+    """Pasang handler root sekali (app.py / CLI); modul lain cukup logging.getLogger(__name__)."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if getattr(handler, "_telemetry", False):
+            root.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler._telemetry = True
+    handler.addFilter(TraceIdFilter())
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(level or LOG_LEVEL)
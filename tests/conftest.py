@@ -0,0 +1,52 @@
+# tests/conftest.py
+"""
+Fixture bersama untuk test pipeline di CPU dengan stub_model (tanpa bobot
+Qwen). Env diset sebelum modul app di-import: data stasiun dari
+tests/data/stations.csv, upload / ticket store / cache di direktori sementara.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+IMAGES_DIR = os.path.join(ROOT, "results")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+_WORK_DIR = tempfile.mkdtemp(prefix="ticket-tests-")
+os.environ.update({
+    "STATIONS_CSV": os.path.join(DATA_DIR, "stations.csv"),
+    "STATIONS_CACHE_DIR": os.path.join(_WORK_DIR, "stations-cache"),
+    "UPLOAD_DIR": os.path.join(_WORK_DIR, "uploads"),
+    "TICKET_STORE_PATH": os.path.join(_WORK_DIR, "tickets.jsonl"),
+    "RESULT_CACHE_SIZE": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+
+@pytest.fixture
+def stub_model():
+    """Pasang stub_model sebagai loader bersama; return modul stub_model."""
+    import model_loader
+    import stub_model as stub
+
+    previous = (model_loader._loader, model_loader._loader_kwargs)
+    model_loader.set_loader(stub.load_stub_model)
+    yield stub
+    model_loader.set_loader(previous[0], **previous[1])
+
+
+@pytest.fixture
+def client(stub_model, monkeypatch):
+    """TestClient app (startup: warmup stub + JobWorker di proses ini)."""
+    from fastapi.testclient import TestClient
+
+    # Template HTML dicari relatif ke direktori kerja
+    monkeypatch.chdir(ROOT)
+    import app
+
+    with TestClient(app.app) as test_client:
+        yield test_client
@@ -0,0 +1,107 @@
+# tests/test_batch_cli.py
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+import batch_cli
+import combined_inference
+from conftest import IMAGES_DIR
+
+IMAGES = [f"single{i}.jpeg" for i in range(7)]
+PROCESS_IMAGES = combined_inference.process_images
+
+
+class Crash(BaseException):
+    """Proses mati di tengah jalan (seperti SIGKILL / Ctrl+C, bukan error per gambar)."""
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    source = tmp_path / "images"
+    source.mkdir()
+    for name in IMAGES:
+        shutil.copy(os.path.join(IMAGES_DIR, name), source / name)
+    (source / "catatan.txt").write_text("bukan gambar")
+    return source
+
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["batch_cli.py", *map(str, args)])
+    batch_cli.main()
+
+
+def count_processed(monkeypatch, fail_on_call: int = None) -> list:
+    """Bungkus process_images: catat ukuran tiap batch, opsional 'crash' di panggilan ke-n."""
+    sizes = []
+
+    def recording(images):
+        if fail_on_call is not None and len(sizes) + 1 == fail_on_call:
+            raise Crash
+        sizes.append(len(images))
+        return PROCESS_IMAGES(images)
+
+    monkeypatch.setattr(combined_inference, "process_images", recording)
+    return sizes
+
+
+def read_records(path) -> list:
+    """Baris JSONL output; baris rusak sisa crash dilewati."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def test_resume_after_crash_processes_each_image_once(stub_model, image_dir, tmp_path, monkeypatch):
+    output = tmp_path / "out.jsonl"
+
+    first = count_processed(monkeypatch, fail_on_call=3)
+    with pytest.raises(Crash):
+        run_cli(monkeypatch, image_dir, "-o", output, "--stub", "--batch-size", 2)
+    assert first == [2, 2]
+    # Crash di tengah penulisan baris berikutnya
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"image": "terpotong')
+
+    second = count_processed(monkeypatch)
+    run_cli(monkeypatch, image_dir, "-o", output, "--stub", "--batch-size", 2)
+    assert sum(first) + sum(second) == len(IMAGES)
+
+    records = read_records(output)
+    processed = [os.path.basename(r["image"]) for r in records]
+    assert sorted(processed) == sorted(IMAGES)
+    for record in records:
+        assert set(record) == {"image", "tickets", "ms_per_image"}
+        assert record["tickets"][0]["departure_station"] == "Taipei"
+
+    # Jalankan lagi: semuanya sudah di checkpoint
+    third = count_processed(monkeypatch)
+    run_cli(monkeypatch, image_dir, "-o", output, "--stub")
+    assert third == []
+
+
+def test_failed_images_are_retried(stub_model, image_dir, tmp_path, monkeypatch):
+    output = tmp_path / "out.jsonl"
+    broken = image_dir / "rusak.jpeg"
+    broken.write_bytes(b"bukan jpeg")
+    run_cli(monkeypatch, image_dir, "-o", output, "--stub", "--batch-size", 4)
+
+    records = read_records(output)
+    errors = [r for r in records if "error" in r]
+    assert [os.path.basename(r["image"]) for r in errors] == ["rusak.jpeg"]
+    assert errors[0]["error"].startswith("decode:")
+    assert len(records) == len(IMAGES) + 1
+
+    # Gambar yang error dicoba lagi, yang sukses tidak
+    shutil.copy(os.path.join(IMAGES_DIR, "single8.jpeg"), broken)
+    sizes = count_processed(monkeypatch)
+    run_cli(monkeypatch, image_dir, "-o", output, "--stub")
+    assert sizes == [1]
+    assert "error" not in read_records(output)[-1]
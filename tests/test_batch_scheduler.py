@@ -0,0 +1,86 @@
+# tests/test_batch_scheduler.py
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import model_loader
+from batch_scheduler import BatchScheduler
+
+MAX_BATCH = 4
+
+
+def answer_for(prompt: str) -> str:
+    # Prompt test berbentuk "permintaan <n> ...": jawaban menyebut n-nya sendiri
+    return "jawaban " + re.search(r"permintaan (\d+)", prompt).group(1)
+
+
+@pytest.fixture
+def echo_model(stub_model):
+    model_loader.set_loader(stub_model.load_stub_model, respond=answer_for)
+    model, _, _ = model_loader.get_model()
+    return model
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = BatchScheduler(max_batch_size=MAX_BATCH, max_wait_ms=100)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def prompt(n: int) -> str:
+    # Panjang berbeda per request agar batch butuh padding
+    return f"permintaan {n} " + "x" * (n % 5)
+
+
+def test_concurrent_requests_are_batched_in_order(echo_model, scheduler):
+    image = Image.new("RGB", (56, 56), "white")
+    count = 10
+    start = threading.Barrier(count)
+
+    def request(n):
+        start.wait()
+        return scheduler.generate([image], [prompt(n)], 16)[0]
+
+    with ThreadPoolExecutor(count) as executor:
+        results = list(executor.map(request, range(count)))
+
+    assert results == [f"jawaban {n}" for n in range(count)]
+    sizes = [call["batch_shape"][0] for call in echo_model.calls]
+    assert sum(sizes) == count
+    assert all(size <= MAX_BATCH for size in sizes)
+    assert max(sizes) > 1
+    assert scheduler.metrics()["batches"] == len(sizes)
+
+    # Left padding: di setiap baris token asli menempel di ujung kanan
+    for call in echo_model.calls:
+        for row in call["attention_mask"].tolist():
+            assert row == sorted(row)
+            assert row[-1] == 1
+
+
+def test_multi_pair_request_keeps_its_order(echo_model, scheduler):
+    image = Image.new("RGB", (56, 56), "white")
+    numbers = [7, 3, 12, 0, 5, 9]
+    results = scheduler.generate([image] * len(numbers), [prompt(n) for n in numbers], 16)
+    assert results == [f"jawaban {n}" for n in numbers]
+    assert all(call["batch_shape"][0] <= MAX_BATCH for call in echo_model.calls)
+
+
+def test_generate_error_reaches_every_caller(stub_model):
+    def failing_generate(images, prompts, max_new_tokens):
+        raise RuntimeError("gagal")
+
+    scheduler = BatchScheduler(generate_fn=failing_generate, max_batch_size=MAX_BATCH, max_wait_ms=20)
+    scheduler.start()
+    try:
+        futures = [scheduler.submit(None, prompt(n), 8) for n in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="gagal"):
+                future.result(timeout=5)
+    finally:
+        scheduler.stop()
@@ -0,0 +1,78 @@
+# tests/test_early_stop.py
+import torch
+
+from early_stop import StreamCheck, TextCheck, TicketStoppingCriteria
+from parse_ticket import JsonArrayTracker, single_ticket_complete
+from stub_model import DEFAULT_MULTI_RESPONSE, EOS_ID, StubProcessor, _encode
+
+PROMPT = _encode("prompt ")
+
+
+class CountingTokenizer(StubProcessor):
+    """StubProcessor yang menghitung token yang di-decode (stub: satu token per byte UTF-8)."""
+
+    def __init__(self):
+        super().__init__()
+        self.decoded_tokens = 0
+
+    def batch_decode(self, sequences, **kwargs):
+        self.decoded_tokens += sum(len(seq) for seq in sequences)
+        return super().batch_decode(sequences, **kwargs)
+
+
+class Recorder:
+    def __init__(self):
+        self.text = ""
+
+    def update(self, chunk: str) -> bool:
+        self.text += chunk
+        return False
+
+
+def run_steps(criteria, ids: list):
+    """Panggil criteria seperti generate: satu token baru per langkah. Return langkah saat berhenti."""
+    for step in range(1, len(ids) + 1):
+        if criteria(torch.tensor([PROMPT + ids[:step]]), None)[0]:
+            return step
+    return None
+
+
+def test_checks_receive_only_new_text():
+    text = "2024.01.05 臺北 Taipei → Hsinchu 新竹 ✓ " * 20
+    tokenizer = CountingTokenizer()
+    recorder = Recorder()
+    criteria = TicketStoppingCriteria(tokenizer, [recorder], [10_000], len(PROMPT), {EOS_ID})
+    ids = _encode(text)
+
+    assert run_steps(criteria, ids) is None
+    # Karakter multi-byte (byte terbelah antar token) tetap utuh
+    assert recorder.text == text
+    # Biaya decode linear: setiap token di-decode sekali, byte karakter terbelah paling banyak 3x
+    assert tokenizer.decoded_tokens <= 3 * len(ids)
+    assert tokenizer.decoded_tokens < len(ids) * len(ids) / 20
+
+
+def test_json_array_stops_when_closed():
+    text = "```json\n" + DEFAULT_MULTI_RESPONSE + "\n```\nPenjelasan tambahan"
+    criteria = TicketStoppingCriteria(StubProcessor(), [StreamCheck(JsonArrayTracker)], [10_000], len(PROMPT),
+                                      {EOS_ID})
+    step = run_steps(criteria, _encode(text))
+    assert step == len(_encode("```json\n" + DEFAULT_MULTI_RESPONSE))
+    assert criteria.stopped[0][0] == "complete"
+
+
+def test_single_stops_after_complete_line():
+    text = "2024.01.05 車次 123\nTaipei → Hsinchu 08:10 09:25\nNT$177 成人\nSeat 5A Car 3\n"
+    criteria = TicketStoppingCriteria(StubProcessor(), [TextCheck(single_ticket_complete)], [10_000], len(PROMPT),
+                                      {EOS_ID})
+    step = run_steps(criteria, _encode(text))
+    assert step == len(_encode("2024.01.05 車次 123\nTaipei → Hsinchu 08:10 09:25\nNT$177 成人\n"))
+
+
+def test_limit_and_eos_per_row():
+    criteria = TicketStoppingCriteria(StubProcessor(), [None, None], [2, 5], len(PROMPT), {EOS_ID})
+    rows = [_encode("abcdef"), _encode("ab") + [EOS_ID] * 4]
+    for step in range(1, 4):
+        stopped = criteria(torch.tensor([PROMPT + row[:step] for row in rows]), None)
+    assert stopped.tolist() == [True, True]
+    assert criteria.stopped == [("limit", 2), ("eos", 3)]
@@ -0,0 +1,85 @@
+# tests/test_job_queue.py
+import os
+import time
+
+import pytest
+
+from batch_scheduler import BatchScheduler
+from conftest import IMAGES_DIR
+from job_queue import JobQueue, QueueFullError
+from job_worker import JobWorker
+from ticket_store import TicketStore
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_queued=2, lease_s=0.05)
+    yield queue
+    queue.close()
+
+
+def test_queue_depth_is_the_backpressure(job_queue):
+    job_queue.enqueue("upload", "a.jpeg", "/temp_uploads/a.jpeg")
+    job_queue.enqueue("upload", "b.jpeg", "/temp_uploads/b.jpeg")
+    with pytest.raises(QueueFullError):
+        job_queue.enqueue("upload", "c.jpeg", "/temp_uploads/c.jpeg")
+    # Job yang sudah diambil worker tidak lagi dihitung menunggu
+    assert job_queue.claim("w1", timeout=0) is not None
+    job_queue.enqueue("upload", "c.jpeg", "/temp_uploads/c.jpeg")
+
+
+def test_late_worker_after_lease_expiry_is_discarded(job_queue):
+    job_id = job_queue.enqueue("stream", "a.jpeg", "/temp_uploads/a.jpeg")
+    first = job_queue.claim("w1", timeout=0)
+    time.sleep(0.1)
+    # Lease w1 habis: job dikembalikan ke antrian dan diambil w2
+    second = job_queue.claim("w2", timeout=0)
+    assert (first["id"], second["id"]) == (job_id, job_id)
+    assert (first["attempts"], second["attempts"]) == (1, 2)
+
+    assert not job_queue.add_event(job_id, "ticket", {"from": "w1"}, attempt=first["attempts"])
+    assert job_queue.add_event(job_id, "ticket", {"from": "w2"}, attempt=second["attempts"])
+    assert job_queue.finish(job_id, [{"from": "w2"}], attempt=second["attempts"])
+    # w1 selesai belakangan: hasil dan error-nya tidak menimpa hasil w2
+    assert not job_queue.finish(job_id, [{"from": "w1"}], attempt=first["attempts"])
+    assert not job_queue.fail(job_id, "gagal", attempt=first["attempts"])
+
+    job = job_queue.get(job_id)
+    assert (job["status"], job["result"], job["worker"]) == ("done", [{"from": "w2"}], "w2")
+    assert [(event, data) for _, event, data in job_queue.events(job_id)] == [
+        ("ticket", {"from": "w2"}), ("done", {"tickets": [{"from": "w2"}]}),
+    ]
+
+
+def test_finish_once(job_queue):
+    job_id = job_queue.enqueue("upload", "a.jpeg", "/temp_uploads/a.jpeg")
+    job = job_queue.claim("w1", timeout=0)
+    assert job_queue.finish(job_id, [], attempt=job["attempts"])
+    assert not job_queue.finish(job_id, [], attempt=job["attempts"])
+    assert len(job_queue.events(job_id)) == 1
+
+
+def test_stale_attempt_does_not_write_ticket_store(job_queue, stub_model, tmp_path):
+    store = TicketStore(str(tmp_path / "tickets.jsonl"), legacy_json=None)
+    worker = JobWorker(job_queue, BatchScheduler(max_wait_ms=1), None, store, concurrency=1)
+    worker.scheduler.start()
+    try:
+        path = os.path.join(IMAGES_DIR, "single0.jpeg")
+        job_id = job_queue.enqueue("upload", path, "/temp_uploads/single0.jpeg")
+        stale = job_queue.claim("w1", timeout=0)
+        time.sleep(0.1)
+        current = job_queue.claim("w2", timeout=0)
+        # Lease w2 cukup lama untuk memproses job di bawah
+        job_queue.lease_s = 60
+
+        # w1 selesai setelah lease-nya habis: hasil dibuang, ticket store tidak berubah
+        worker.process(stale)
+        assert len(store) == 0
+        assert job_queue.get(job_id)["status"] == "running"
+        assert worker.metrics()["stale"] == 1
+
+        worker.process(current)
+        assert job_queue.get(job_id)["status"] == "done"
+        assert len(store) == 1
+    finally:
+        worker.scheduler.stop()
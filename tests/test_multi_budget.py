@@ -0,0 +1,19 @@
+# tests/test_multi_budget.py
+import pytest
+
+import multi_inference
+from combined_inference import plan_requests
+from multi_inference import MULTI_MAX_NEW_TOKENS, MULTI_PROMPT, multi_token_budget
+
+
+@pytest.mark.parametrize("tickets", [None, 0, 1])
+def test_unsure_detection_keeps_full_budget(tickets):
+    assert multi_token_budget(tickets) == MULTI_MAX_NEW_TOKENS
+    assert plan_requests([], tickets)[-1] == (MULTI_PROMPT, MULTI_MAX_NEW_TOKENS, None)
+
+
+def test_confident_detection_shrinks_budget(monkeypatch):
+    assert multi_token_budget(2) < MULTI_MAX_NEW_TOKENS
+    assert multi_token_budget(3) <= MULTI_MAX_NEW_TOKENS
+    monkeypatch.setattr(multi_inference, "ADAPTIVE_MAX_NEW_TOKENS", False)
+    assert multi_token_budget(2) == MULTI_MAX_NEW_TOKENS
@@ -0,0 +1,116 @@
+# tests/test_parse_ticket.py
+"""
+Kesetaraan parser (parse_ticket) dengan salinan beku parser lama
+(benchmarks/parse_reference.py): output contoh dari golden_labels, kasus
+tepi, dan variasi acak yang sama dengan bench_parsers.py --check.
+"""
+import json
+import random
+
+import pytest
+
+from bench_parsers import fuzz_multi, fuzz_single, is_subsequence, outcome
+from golden import load_labels, synthetic_outputs
+from parse_reference import legacy_parse_multi_ticket_json, legacy_parse_single_ticket_text
+from parse_ticket import parse_multi_ticket_json, parse_single_ticket_text, resolve_ticket_stations
+
+OUTPUTS = synthetic_outputs(load_labels())
+SINGLE_TEXTS = [text for entry in OUTPUTS.values() for key, text in sorted(entry.items()) if key != "multi"]
+MULTI_TEXTS = [entry["multi"] for entry in OUTPUTS.values()]
+
+TICKET = {
+    "date": "2016.05.23", "departure_station": "臺北", "arrival_station": "花蓮",
+    "departure_time": "08:00", "arrival_time": "10:19", "price": "440",
+}
+
+
+def multi_json(*tickets) -> str:
+    return json.dumps(list(tickets), ensure_ascii=False)
+
+
+@pytest.mark.parametrize("text", SINGLE_TEXTS)
+def test_single_matches_legacy_on_samples(text):
+    assert parse_single_ticket_text(text) == legacy_parse_single_ticket_text(text)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Maaf, tidak ada tiket di gambar ini.",
+    "2016/05/23 台北→花蓮 12:30元",
+    "NT$440 １２:３４ - 13：05 Taipei to Hualien",
+    "Hualien to Taipei\nTrain 123 Seat 5A",
+    "20160523 12:3 4567.89.01",
+])
+def test_single_matches_legacy_on_edge_cases(text):
+    assert outcome(parse_single_ticket_text, text) == outcome(legacy_parse_single_ticket_text, text)
+
+
+@pytest.mark.parametrize("text", MULTI_TEXTS)
+def test_multi_matches_legacy_on_samples(text):
+    assert parse_multi_ticket_json(text) == legacy_parse_multi_ticket_json(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Maaf, tidak ada tiket di gambar ini.",
+    "",
+    "```json\n```",
+    "[]",
+])
+def test_multi_without_json_returns_empty_list(text):
+    assert parse_multi_ticket_json(text) == []
+    assert legacy_parse_multi_ticket_json(text) == []
+
+
+def test_multi_maps_chinese_station_names_like_legacy():
+    text = "```json\n" + multi_json(TICKET) + "\n```"
+    parsed = parse_multi_ticket_json(text)
+    assert parsed == legacy_parse_multi_ticket_json(text)
+    assert (parsed[0]["departure_station"], parsed[0]["arrival_station"]) == ("Taipei", "Hualien")
+
+
+def test_multi_recovers_complete_objects_from_truncated_array():
+    second = dict(TICKET, departure_station="南港", arrival_station="苗栗")
+    full = multi_json(TICKET, second)
+    truncated = full[:full.index('"price"', full.index("南港"))]
+
+    # Parser lama membuang semuanya; yang baru menyimpan tiket yang sudah lengkap
+    assert legacy_parse_multi_ticket_json(truncated) == []
+    parsed = parse_multi_ticket_json(truncated)
+    assert len(parsed) == 1
+    assert parsed[0]["departure_station"] == "Taipei"
+
+
+def test_multi_with_intro_text_and_loose_objects():
+    text = "Here is the JSON:\n" + json.dumps(TICKET, ensure_ascii=False) + ",\n" + json.dumps(TICKET)
+    parsed = parse_multi_ticket_json(text)
+    assert is_subsequence(outcome(legacy_parse_multi_ticket_json, text), parsed)
+    assert len(parsed) == 2
+
+
+def test_fuzzy_station_correction_after_parse():
+    ticket = dict(TICKET, departure_station="Taipel", arrival_station="Hualein")
+    text = multi_json(ticket)
+    parsed = parse_multi_ticket_json(text)
+    # Nama OCR yang salah eja tidak diubah parser (sama dengan parser lama) ...
+    assert parsed == legacy_parse_multi_ticket_json(text)
+    assert parsed[0]["departure_station"] == "Taipel"
+    # ... lalu dikoreksi lewat pencocokan fuzzy ke CSV
+    resolve_ticket_stations(parsed)
+    assert (parsed[0]["departure_station"], parsed[0]["arrival_station"]) == ("Taipei", "Hualien")
+
+
+def test_fuzzy_correction_leaves_unknown_names():
+    tickets = [dict(TICKET, departure_station="Tokyo", arrival_station="Osaka")]
+    resolve_ticket_stations(tickets)
+    assert (tickets[0]["departure_station"], tickets[0]["arrival_station"]) == ("Tokyo", "Osaka")
+
+
+def test_fuzzed_variants_match_legacy():
+    rng = random.Random(0)
+    for text in fuzz_single(SINGLE_TEXTS, 1000, rng):
+        assert outcome(parse_single_ticket_text, text) == outcome(legacy_parse_single_ticket_text, text), text
+    for text in fuzz_multi(MULTI_TEXTS, 500, rng):
+        old = outcome(legacy_parse_multi_ticket_json, text)
+        new = outcome(parse_multi_ticket_json, text)
+        # Parser baru boleh memulihkan lebih banyak tiket, tiket lama harus tetap ada berurutan
+        assert old == new or is_subsequence(old, new), text
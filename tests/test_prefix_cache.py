@@ -0,0 +1,92 @@
+# tests/test_prefix_cache.py
+import pytest
+import torch
+import transformers
+from transformers import BatchFeature
+
+import prefix_cache
+from inference_core import build_messages
+
+VISION_START, VISION_END, IMAGE = 288, 289, 290
+# apply() ditulis untuk API cache / generate transformers yang di-pin requirements.txt
+PINNED_TRANSFORMERS = transformers.__version__.startswith("4.")
+
+
+def test_defaults_keep_prompt_order_and_use_cache():
+    assert prefix_cache.enabled()
+    assert not prefix_cache.text_first()
+    assert prefix_cache.prefix_signature() == "order=image-first"
+    content = build_messages("image", "prompt")[0]["content"]
+    assert [item["type"] for item in content] == ["image", "text"]
+
+
+def test_model_without_vision_config_is_untouched():
+    model = type("Model", (), {"config": object()})()
+    inputs = {"input_ids": torch.tensor([[5, VISION_START, IMAGE, VISION_END]])}
+    assert prefix_cache.apply(model, None, inputs) == (inputs, None)
+
+
+def tiny_qwen():
+    """Qwen2.5-VL acak berukuran mini (config gaya transformers 4.49)."""
+    from transformers import Qwen2_5_VLConfig, Qwen2_5_VLForConditionalGeneration
+
+    torch.manual_seed(0)
+    config = Qwen2_5_VLConfig(
+        vocab_size=300, hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=4,
+        num_key_value_heads=2, max_position_embeddings=4096,
+        rope_scaling={"type": "mrope", "mrope_section": [2, 3, 3]},
+        vision_config=dict(depth=1, hidden_size=32, intermediate_size=64, num_heads=2, out_hidden_size=64,
+                           patch_size=14, spatial_merge_size=2, temporal_patch_size=2, window_size=112,
+                           fullatt_block_indexes=[0]),
+        image_token_id=IMAGE, video_token_id=291, vision_start_token_id=VISION_START,
+        vision_end_token_id=VISION_END, bos_token_id=1, eos_token_id=2, pad_token_id=0,
+    )
+    return Qwen2_5_VLForConditionalGeneration(config).eval()
+
+
+def batch_inputs(generator) -> dict:
+    """Dua awalan berbeda + ukuran image berbeda dalam satu batch (padding kiri)."""
+    prefixes = [torch.randint(3, 280, (length,), generator=generator).tolist() for length in (25, 9)]
+    rows = []
+    for prefix, (h, w), suffix in ((prefixes[0], (4, 4), 5), (prefixes[1], (8, 4), 3), (prefixes[0], (4, 8), 4)):
+        tail = torch.randint(3, 280, (suffix,), generator=generator).tolist()
+        rows.append((prefix + [VISION_START] + [IMAGE] * (h * w // 4) + [VISION_END] + tail, (1, h, w)))
+    width = max(len(ids) for ids, _ in rows)
+    input_ids = torch.zeros((len(rows), width), dtype=torch.long)
+    for i, (ids, _) in enumerate(rows):
+        input_ids[i, width - len(ids):] = torch.tensor(ids)
+    grids = torch.tensor([grid for _, grid in rows])
+    return {
+        "input_ids": input_ids,
+        "attention_mask": (input_ids != 0).long(),
+        "pixel_values": torch.randn((int(grids.prod(-1).sum()), 1176), generator=generator),
+        "image_grid_thw": grids,
+    }
+
+
+@pytest.mark.skipif(not PINNED_TRANSFORMERS, reason="apply() memakai API transformers 4.49 (requirements.txt)")
+def test_cached_prefix_generates_same_tokens():
+    model = tiny_qwen()
+    inputs = batch_inputs(torch.Generator().manual_seed(3))
+    width = inputs["input_ids"].shape[1]
+    # Tanpa EOS: bandingkan semua langkah decode setiap baris
+    options = dict(max_new_tokens=12, do_sample=False, eos_token_id=[])
+    processor = type("Processor", (), {"pad_token_id": 0})()
+
+    def cached_generate(inputs):
+        cached_inputs, cache = prefix_cache.apply(model, processor, BatchFeature(dict(inputs)))
+        assert cache is not None
+        output = model.generate(**cached_inputs, past_key_values=cache, **options)
+        return output[:, cached_inputs["input_ids"].shape[1]:]
+
+    with torch.no_grad():
+        expected = model.generate(**BatchFeature(dict(inputs)), **options)[:, width:]
+        hits = prefix_cache.stats.snapshot()["hits"]
+        # Kedua kalinya awalan diambil dari cache; generate biasa di antaranya tidak mengganggu
+        assert torch.equal(cached_generate(inputs), expected)
+        assert torch.equal(model.generate(**BatchFeature(dict(inputs)), **options)[:, width:], expected)
+        assert torch.equal(cached_generate(inputs), expected)
+        assert prefix_cache.stats.snapshot()["hits"] > hits
+        # Image benar-benar ikut prefill (bukan dibuang karena cache)
+        blank = dict(inputs, pixel_values=torch.zeros_like(inputs["pixel_values"]))
+        assert not torch.equal(cached_generate(blank), expected)
@@ -0,0 +1,89 @@
+# tests/test_stream.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import combined_inference
+import model_loader
+from batch_scheduler import BatchScheduler
+from combined_inference import process_ticket, stream_ticket
+from conftest import IMAGES_DIR
+from inference_core import stream_text
+from multi_inference import MULTI_PROMPT
+
+IMAGES = [os.path.join(IMAGES_DIR, f"single{i}.jpeg") for i in range(2)]
+
+
+@pytest.fixture
+def guarded_model(stub_model, monkeypatch):
+    """Stub model yang mencatat thread setiap generate dan gagal jika dua generate tumpang tindih."""
+    monkeypatch.setattr(combined_inference, "TICKET_SPLIT", False)
+    model, _, _ = model_loader.get_model()
+    original = model.generate
+    state = {"active": 0, "overlaps": 0, "threads": set()}
+    lock = threading.Lock()
+
+    def generate(*args, **kwargs):
+        with lock:
+            state["active"] += 1
+            state["overlaps"] += state["active"] > 1
+            state["threads"].add(threading.current_thread().name)
+        try:
+            # Cukup lama agar generate lain sempat masuk jika tidak dijaga
+            time.sleep(0.05)
+            return original(*args, **kwargs)
+        finally:
+            with lock:
+                state["active"] -= 1
+
+    monkeypatch.setattr(model, "generate", generate)
+    model.state = state
+    return model
+
+
+def run_stream(image_path: str, generate_fn) -> tuple:
+    tickets = []
+    for kind, payload in stream_ticket(image_path, generate_fn):
+        if kind == "ticket":
+            tickets.append(payload)
+        else:
+            return tickets, payload
+
+
+def test_overlapping_stream_jobs_share_the_scheduler(guarded_model):
+    scheduler = BatchScheduler(max_batch_size=8, max_wait_ms=50)
+    scheduler.start()
+    try:
+        start = threading.Barrier(len(IMAGES))
+
+        def job(path):
+            start.wait()
+            return run_stream(path, scheduler.generate)
+
+        with ThreadPoolExecutor(len(IMAGES)) as executor:
+            results = list(executor.map(job, IMAGES))
+    finally:
+        scheduler.stop()
+
+    assert guarded_model.state["overlaps"] == 0
+    # Semua generate (single dan multi yang di-stream) jalan di thread scheduler, dalam batch
+    assert guarded_model.state["threads"] == {"batch-scheduler"}
+    assert sum(call["batch_shape"][0] for call in guarded_model.calls) == 2 * len(IMAGES)
+    assert max(call["batch_shape"][0] for call in guarded_model.calls) > 1
+    for path, (tickets, result) in zip(IMAGES, results):
+        assert result == process_ticket(path)
+        assert tickets == result[1]
+        assert tickets[0]["departure_station"] == "Taipei"
+
+
+def test_stream_text_without_scheduler_never_overlaps(guarded_model):
+    from PIL import Image
+
+    image = Image.new("RGB", (56, 56), "white")
+    with ThreadPoolExecutor(3) as executor:
+        texts = list(executor.map(lambda _: "".join(stream_text(image, MULTI_PROMPT, 400)), range(3)))
+    assert guarded_model.state["overlaps"] == 0
+    assert len(set(texts)) == 1 and texts[0].startswith("[{")
@@ -0,0 +1,78 @@
+# tests/test_upload_store.py
+import asyncio
+import io
+import os
+import threading
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import upload_store
+from upload_store import PARTIAL_PREFIX, UploadTooLargeError, save_upload
+
+
+def upload(data: bytes, filename: str = "tiket.JPG") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename)
+
+
+@pytest.fixture
+def loop_guard(monkeypatch):
+    """Gagal jika operasi disk dipanggil dari thread event loop."""
+    loop_threads = set()
+    calls = []
+
+    def guarded(module, name):
+        original = getattr(module, name)
+
+        def call(*args, **kwargs):
+            calls.append(name)
+            assert threading.get_ident() not in loop_threads, f"{name} dipanggil di event loop"
+            return original(*args, **kwargs)
+        monkeypatch.setattr(module, name, call)
+
+    for name in ("makedirs", "remove", "replace", "utime"):
+        guarded(os, name)
+
+    def run(coro):
+        async def main():
+            loop_threads.add(threading.get_ident())
+            return await coro
+        return asyncio.run(main())
+    run.calls = calls
+    return run
+
+
+def test_same_content_is_stored_once_off_the_loop(tmp_path, loop_guard):
+    first = loop_guard(save_upload(upload(b"isi tiket"), str(tmp_path)))
+    second = loop_guard(save_upload(upload(b"isi tiket", "lain.jpg"), str(tmp_path)))
+
+    assert first.path == second.path
+    assert os.path.basename(first.path) == first.sha256 + ".jpg"
+    assert first.data == b"isi tiket"
+    assert os.listdir(tmp_path) == [os.path.basename(first.path)]
+    assert {"makedirs", "replace", "remove", "utime"} <= set(loop_guard.calls)
+
+
+def test_too_large_upload_leaves_no_partial_file(tmp_path, loop_guard):
+    with pytest.raises(UploadTooLargeError):
+        loop_guard(save_upload(upload(b"x" * 100), str(tmp_path), max_bytes=10))
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(PARTIAL_PREFIX)]
+    assert "remove" in loop_guard.calls
+
+
+def test_file_swept_during_dedupe_is_replaced(tmp_path, monkeypatch):
+    first = asyncio.run(save_upload(upload(b"isi tiket"), str(tmp_path)))
+    utime = os.utime
+
+    def swept_then_utime(path, *args, **kwargs):
+        # UploadSweeper menghapus file lama tepat sebelum mtime-nya diperbarui
+        os.remove(path)
+        return utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(upload_store.os, "utime", swept_then_utime)
+    second = asyncio.run(save_upload(upload(b"isi tiket"), str(tmp_path)))
+
+    assert second.path == first.path
+    with open(second.path, "rb") as f:
+        assert f.read() == b"isi tiket"
+    assert os.listdir(tmp_path) == [os.path.basename(second.path)]
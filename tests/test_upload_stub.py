@@ -0,0 +1,63 @@
+# tests/test_upload_stub.py
+import os
+import time
+
+from conftest import IMAGES_DIR
+
+
+def post_image(client, name: str, **params):
+    with open(os.path.join(IMAGES_DIR, name), "rb") as f:
+        return client.post(
+            "/upload/", params=params, files={"file": (name, f, "image/jpeg")},
+            headers={"Accept": "application/json"},
+        )
+
+
+def test_stub_decode_skips_image_token(stub_model):
+    processor = stub_model.StubProcessor()
+    inputs = processor(text=["<image>Baca tiket"], images=[object()])
+    assert processor.image_token_id in inputs["input_ids"][0].tolist()
+    assert processor.batch_decode(inputs["input_ids"]) == ["Baca tiket"]
+
+
+def test_upload_through_stub(client, stub_model):
+    loads_before = stub_model.load_count
+    response = post_image(client, "single0.jpeg", wait="true")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["tickets"], body
+    ticket = body["tickets"][0]
+    assert ticket["departure_station"] == "Taipei"
+    assert ticket["arrival_station"] == "Hsinchu"
+    assert ticket["mileage"] == 66.0
+    assert body["image_url"].startswith("/temp_uploads/")
+
+    # Upload kedua memakai model yang sama (dimuat sekali per proses)
+    assert post_image(client, "single1.jpeg", wait="true").status_code == 200
+    assert stub_model.load_count == loads_before
+
+
+def test_upload_returns_job_for_api_clients(client):
+    response = post_image(client, "single0.jpeg")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    for _ in range(200):
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] in ("done", "error"):
+            break
+        time.sleep(0.05)
+    assert status["status"] == "done", status
+    assert status["tickets"]
+
+
+def test_full_queue_answers_503(client, monkeypatch):
+    import app
+    from job_queue import QueueFullError
+
+    def full(*args, **kwargs):
+        raise QueueFullError(7)
+
+    monkeypatch.setattr(app.job_queue, "enqueue", full)
+    response = post_image(client, "single0.jpeg")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
@@ -0,0 +1,198 @@
+# ticket_detector.py
+"""
+Deteksi beberapa tiket dalam satu foto, agar prompt multi (satu JSON panjang,
+max_new_tokens 320, mudah terpotong) bisa diganti dengan prompt single yang
+pendek untuk setiap potongan tiket, semuanya dalam satu batch generate.
+
+Metode klasik OpenCV (tanpa model):
+  1) adaptive threshold => goresan gelap; komponen seukuran huruf saja yang
+     dipakai (garis tepi tiket, goresan panjang, bayangan dibuang)
+  2) XY-cut rekursif: potong di kolom/baris tanpa teks yang cukup lebar
+     (kelipatan tinggi huruf rata-rata)
+  3) blok teks besar yang ukuran dan kepadatannya mirip satu sama lain = tiket
+  4) di celah antara dua blok bertetangga harus ada garis lurus panjang (tepi
+     tiket / bayangan, HoughLinesP); tanpa itu celah hanyalah bagian kosong
+     di dalam satu tiket
+
+Sengaja konservatif: jika tidak ada >= 2 blok yang jelas mirip tiket,
+detect_tickets() mengembalikan [] dan pemanggil memakai prompt multi seperti biasa.
+analyze_tickets() juga mengembalikan perkiraan jumlah tiket (blok seukuran
+tiket, tanpa syarat ketat) untuk anggaran token prompt multi.
+Diatur lewat TICKET_SPLIT (1/0).
+"""
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_preprocess import preprocess_image
+
+TICKET_SPLIT = os.getenv("TICKET_SPLIT", "1") == "1"
+
+# Lebar celah minimum (dalam tinggi huruf median) untuk memotong kolom / baris
+COLUMN_GAP_CHARS = 3.0
+ROW_GAP_CHARS = 4.0
+# Kolom/baris dengan piksel teks <= rasio ini dari panjangnya dianggap kosong
+EMPTY_RATIO = 0.03
+# Syarat blok dianggap tiket
+MIN_AREA_RATIO = 0.03
+MIN_MASS_RATIO = 0.5
+MAX_SIZE_RATIO = 1.6
+# Panjang minimum garis batas di celah, relatif terhadap panjang celah
+BOUNDARY_RATIO = 0.45
+MAX_TICKETS = 8
+MAX_DEPTH = 4
+
+
+def _text_mask(gray: np.ndarray):
+    """Mask boolean goresan seukuran huruf + tinggi huruf median."""
+    height, width = gray.shape
+    block = max(15, (min(height, width) // 20) | 1)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block, 25)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths, heights, areas = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    keep = (heights >= 3) & (heights < 0.1 * height) & (widths < 0.25 * width) & (areas >= 4)
+    keep[0] = False  # label 0 = latar
+    if not keep.any():
+        return None, 0.0
+    return keep[labels], float(np.median(heights[keep]))
+
+
+def _runs(profile: np.ndarray, min_gap: float, empty: float) -> list:
+    """Rentang [start, end) berisi teks, dipisah celah kosong selebar > min_gap."""
+    filled = np.nonzero(profile > empty)[0]
+    if filled.size == 0:
+        return []
+    breaks = np.nonzero(np.diff(filled) > min_gap)[0]
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _xy_cut(mask: np.ndarray, x0: int, y0: int, x1: int, y1: int, char_h: float, depth: int = 0) -> list:
+    """Blok teks (x0, y0, x1, y1, jumlah piksel teks) hasil XY-cut rekursif."""
+    sub = mask[y0:y1, x0:x1]
+    columns = _runs(sub.sum(axis=0), COLUMN_GAP_CHARS * char_h, EMPTY_RATIO * (y1 - y0))
+    rows = _runs(sub.sum(axis=1), ROW_GAP_CHARS * char_h, EMPTY_RATIO * (x1 - x0))
+    if not columns or not rows:
+        return []
+    # Kolom dulu: tiket yang berjajar ke samping paling umum di foto
+    if len(columns) > 1 and depth < MAX_DEPTH:
+        return [block for a, b in columns for block in _xy_cut(mask, x0 + a, y0, x0 + b, y1, char_h, depth + 1)]
+    if len(rows) > 1 and depth < MAX_DEPTH:
+        return [block for a, b in rows for block in _xy_cut(mask, x0, y0 + a, x1, y0 + b, char_h, depth + 1)]
+    bx0, by0, bx1, by1 = x0 + columns[0][0], y0 + rows[0][0], x0 + columns[-1][1], y0 + rows[-1][1]
+    return [(bx0, by0, bx1, by1, int(mask[by0:by1, bx0:bx1].sum()))]
+
+
+def _similar(values: list) -> bool:
+    return max(values) <= MAX_SIZE_RATIO * min(values)
+
+
+def _has_boundary(gray: np.ndarray, a, b) -> bool:
+    """
+    True jika celah antara blok a dan b memuat garis lurus panjang yang sejajar
+    celah. Blok yang tidak bersebelahan (tidak saling berhadapan) dilewati.
+    """
+    if a[2] <= b[0] or b[2] <= a[0]:  # berdampingan: celah vertikal
+        gap0, gap1 = min(a[2], b[2]), max(a[0], b[0])
+        span0, span1 = max(a[1], b[1]), min(a[3], b[3])
+        strip = gray[span0:span1, gap0:gap1]
+    elif a[3] <= b[1] or b[3] <= a[1]:  # bertumpuk: celah horizontal, diputar
+        gap0, gap1 = min(a[3], b[3]), max(a[1], b[1])
+        span0, span1 = max(a[0], b[0]), min(a[2], b[2])
+        strip = gray[gap0:gap1, span0:span1].T
+    else:
+        return False
+    span = span1 - span0
+    if span < 0.5 * min(a[3] - a[1], b[3] - b[1], a[2] - a[0], b[2] - b[0]):
+        return True
+    if strip.shape[1] < 3:
+        return False
+
+    edges = cv2.Canny(cv2.GaussianBlur(strip, (5, 5), 0), 20, 60)
+    min_length = BOUNDARY_RATIO * span
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=int(0.75 * min_length),
+                            minLineLength=int(min_length), maxLineGap=int(0.05 * span) + 5)
+    if lines is None:
+        return False
+    # Hanya garis yang hampir sejajar celah (tiket boleh sedikit miring)
+    return any(abs(x1 - x0) <= 0.2 * abs(y1 - y0) for x0, y0, x1, y1 in lines.reshape(-1, 4))
+
+
+def _reading_order(boxes: list) -> list:
+    """Urut baris (atas ke bawah), lalu kiri ke kanan dalam satu baris."""
+    boxes = sorted(boxes, key=lambda b: (b[1] + b[3]) / 2)
+    tolerance = np.median([b[3] - b[1] for b in boxes]) / 2
+    rows, current = [], [boxes[0]]
+    for box in boxes[1:]:
+        if (box[1] + box[3]) / 2 - (current[-1][1] + current[-1][3]) / 2 > tolerance:
+            rows.append(current)
+            current = []
+        current.append(box)
+    rows.append(current)
+    return [box for row in rows for box in sorted(row, key=lambda b: b[0])]
+
+
+def detect_tickets(image) -> list:
+    """
+    Kotak (x0, y0, x1, y1) tiap tiket dalam urutan baca, dalam koordinat
+    `image` (PIL atau array RGB). [] jika tidak jelas ada >= 2 tiket.
+    """
+    return analyze_tickets(image)[0]
+
+
+def analyze_tickets(image) -> tuple:
+    """
+    (kotak seperti detect_tickets, perkiraan jumlah tiket). Perkiraan = jumlah
+    blok teks seukuran tiket sebelum syarat ketat (ukuran mirip, garis batas),
+    minimal 1; dipakai untuk anggaran max_new_tokens prompt multi saat foto
+    tidak dipotong.
+    """
+    rgb = np.asarray(image.convert("RGB")) if isinstance(image, Image.Image) else image
+    height, width = rgb.shape[:2]
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    mask, char_h = _text_mask(gray)
+    if mask is None:
+        return [], 1
+
+    blocks = _xy_cut(mask, 0, 0, width, height, char_h)
+    if len(blocks) < 2:
+        return [], 1
+    # Blok kecil (tombol, noda, teks lepas) dibuang relatif terhadap blok terpadat
+    heaviest = max(block[4] for block in blocks)
+    tickets = [
+        block for block in blocks
+        if block[4] >= MIN_MASS_RATIO * heaviest
+        and (block[2] - block[0]) * (block[3] - block[1]) >= MIN_AREA_RATIO * width * height
+    ]
+    estimate = min(max(len(tickets), 1), MAX_TICKETS)
+    if not 2 <= len(tickets) <= MAX_TICKETS:
+        return [], estimate
+    # Tiket dalam satu foto berukuran sama; blok yang beda jauh berarti satu
+    # tiket terbelah (mis. per baris teks) => jangan dipotong
+    if not (_similar([b[2] - b[0] for b in tickets]) and _similar([b[3] - b[1] for b in tickets])):
+        return [], estimate
+    if not all(_has_boundary(gray, a, b) for i, a in enumerate(tickets) for b in tickets[i + 1:]):
+        return [], estimate
+
+    # Margin sekitar blok teks agar tepi tiket ikut, tanpa melewati latar
+    pad = int(round(1.5 * char_h))
+    boxes = [
+        (max(0, x0 - pad), max(0, y0 - pad), min(width, x1 + pad), min(height, y1 + pad))
+        for x0, y0, x1, y1, _ in tickets
+    ]
+    return _reading_order(boxes), len(boxes)
+
+
+def crop_ticket(image: Image.Image, box) -> Image.Image:
+    """Potongan satu tiket, lewat batas piksel yang sama dengan image penuh."""
+    crop, _ = preprocess_image(image.crop(tuple(box)), auto_crop=False)
+    return crop
+
+
+def detector_signature() -> str:
+    """Parameter deteksi; ikut kunci result cache untuk layout tiket."""
+    return (f"split={int(TICKET_SPLIT)},gap={COLUMN_GAP_CHARS}/{ROW_GAP_CHARS},empty={EMPTY_RATIO},"
+            f"area={MIN_AREA_RATIO},mass={MIN_MASS_RATIO},size={MAX_SIZE_RATIO},line={BOUNDARY_RATIO}")
@@ -0,0 +1,87 @@
+# ticket_selection.py
+"""
+Aturan memilih hasil final antara single dan multi inference, dipakai oleh
+app.py (/upload/) dan batch_cli.py.
+"""
+import logging
+
+from stations_data import get_station_index
+
+logger = logging.getLogger(__name__)
+
+
+def is_valid_ticket(ticket: dict) -> bool:
+    """
+    Memeriksa apakah ticket memiliki informasi yang lengkap dan valid.
+    Validasi:
+      - departure_station harus cocok dengan salah satu nilai di startStaName atau startStaEName.
+      - arrival_station harus cocok dengan salah satu nilai di endStaName atau endStaEName.
+      - Juga harus memiliki nilai untuk date.
+    """
+    if not ticket or not isinstance(ticket, dict):
+        return False
+
+    dep = ticket.get("departure_station", "").strip()
+    arr = ticket.get("arrival_station", "").strip()
+    date = ticket.get("date", "").strip()
+
+    if not dep or not arr or not date:
+        return False
+
+    station_index = get_station_index()
+    # Validasi departure_station dari dua kolom: startStaName atau startStaEName
+    dep_valid = station_index.is_valid_departure(dep)
+    # Validasi arrival_station dari dua kolom: endStaName atau endStaEName
+    arr_valid = station_index.is_valid_arrival(arr)
+
+    return dep_valid and arr_valid
+
+
+def cleanup_stations_inplace(ticket: dict):
+    """
+    (Opsional) Membersihkan stasiun palsu.
+    Misalnya, jika stasiun mengandung 'Exp', kosongkan nilainya.
+    """
+    if not ticket or not isinstance(ticket, dict):
+        return
+
+    dep = ticket.get("departure_station", "")
+    arr = ticket.get("arrival_station", "")
+
+    if "Exp" in dep:
+        ticket["departure_station"] = ""
+    if "Exp" in arr:
+        ticket["arrival_station"] = ""
+
+
+def select_final_data(single_data: list, multi_data: list) -> list:
+    """
+    Tentukan hasil final dari single_data dan multi_data:
+      - Jika multi_inference menghasilkan > 1 tiket, gunakan multi_data.
+      - Jika hanya 1 tiket dan ticket valid (berdasarkan CSV), gunakan single_data.
+      - Jika ticket tidak valid (departure atau arrival tidak match CSV), paksa gunakan hasil single_inference.
+    """
+    if len(multi_data) > 1:
+        final_data = multi_data
+        logger.info("Menggunakan hasil dari multi_inference (lebih dari satu tiket terdeteksi).",
+                    extra={"branch": "multi"})
+    else:
+        if len(single_data) == 1 and is_valid_ticket(single_data[0]):
+            final_data = single_data
+            logger.info("Menggunakan hasil dari single_inference (ticket valid).", extra={"branch": "single"})
+        else:
+            final_data = multi_data
+            logger.info("Menggunakan hasil dari multi_inference sebagai fallback (single_inference tidak valid).",
+                        extra={"branch": "multi_fallback"})
+
+    # Jika salah satu dari departure_station atau arrival_station tidak match CSV,
+    # paksa gunakan hasil single_inference.
+    # Decoding deterministik, jadi hasil single dari inference pertama dipakai ulang
+    # (tidak perlu generate lagi).
+    if final_data:
+        ticket0 = final_data[0]
+        if not is_valid_ticket(ticket0):
+            logger.info("Ticket tidak valid menurut CSV, memaksa penggunaan hasil single_inference.",
+                        extra={"branch": "single_forced"})
+            final_data = single_data
+    return final_data
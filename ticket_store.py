@@ -0,0 +1,163 @@
+# ticket_store.py
+"""
+Penyimpanan tiket append-only, pengganti rewrite penuh tickets_data.json.
+
+  tickets.jsonl      satu tiket (JSON) per baris, hanya di-append
+  tickets.jsonl.idx  satu kunci kanonik (SHA-256) per baris, urutan sama
+
+Dedup O(1) lewat set kunci di memori. Tulis dari banyak thread/proses aman
+karena setiap add() memegang FileLock, lalu lebih dulu membaca kunci yang
+ditambahkan proses lain sejak add() terakhir. export_json() menulis format
+lama (array JSON, indent=2) bila dibutuhkan.
+
+    python ticket_store.py --export json_outputs/tickets_data.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+from filelock import FileLock
+
+DEFAULT_STORE_PATH = os.path.join("json_outputs", "tickets.jsonl")
+LEGACY_JSON_PATH = os.path.join("json_outputs", "tickets_data.json")
+
+
+def ticket_key(ticket) -> str:
+    """Kunci kanonik: dua tiket dengan isi sama (urutan field bebas) => kunci sama."""
+    canonical = json.dumps(ticket, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TicketStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, legacy_json: str = LEGACY_JSON_PATH, lock_timeout: float = 30):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._file_lock = FileLock(path + ".lock", timeout=lock_timeout)
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._index_offset = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, self._file_lock:
+            if not os.path.exists(path) and legacy_json and os.path.exists(legacy_json):
+                self._import_legacy(legacy_json)
+            self._open_index()
+
+    # -- index -------------------------------------------------------------
+    def _count_lines(self, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            return sum(1 for _ in f)
+
+    def _open_index(self):
+        # Index hilang / tidak lengkap (mis. crash di antara dua append): bangun ulang
+        if self._count_lines(self.index_path) != self._count_lines(self.path):
+            self._rebuild_index()
+        self._keys = set()
+        self._index_offset = 0
+        self._catch_up()
+
+    def _rebuild_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for ticket in self._iter_file():
+                out.write(ticket_key(ticket) + "\n")
+        os.replace(tmp_path, self.index_path)
+
+    def _catch_up(self):
+        """Baca kunci yang di-append (oleh proses mana pun) sejak offset terakhir."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Hanya baris lengkap; sisa tanpa newline dibaca lagi lain kali
+        complete = data[:data.rfind(b"\n") + 1]
+        self._keys.update(complete.decode("ascii").split())
+        self._index_offset += len(complete)
+
+    def _import_legacy(self, legacy_json: str):
+        try:
+            with open(legacy_json, "r", encoding="utf-8") as f:
+                tickets = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        seen = set()
+        with open(self.path, "w", encoding="utf-8") as data, open(self.index_path, "w", encoding="utf-8") as index:
+            for ticket in tickets if isinstance(tickets, list) else []:
+                key = ticket_key(ticket)
+                if key in seen:
+                    continue
+                seen.add(key)
+                data.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+                index.write(key + "\n")
+
+    # -- tulis / baca ------------------------------------------------------
+    def add(self, tickets: list) -> int:
+        """Append tiket yang belum ada. Return jumlah tiket baru."""
+        with self._lock, self._file_lock:
+            self._catch_up()
+            lines, keys = [], []
+            for ticket in tickets:
+                key = ticket_key(ticket)
+                if key in self._keys or key in keys:
+                    continue
+                keys.append(key)
+                lines.append(json.dumps(ticket, ensure_ascii=False) + "\n")
+            if not lines:
+                return 0
+            # Data dulu, baru index: index yang tertinggal dibangun ulang saat dibuka
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(key + "\n" for key in keys)
+            self._catch_up()
+            return len(lines)
+
+    def __contains__(self, ticket) -> bool:
+        with self._lock:
+            return ticket_key(ticket) in self._keys
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def _iter_file(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def all(self) -> list:
+        with self._file_lock:
+            return list(self._iter_file())
+
+    def export_json(self, path: str = LEGACY_JSON_PATH):
+        """Tulis semua tiket dalam format tickets_data.json lama (array, indent=2)."""
+        tickets = self.all()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(tickets, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return len(tickets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ekspor ticket store ke format tickets_data.json.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--export", default=LEGACY_JSON_PATH, help="path file JSON tujuan")
+    args = parser.parse_args()
+    count = TicketStore(args.store, legacy_json=None).export_json(args.export)
+    print(f"{count} tiket diekspor ke {args.export}")
+
+
+if __name__ == "__main__":
+    main()
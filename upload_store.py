@@ -0,0 +1,233 @@
+# upload_store.py
+"""
+Penyimpanan file upload di UPLOAD_DIR (default temp_uploads/, disajikan
+sebagai static files di /temp_uploads):
+
+  - save_upload() menyalin UploadFile per potongan UPLOAD_CHUNK_KB ke file
+    sementara sambil menghitung SHA-256, berhenti dengan UploadTooLargeError
+    begitu melewati UPLOAD_MAX_MB (memori tetap datar walau upload besar)
+  - nama file = SHA-256 isi + ekstensi, jadi upload bersamaan dengan nama
+    klien yang sama tidak saling menimpa dan isi yang sama disimpan sekali
+  - upload <= UPLOAD_INLINE_KB juga dikembalikan sebagai bytes, sehingga
+    worker di proses yang sama bisa decode dari memori tanpa membaca ulang file
+  - UploadSweeper (thread latar) menghapus file yang lebih tua dari
+    UPLOAD_MAX_AGE_S, lalu file terlama sampai total <= UPLOAD_DIR_MAX_MB.
+    File yang lebih muda dari UPLOAD_MIN_AGE_S tidak pernah dihapus (job
+    yang masih antre / berjalan membacanya)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from telemetry import stage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "temp_uploads")
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "20"))
+UPLOAD_CHUNK_KB = int(os.getenv("UPLOAD_CHUNK_KB", "256"))
+UPLOAD_INLINE_KB = int(os.getenv("UPLOAD_INLINE_KB", "4096"))
+UPLOAD_MAX_AGE_S = float(os.getenv("UPLOAD_MAX_AGE_S", "86400"))
+UPLOAD_DIR_MAX_MB = float(os.getenv("UPLOAD_DIR_MAX_MB", "1024"))
+UPLOAD_MIN_AGE_S = float(os.getenv("UPLOAD_MIN_AGE_S", "900"))
+UPLOAD_SWEEP_S = float(os.getenv("UPLOAD_SWEEP_S", "300"))
+
+PARTIAL_PREFIX = ".partial-"
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,5}$")
+
+
+class UploadTooLargeError(ValueError):
+    """Upload melewati batas ukuran."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File terlalu besar (maksimal {max_bytes // (1024 * 1024)} MB).")
+        self.max_bytes = max_bytes
+
+
+class SavedUpload:
+    """Hasil save_upload: path + URL file, SHA-256, ukuran, dan isi jika kecil."""
+
+    def __init__(self, path: str, url: str, sha256: str, size: int, data: bytes = None):
+        self.path = path
+        self.url = url
+        self.sha256 = sha256
+        self.size = size
+        self.data = data
+
+
+def max_upload_bytes() -> int:
+    return int(UPLOAD_MAX_MB * 1024 * 1024)
+
+
+def upload_name(sha256: str, filename: str) -> str:
+    """Nama file kanonik: SHA-256 isi + ekstensi asli (jika wajar)."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    return sha256 + (extension if _EXTENSION.match(extension) else "")
+
+
+def _discard(out, partial_path: str):
+    out.close()
+    os.remove(partial_path)
+
+
+def _finalize(partial_path: str, path: str):
+    """Pindahkan file sementara ke nama kanonik (atomik)."""
+    try:
+        # Isi sama sudah ada: pakai file lama, perbarui mtime agar tidak disapu
+        os.utime(path)
+    except FileNotFoundError:
+        # Belum ada, atau baru saja dihapus UploadSweeper: pakai file sementara
+        os.replace(partial_path, path)
+    else:
+        # File sementara baru dihapus setelah file lama pasti tetap ada
+        os.remove(partial_path)
+
+
+async def save_upload(file, upload_dir: str = None, max_bytes: int = None) -> SavedUpload:
+    """
+    Salin `file` (UploadFile) ke upload_dir per potongan; semua operasi disk
+    (tulis, rename, hapus) jalan di thread agar event loop tidak terblokir. UploadTooLargeError jika melewati
+    `max_bytes` (file sementara dihapus).
+    """
+    upload_dir = upload_dir or UPLOAD_DIR
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    await asyncio.to_thread(os.makedirs, upload_dir, exist_ok=True)
+    partial_path = os.path.join(upload_dir, PARTIAL_PREFIX + uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    inline = []
+    chunk_size = UPLOAD_CHUNK_KB * 1024
+    out = await asyncio.to_thread(open, partial_path, "wb")
+    try:
+        with stage("save_file"):
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                if inline is not None and size <= UPLOAD_INLINE_KB * 1024:
+                    inline.append(chunk)
+                else:
+                    inline = None
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(_discard, out, partial_path)
+        raise
+    await asyncio.to_thread(out.close)
+
+    sha256 = digest.hexdigest()
+    name = upload_name(sha256, file.filename)
+    path = os.path.join(upload_dir, name)
+    await asyncio.to_thread(_finalize, partial_path, path)
+    data = b"".join(inline) if inline is not None else None
+    return SavedUpload(path, f"/temp_uploads/{name}", sha256, size, data)
+
+
+class UploadSweeper:
+    """Thread latar yang membatasi umur dan total ukuran upload_dir."""
+
+    def __init__(self, upload_dir: str = None, max_age_s: float = UPLOAD_MAX_AGE_S,
+                 max_bytes: int = int(UPLOAD_DIR_MAX_MB * 1024 * 1024), min_age_s: float = UPLOAD_MIN_AGE_S,
+                 interval_s: float = UPLOAD_SWEEP_S):
+        self.upload_dir = upload_dir or UPLOAD_DIR
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self.min_age_s = min_age_s
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = 0
+        self._bytes = 0
+        self._removed = 0
+        self._removed_bytes = 0
+        self._sweeps = 0
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except OSError as exc:
+                logger.warning("sweep upload gagal", extra={"error": str(exc)})
+            if self._stop.wait(self.interval_s):
+                break
+
+    # -- sweep -------------------------------------------------------------
+    def sweep(self, now: float = None) -> int:
+        """Hapus file kedaluwarsa, lalu yang terlama sampai di bawah batas ukuran. Return jumlah dihapus."""
+        now = time.time() if now is None else now
+        entries = []
+        with os.scandir(self.upload_dir) as it:
+            for entry in it:
+                # File tersembunyi (mis. .gitkeep) dibiarkan, kecuali sisa upload yang gagal
+                if entry.name.startswith(".") and not entry.name.startswith(PARTIAL_PREFIX):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = removed_bytes = 0
+        kept = 0
+        for mtime, size, path in entries:
+            age = now - mtime
+            if age < self.min_age_s:
+                kept += 1
+                continue
+            # Terurut dari yang terlama: hapus selama kedaluwarsa atau total masih di atas batas
+            if age <= self.max_age_s and total <= self.max_bytes:
+                kept += 1
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Sudah dihapus proses lain (beberapa proses web berbagi direktori)
+                pass
+            total -= size
+            removed += 1
+            removed_bytes += size
+        with self._lock:
+            self._files = kept
+            self._bytes = total
+            self._removed += removed
+            self._removed_bytes += removed_bytes
+            self._sweeps += 1
+        if removed:
+            logger.info("upload lama dihapus", extra={"files": removed, "bytes": removed_bytes})
+        return removed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "files": self._files,
+                "bytes": self._bytes,
+                "removed": self._removed,
+                "removed_bytes": self._removed_bytes,
+                "sweeps": self._sweeps,
+            }